@@ -0,0 +1,91 @@
+# Concurrent-request throughput against a running server.
+#
+# Seeds a workspace through the API, then runs --concurrency clients for
+# --duration seconds. Each request is a point read (GET /blocks/{id}) or,
+# with probability --tree-ratio, a full tree fetch of the seeded workspace.
+# While a handler blocks the event loop every other request waits, which
+# shows up in the point-read tail latency.
+#
+#     cd src && uvicorn app:app --port 8000
+#     python benchmarks/concurrent_requests.py --url http://localhost:8000
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import httpx
+
+
+async def seed(client: httpx.AsyncClient, blocks: int, fanout: int):
+    workspace = (await client.post("/workspaces/", json={"name": "benchmark"})).json()
+
+    def subtree(size: int):
+        children = []
+        remaining = size - 1
+        while remaining > 0:
+            child_size = min(remaining, max(1, size // fanout))
+            children.append(subtree(child_size))
+            remaining -= child_size
+        return {"type": "text", "properties": {"text": "benchmark"}, "content": children}
+
+    response = await client.post(
+        "/blocks/import",
+        json={"workspace_id": workspace["id"], "blocks": [subtree(blocks)]},
+        timeout=None
+    )
+    response.raise_for_status()
+
+    rows = (await client.get(f"/blocks/{workspace['id']}/tree", params={"format": "ndjson"})).text
+    ids = [json.loads(line)["id"] for line in rows.splitlines()]
+    return workspace["id"], ids
+
+
+async def worker(client, deadline, workspace_id, ids, tree_ratio, latencies):
+    while time.perf_counter() < deadline:
+        tree = random.random() < tree_ratio
+        url = f"/blocks/{workspace_id}/tree" if tree else f"/blocks/{random.choice(ids)}"
+        started = time.perf_counter()
+        response = await client.get(url, timeout=None)
+        response.raise_for_status()
+        latencies["tree" if tree else "point"].append(time.perf_counter() - started)
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else (values or [0])[0]
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits) as client:
+        workspace_id, ids = await seed(client, args.blocks, args.fanout)
+
+        latencies = {"point": [], "tree": []}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            worker(client, deadline, workspace_id, ids, args.tree_ratio, latencies)
+            for _ in range(args.concurrency)
+        ))
+
+    total = len(latencies["point"]) + len(latencies["tree"])
+    print(f"requests      {total} in {args.duration:.0f}s ({total / args.duration:.1f} req/s)")
+    for kind, values in latencies.items():
+        if values:
+            print(
+                f"{kind:<13} n={len(values):<6} "
+                f"p50={percentile(values, 50) * 1000:.1f}ms "
+                f"p99={percentile(values, 99) * 1000:.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--blocks", type=int, default=5000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--tree-ratio", type=float, default=0.05)
+    main_args = parser.parse_args()
+    asyncio.run(main(main_args))
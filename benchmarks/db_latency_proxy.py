@@ -0,0 +1,42 @@
+# TCP proxy that delays every chunk it forwards, to give a local database
+# the round-trip time of a networked one. Point the server at the proxy:
+#
+#     python benchmarks/db_latency_proxy.py --port 6432 --target localhost:5432 --delay-ms 1
+#     cd src && POSTGRES_DB_HOST=localhost POSTGRES_DB_PORT=6432 uvicorn app:app
+import argparse
+import asyncio
+
+
+async def forward(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float):
+    try:
+        while data := await reader.read(65536):
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def main(args):
+    host, port = args.target.rsplit(":", 1)
+    delay = args.delay_ms / 1000 / 2
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(host, int(port))
+        await asyncio.gather(
+            forward(client_reader, server_writer, delay),
+            forward(server_reader, client_writer, delay),
+            return_exceptions=True
+        )
+
+    server = await asyncio.start_server(handle, "127.0.0.1", args.port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=6432)
+    parser.add_argument("--target", default="localhost:5432")
+    parser.add_argument("--delay-ms", type=float, default=1.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+# Micro-benchmark of server-side prepared statements on the hot block reads.
+#
+# Seeds a parent with --children children, then times --iterations calls of
+# get_block and get_block_children with prepared statements on and off. Each
+# call runs in its own unit of work on a single-connection pool, the way a
+# request would. Reads the same POSTGRES_DB_* settings as the server; run it
+# through the database latency proxy to see the gain at a realistic RTT.
+#
+#     PYTHONPATH=src python benchmarks/prepared_statements.py
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from repositories.async_block_repository import AsyncBlockRepository
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
+
+from utils.config import config
+from utils.psycopg import PREPARE_THRESHOLD
+
+
+def connection_pool(prepare: bool) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        make_conninfo(
+            host=config.postgres_db_host,
+            port=config.postgres_db_port,
+            dbname=config.postgres_db_name,
+            user=config.postgres_db_username,
+            password=config.postgres_db_password
+        ),
+        min_size=1,
+        max_size=1,
+        kwargs={"prepare_threshold": PREPARE_THRESHOLD if prepare else None},
+        open=False
+    )
+
+
+async def seed(pool: AsyncConnectionPool, children: int):
+    unit_of_work = AsyncUnitOfWork(pool)
+    workspace = await AsyncWorkspaceRepository(unit_of_work).create("benchmark")
+    parent_id = uuid.uuid4()
+    rows = [(parent_id, None, 0, "page", {"title": "benchmark"})] + [
+        (uuid.uuid4(), parent_id, position, "text", {"text": f"child {position}"})
+        for position in range(children)
+    ]
+    await AsyncBlockRepository(unit_of_work).import_blocks(workspace["id"], rows)
+    await unit_of_work.commit()
+    await unit_of_work.close()
+    return workspace["id"], parent_id, rows[-1][0]
+
+
+async def measure(pool: AsyncConnectionPool, prepare: bool, call: str, block_id: uuid.UUID, iterations: int):
+    timings = []
+    for _ in range(iterations):
+        unit_of_work = AsyncUnitOfWork(pool, prepare=prepare)
+        started = time.perf_counter()
+        await getattr(AsyncBlockRepository(unit_of_work), call)(block_id)
+        await unit_of_work.commit()
+        timings.append(time.perf_counter() - started)
+        await unit_of_work.close()
+    return timings
+
+
+async def main(args):
+    async with connection_pool(True) as prepared_pool, connection_pool(False) as plain_pool:
+        workspace_id, parent_id, child_id = await seed(prepared_pool, args.children)
+        try:
+            for call, block_id in (("get_block", child_id), ("get_block_children", parent_id)):
+                results = {}
+                for prepare, pool in ((False, plain_pool), (True, prepared_pool)):
+                    await measure(pool, prepare, call, block_id, args.warmup)
+                    timings = await measure(pool, prepare, call, block_id, args.iterations)
+                    results[prepare] = statistics.mean(timings)
+                    print(
+                        f"{call:<20} {'prepared' if prepare else 'unprepared':<11} "
+                        f"mean={results[prepare] * 1000:.3f}ms "
+                        f"p50={statistics.median(timings) * 1000:.3f}ms"
+                    )
+                print(f"{call:<20} speedup     {results[False] / results[True]:.2f}x")
+        finally:
+            unit_of_work = AsyncUnitOfWork(prepared_pool)
+            await AsyncWorkspaceRepository(unit_of_work).delete(workspace_id)
+            await unit_of_work.commit()
+            await unit_of_work.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--children", type=int, default=50)
+    main_args = parser.parse_args()
+    asyncio.run(main(main_args))
@@ -0,0 +1,326 @@
+# Plan regression check for the hot repository queries.
+#
+# Seeds --workspaces workspaces of --blocks blocks each (with a share of
+# deleted blocks and workspaces), analyzes the tables, then calls the
+# repository read and write paths through a unit of work whose cursor
+# EXPLAINs every statement before running it, so the queries checked are
+# always the ones the server runs. Fails when a statement scans blocks,
+# workspaces or workspace_changes sequentially, or when the plans of a
+# call leave out an index EXPECTED_INDEXES lists for it. Everything
+# happens in one transaction that is rolled back, so the database is left
+# as it was.
+# Reads the same POSTGRES_DB_* settings as the server and needs the
+# migrations applied. tests/test_query_plans.py runs it at a smaller size.
+#
+#     PYTHONPATH=src python benchmarks/query_plans.py
+#
+# iter_all and iter_blocks_tree stream from a connection of their own,
+# which cannot see the uncommitted seed, so they are not covered.
+import argparse
+import asyncio
+import json
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Set, Tuple
+
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from repositories.async_block_repository import AsyncBlockRepository
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
+
+from utils.config import config
+from utils.ranking import REBALANCED_RANK_WIDTH
+
+
+CHECKED_TABLES = {"blocks", "workspaces", "workspace_changes"}
+INDEX_SCANS = {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+# Indexes the plans of each call must use between them; "a|b" accepts
+# either. Filtering one workspace's blocks uses whichever of its two
+# indexes the planner prefers at the seeded size.
+WORKSPACE_BLOCKS = "idx_blocks_live_workspace_created|idx_blocks_workspace_id"
+EXPECTED_INDEXES = {
+    "get_all": ["idx_blocks_live_created", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_block": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_all after": ["idx_blocks_live_created", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_all workspace": [WORKSPACE_BLOCKS, "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_all type": ["idx_blocks_live_type_created", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_block_children": ["idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_block_with_content": ["blocks_pkey", "idx_blocks_parent_rank", "idx_blocks_workspace_id", "workspaces_pkey"],
+    "get_block_ancestors": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "get_blocks_tree": [WORKSPACE_BLOCKS, "workspaces_pkey"],
+    "get_blocks_tree limited": [
+        "idx_blocks_live_roots", "idx_blocks_parent_rank", "idx_blocks_workspace_id", "workspaces_pkey"
+    ],
+    "get_blocks_tree_body": [WORKSPACE_BLOCKS, "workspaces_pkey"],
+    "get_tree_version": ["workspaces_pkey"],
+    "get_block_tree_version": ["blocks_pkey", "workspaces_pkey"],
+    "workspace get_by_id": ["workspaces_pkey"],
+    "workspace get_changes": ["workspace_changes_pkey", "workspaces_pkey"],
+    "workspace get_changes page": ["workspace_changes_pkey", "workspaces_pkey"],
+    "reap_deleted": ["idx_workspaces_unreaped", "idx_blocks_workspace_id", "idx_blocks_parent_rank", "blocks_pkey"],
+    "append_block_child": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "update_block": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "move_block": ["blocks_pkey", "idx_blocks_parent_rank", "idx_blocks_path", "workspaces_pkey"],
+    "batch create": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "batch update": ["blocks_pkey", "idx_blocks_parent_rank", "workspaces_pkey"],
+    "batch move": ["blocks_pkey", "idx_blocks_parent_rank", "idx_blocks_path", "workspaces_pkey"],
+    "batch delete": ["blocks_pkey", "idx_blocks_path", "workspaces_pkey"],
+    "delete_block": ["blocks_pkey", "idx_blocks_path", "workspaces_pkey"],
+    "commit": ["workspaces_pkey"],
+    "workspace delete": ["workspaces_pkey"],
+}
+
+
+class ExplainingCursor:
+    def __init__(self, cursor, plans: List[Tuple[str, str, Dict[str, Any]]], label: str):
+        self._cursor = cursor
+        self._plans = plans
+        self._label = label
+
+    async def _explain(self, query, params) -> None:
+        if str(query).lstrip().upper().startswith(EXPLAINED):
+            await self._cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+            plan = (await self._cursor.fetchone())["QUERY PLAN"][0]["Plan"]
+            self._plans.append((self._label, " ".join(str(query).split()), plan))
+
+    async def execute(self, query, params=None, **kwargs):
+        await self._explain(query, params)
+        return await self._cursor.execute(query, params, **kwargs)
+
+    # Every row runs the same statement, so the first row's plan stands
+    # for all of them.
+    async def executemany(self, query, params_seq, **kwargs):
+        params_seq = list(params_seq)
+        if params_seq:
+            await self._explain(query, params_seq[0])
+        return await self._cursor.executemany(query, params_seq, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Runs everything on one connection and in one transaction, recording the
+# plan of each statement under the label of the call that issued it.
+class ExplainingUnitOfWork(AsyncUnitOfWork):
+    def __init__(self, pool: AsyncConnectionPool):
+        super().__init__(pool, prepare=False)
+        self.plans: List[Tuple[str, str, Dict[str, Any]]] = []
+        self.label = ""
+
+    @asynccontextmanager
+    async def cursor(self, row_factory=dict_row):
+        async with super().cursor(row_factory=row_factory) as cursor:
+            yield ExplainingCursor(cursor, self.plans, self.label)
+
+    # Runs the hooks a commit runs first, which publish the tree changes,
+    # but leaves the transaction open for run() to roll back.
+    async def commit(self) -> None:
+        callbacks, self._before_commit = self._before_commit, []
+        for callback in callbacks:
+            await callback()
+
+
+def conninfo() -> str:
+    return make_conninfo(
+        host=config.postgres_db_host,
+        port=config.postgres_db_port,
+        dbname=config.postgres_db_name,
+        user=config.postgres_db_username,
+        password=config.postgres_db_password
+    )
+
+
+def connection_pool() -> AsyncConnectionPool:
+    return AsyncConnectionPool(conninfo(), min_size=1, max_size=1, open=False)
+
+
+def rank(position: int) -> str:
+    return str(position + 1).rjust(REBALANCED_RANK_WIDTH, "0").rstrip("0")
+
+
+# Each workspace is a few roots with `fanout` children per block, level by
+# level, so trees are several levels deep.
+async def seed(connection, workspaces: int, blocks: int, fanout: int) -> Dict[str, Any]:
+    started = datetime.now() - timedelta(days=30)
+    workspace_rows, block_rows, change_rows = [], [], []
+    sample: Dict[str, Any] = {}
+    for w in range(workspaces):
+        workspace_id = uuid.uuid4()
+        deleted_workspace = started + timedelta(days=1) if w % 20 == 19 else None
+        workspace_rows.append((workspace_id, f"workspace {w}", started + timedelta(minutes=w), deleted_workspace, 10))
+        change_rows.extend((workspace_id, version, 0, "upsert", "{}") for version in range(1, 11))
+
+        ids, paths, children = [], [], {}
+        for b in range(blocks):
+            block_id = uuid.uuid4()
+            parent = (b - 3) // fanout if b >= 3 else None
+            path = (paths[parent] if parent is not None else []) + [block_id]
+            deleted = started + timedelta(days=2) if b % 10 == 9 else None
+            parent_id, sibling_rank = None, None
+            if parent is not None:
+                position = children.get(parent, 0)
+                children[parent] = position + 1
+                parent_id, sibling_rank = ids[parent], rank(position)
+            block_rows.append((
+                block_id, "text" if b % 4 else "page", json.dumps({"text": f"block {b}"}), workspace_id,
+                parent_id, sibling_rank, started + timedelta(minutes=w, seconds=b), deleted, path
+            ))
+            ids.append(block_id)
+            paths.append(path)
+
+        if w == workspaces // 2:
+            sample = {
+                "workspace_id": workspace_id, "root_id": ids[0], "leaf_id": ids[-2], "parent_id": ids[1],
+                "leaf_ids": [block_id for b, block_id in enumerate(ids) if b % 10 != 9][-10:-2],
+            }
+
+    async with connection.cursor() as cursor:
+        async with cursor.copy(
+            "COPY workspaces (id, name, created_at, deleted_at, tree_version) FROM STDIN"
+        ) as copy:
+            for row in workspace_rows:
+                await copy.write_row(row)
+        async with cursor.copy(
+            "COPY blocks (id, type, properties, workspace_id, parent_id, rank, created_at, deleted_at, path) FROM STDIN"
+        ) as copy:
+            for row in block_rows:
+                await copy.write_row(row)
+        async with cursor.copy(
+            "COPY workspace_changes (workspace_id, version, seq, op, data) FROM STDIN"
+        ) as copy:
+            for row in change_rows:
+                await copy.write_row(row)
+        for table in sorted(CHECKED_TABLES):
+            await cursor.execute(f"ANALYZE {table}")
+    return sample
+
+
+def scans(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+async def explain_calls(unit_of_work: ExplainingUnitOfWork, sample: Dict[str, Any]) -> None:
+    blocks = AsyncBlockRepository(unit_of_work)
+    workspaces = AsyncWorkspaceRepository(unit_of_work)
+    workspace_id, root_id, leaf_id, parent_id = (
+        sample["workspace_id"], sample["root_id"], sample["leaf_id"], sample["parent_id"]
+    )
+    unit_of_work.label = "get_all"
+    page = await blocks.get_all(limit=100)
+    after = (page[-1]["created_at"], page[-1]["id"])
+
+    calls = [
+        ("get_block", lambda: blocks.get_block(leaf_id)),
+        ("get_all after", lambda: blocks.get_all(limit=100, after=after)),
+        ("get_all workspace", lambda: blocks.get_all(limit=100, workspace_id=workspace_id)),
+        ("get_all type", lambda: blocks.get_all(limit=100, block_type="page")),
+        ("get_block_children", lambda: blocks.get_block_children(parent_id)),
+        ("get_block_with_content", lambda: blocks.get_block_with_content(root_id, depth=3, max_children=10)),
+        ("get_block_ancestors", lambda: blocks.get_block_ancestors(leaf_id)),
+        ("get_blocks_tree", lambda: blocks.get_blocks_tree(workspace_id)),
+        ("get_blocks_tree limited", lambda: blocks.get_blocks_tree(workspace_id, depth=2, max_children=10)),
+        ("get_blocks_tree_body", lambda: blocks.get_blocks_tree_body(workspace_id, 10)),
+        ("get_tree_version", lambda: blocks.get_tree_version(workspace_id)),
+        ("get_block_tree_version", lambda: blocks.get_block_tree_version(leaf_id)),
+        ("workspace get_by_id", lambda: workspaces.get_by_id(workspace_id)),
+        ("workspace get_changes", lambda: workspaces.get_changes(workspace_id, since=5, limit=100)),
+        ("workspace get_changes page", lambda: workspaces.get_changes(workspace_id, since=0, limit=3)),
+        ("reap_deleted", lambda: workspaces.reap_deleted(100)),
+    ]
+
+    # Writes come last, as they change the seed the reads rely on.
+    leaves = sample["leaf_ids"]
+    calls += [
+        ("append_block_child", lambda: blocks.append_block_child("text", {}, workspace_id, parent_id)),
+        ("update_block", lambda: blocks.update_block(leaves[0], {"text": "updated"})),
+        ("move_block", lambda: blocks.move_block(leaves[1], parent_id, 0)),
+        ("batch create", lambda: blocks.apply_batch([
+            ("create", uuid.uuid4(), {"type": "page", "properties": {}, "workspace_id": workspace_id}),
+            ("create", uuid.uuid4(), {"type": "text", "properties": {}, "workspace_id": workspace_id,
+                                      "parent_id": parent_id, "position": 1}),
+        ])),
+        ("batch update", lambda: blocks.apply_batch([
+            ("update", leaves[2], {"properties": {"text": "a"}}),
+            ("update", leaves[3], {"properties": {"text": "b"}}),
+        ])),
+        ("batch move", lambda: blocks.apply_batch([
+            ("move", leaves[4], {"parent_id": parent_id, "position": 0}),
+            ("move", leaves[5], {"parent_id": root_id, "position": 1}),
+        ])),
+        ("batch delete", lambda: blocks.apply_batch([("delete", leaves[6], {}), ("delete", leaves[7], {})])),
+        ("delete_block", lambda: blocks.delete_block(leaf_id)),
+        ("commit", unit_of_work.commit),
+        ("workspace delete", lambda: workspaces.delete(workspace_id)),
+    ]
+    for label, call in calls:
+        unit_of_work.label = label
+        await call()
+
+
+def check(plans: List[Tuple[str, str, Dict[str, Any]]], verbose: bool) -> List[str]:
+    failures = []
+    used: Dict[str, Set[str]] = {label: set() for label in EXPECTED_INDEXES}
+    for label, query, plan in plans:
+        nodes = list(scans(plan))
+        sequential = sorted({
+            node["Relation Name"] for node in nodes
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in CHECKED_TABLES
+        })
+        indexes = sorted({node["Index Name"] for node in nodes if node["Node Type"] in INDEX_SCANS})
+        status = "FAIL" if sequential else "ok"
+        print(f"{status:<5} {label:<24} {', '.join(indexes) or '-'}")
+        if sequential:
+            failures.append(f"{label}: sequential scan of {', '.join(sequential)}")
+            if verbose:
+                print(f"      {query}")
+        used.setdefault(label, set()).update(indexes)
+
+    for label, indexes in used.items():
+        if label not in EXPECTED_INDEXES:
+            failures.append(f"{label}: no expected indexes recorded")
+            continue
+        missing = [
+            expected for expected in EXPECTED_INDEXES[label]
+            if not indexes & set(expected.split("|"))
+        ]
+        if missing:
+            failures.append(f"{label}: plans do not use {', '.join(missing)}")
+    return failures
+
+
+async def run(workspaces: int, blocks: int, fanout: int, verbose: bool = False) -> List[str]:
+    async with connection_pool() as pool:
+        unit_of_work = ExplainingUnitOfWork(pool)
+        try:
+            sample = await seed(await unit_of_work.connection(), workspaces, blocks, fanout)
+            await explain_calls(unit_of_work, sample)
+            return check(unit_of_work.plans, verbose)
+        finally:
+            await unit_of_work.rollback()
+            await unit_of_work.close()
+
+
+async def main(args) -> int:
+    failures = await run(args.workspaces, args.blocks, args.fanout, args.verbose)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workspaces", type=int, default=2000)
+    parser.add_argument("--blocks", type=int, default=100)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--verbose", action="store_true")
+    main_args = parser.parse_args()
+    sys.exit(asyncio.run(main(main_args)))
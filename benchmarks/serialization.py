@@ -0,0 +1,95 @@
+# Micro-benchmark of block response serialization.
+#
+# Builds rows shaped like the repositories' output, then encodes a children
+# list of --children blocks and a content tree --depth levels deep with
+# --fanout children per block, both the old way (pydantic models encoded
+# by Litestar's serializer) and through utils.block_json. Checks that both
+# produce the same bytes. Needs no database.
+#
+#     PYTHONPATH=src python benchmarks/serialization.py
+import argparse
+import statistics
+import time
+import uuid
+from datetime import datetime
+
+from litestar.plugins.pydantic import PydanticInitPlugin
+from litestar.serialization import encode_json, get_serializer
+
+from models.block import BlockContentResponse, BlockResponse
+from utils.block_json import encode_block_tree, encode_blocks
+
+
+serializer = get_serializer(PydanticInitPlugin.encoders())
+
+
+def block_row(workspace_id: uuid.UUID, parent_id: uuid.UUID, position: int):
+    return {
+        "id": uuid.uuid4(),
+        "type": "text",
+        "properties": {"text": f"Paragraph {position} with some ünïcode", "checked": position % 2 == 0, "weight": 0.5},
+        "workspace_id": workspace_id,
+        "parent_id": parent_id,
+        "position": position,
+        "version": 3,
+        "created_at": datetime.now(),
+        "updated_at": datetime.now(),
+    }
+
+
+def content_tree(workspace_id: uuid.UUID, depth: int, fanout: int, parent_id=None, position: int = 0):
+    node = block_row(workspace_id, parent_id, position)
+    node["content"] = [
+        content_tree(workspace_id, depth - 1, fanout, node["id"], index)
+        for index in range(fanout)
+    ] if depth > 0 else []
+    node["has_more"] = False
+    node["next_cursor"] = None
+    return node
+
+
+def measure(encode, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        encode()
+        timings.append(time.perf_counter() - started)
+    return statistics.mean(timings)
+
+
+def compare(name, old, new, iterations):
+    if old() != new():
+        raise SystemExit(f"{name}: encodings differ")
+    old_mean = measure(old, iterations)
+    new_mean = measure(new, iterations)
+    print(f"{name:<10} pydantic={old_mean * 1000:.3f}ms struct={new_mean * 1000:.3f}ms speedup={old_mean / new_mean:.1f}x")
+
+
+def main(args):
+    workspace_id = uuid.uuid4()
+    parent_id = uuid.uuid4()
+    children = [block_row(workspace_id, parent_id, position) for position in range(args.children)]
+    tree = content_tree(workspace_id, args.depth, args.fanout)
+
+    compare(
+        "children",
+        lambda: encode_json([BlockResponse.parse_obj(child) for child in children], serializer=serializer),
+        lambda: encode_blocks(children),
+        args.iterations
+    )
+    compare(
+        "content",
+        lambda: encode_json(BlockContentResponse.parse_obj(tree), serializer=serializer),
+        lambda: encode_block_tree(tree),
+        args.iterations
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--children", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=10)
+    main_args = parser.parse_args()
+    main(main_args)
@@ -0,0 +1,70 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '4844dd6e2c18'
+down_revision: Union[str, None] = '5dac43674354'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'block_content_association',
+        sa.Column('rank', sa.String(collation='C'), nullable=True)
+    )
+
+    # Evenly spaced keys in the existing order; must match
+    # REBALANCED_RANK_WIDTH in utils/ranking.py.
+    op.execute(
+        """
+        UPDATE block_content_association bca
+        SET rank = ordered.rank
+        FROM (
+            SELECT parent_block_id, child_block_id,
+                   rtrim(lpad(ROW_NUMBER() OVER (
+                       PARTITION BY parent_block_id
+                       ORDER BY position, child_block_id
+                   )::text, 10, '0'), '0') AS rank
+            FROM block_content_association
+        ) ordered
+        WHERE bca.parent_block_id = ordered.parent_block_id
+        AND bca.child_block_id = ordered.child_block_id
+        """
+    )
+
+    op.alter_column('block_content_association', 'rank', nullable=False)
+
+    op.drop_index('idx_block_content_position', table_name='block_content_association')
+    op.drop_column('block_content_association', 'position')
+    op.create_index('idx_block_content_parent_rank', 'block_content_association', ['parent_block_id', 'rank'])
+
+
+def downgrade() -> None:
+    op.add_column(
+        'block_content_association',
+        sa.Column('position', sa.Integer, nullable=False, server_default='0')
+    )
+
+    op.execute(
+        """
+        UPDATE block_content_association bca
+        SET position = ordered.position
+        FROM (
+            SELECT parent_block_id, child_block_id,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY parent_block_id
+                       ORDER BY rank, child_block_id
+                   ) - 1 AS position
+            FROM block_content_association
+        ) ordered
+        WHERE bca.parent_block_id = ordered.parent_block_id
+        AND bca.child_block_id = ordered.child_block_id
+        """
+    )
+
+    op.drop_index('idx_block_content_parent_rank', table_name='block_content_association')
+    op.drop_column('block_content_association', 'rank')
+    op.create_index('idx_block_content_position', 'block_content_association', ['position'])
@@ -0,0 +1,47 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
+
+
+revision: str = 'aa3a768e74f9'
+down_revision: Union[str, None] = '4844dd6e2c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('blocks', sa.Column('path', ARRAY(UUID(as_uuid=True)), nullable=True))
+
+    op.execute(
+        """
+        WITH RECURSIVE paths AS (
+            SELECT b.id, ARRAY[b.id] AS path
+            FROM blocks b
+            WHERE NOT EXISTS (
+                SELECT 1 FROM block_content_association bca
+                WHERE bca.child_block_id = b.id
+            )
+            UNION ALL
+            SELECT bca.child_block_id, p.path || bca.child_block_id
+            FROM paths p
+            JOIN block_content_association bca ON bca.parent_block_id = p.id
+        )
+        UPDATE blocks b
+        SET path = paths.path
+        FROM paths
+        WHERE b.id = paths.id
+        """
+    )
+
+    # Blocks caught in a parent cycle are unreachable from any root.
+    op.execute("UPDATE blocks SET path = ARRAY[id] WHERE path IS NULL")
+
+    op.alter_column('blocks', 'path', nullable=False)
+    op.create_index('idx_blocks_path', 'blocks', ['path'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('idx_blocks_path', table_name='blocks')
+    op.drop_column('blocks', 'path')
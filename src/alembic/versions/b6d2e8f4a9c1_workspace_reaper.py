@@ -0,0 +1,32 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'b6d2e8f4a9c1'
+down_revision: Union[str, None] = 'f4a8c61e3d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Set once every block of a deleted workspace has been purged.
+    op.add_column('workspaces', sa.Column('reaped_at', sa.DateTime, nullable=True))
+    # Workspaces deleted before this revision had their blocks marked in
+    # the deleting transaction; those rows are left as they are.
+    op.execute("UPDATE workspaces SET reaped_at = deleted_at WHERE deleted_at IS NOT NULL")
+
+
+def downgrade() -> None:
+    # Blocks of workspaces still waiting to be reaped are marked the way
+    # deletion used to do it.
+    op.execute(
+        """
+        UPDATE blocks b SET deleted_at = w.deleted_at
+        FROM workspaces w
+        WHERE w.id = b.workspace_id AND w.deleted_at IS NOT NULL
+        AND w.reaped_at IS NULL AND b.deleted_at IS NULL
+        """
+    )
+    op.drop_column('workspaces', 'reaped_at')
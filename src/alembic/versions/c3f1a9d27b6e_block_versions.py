@@ -0,0 +1,21 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c3f1a9d27b6e'
+down_revision: Union[str, None] = 'aa3a768e74f9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'blocks',
+        sa.Column('version', sa.Integer, nullable=False, server_default='1')
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('blocks', 'version')
@@ -0,0 +1,64 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c8e5f1a7b3d2'
+down_revision: Union[str, None] = 'b6d2e8f4a9c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, partial index predicate), each shaped after the
+# queries in the repositories; benchmarks/query_plans.py checks they are
+# used.
+INDEXES = [
+    # Children and sibling positions: parent_block_id = ? ORDER BY rank,
+    # child_block_id, and the (rank, child_block_id) < (...) counts.
+    ('idx_block_content_parent_rank_child', 'block_content_association',
+     ['parent_block_id', 'rank', 'child_block_id'], None),
+    # Block listings, newest first, with the cursor on (created_at, id).
+    ('idx_blocks_live_created', 'blocks', ['created_at', 'id'], 'deleted_at IS NULL'),
+    ('idx_blocks_live_workspace_created', 'blocks', ['workspace_id', 'created_at', 'id'], 'deleted_at IS NULL'),
+    ('idx_blocks_live_type_created', 'blocks', ['type', 'created_at', 'id'], 'deleted_at IS NULL'),
+    # Workspace list, and the reaper's queue of deleted workspaces.
+    ('idx_workspaces_live_created', 'workspaces', ['created_at'], 'deleted_at IS NULL'),
+    ('idx_workspaces_unreaped', 'workspaces', ['deleted_at'], 'deleted_at IS NOT NULL AND reaped_at IS NULL'),
+]
+
+# Covered by the pkey (parent_block_id, child_block_id) and the index
+# above, and by idx_blocks_live_type_created; only read with a live filter.
+REPLACED = [
+    ('idx_block_content_parent', 'block_content_association', ['parent_block_id']),
+    ('idx_block_content_parent_rank', 'block_content_association', ['parent_block_id', 'rank']),
+    ('idx_blocks_type', 'blocks', ['type']),
+]
+
+
+# Built without locking writes out, which CREATE INDEX CONCURRENTLY cannot
+# do inside a transaction. A failed concurrent build leaves an invalid
+# index behind, so a rerun drops any index of the same name first.
+def _create(name: str, table: str, columns, where) -> None:
+    op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    op.create_index(
+        name, table, columns,
+        postgresql_concurrently=True,
+        postgresql_where=sa.text(where) if where else None
+    )
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            _create(name, table, columns, where)
+        for name, table, _ in REPLACED:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in REPLACED:
+            _create(name, table, columns, None)
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,145 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+revision: str = 'd9f3a6b2c4e8'
+down_revision: Union[str, None] = 'c8e5f1a7b3d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BATCH_SIZE = 10000
+
+# (name, columns, partial index predicate) on blocks.
+INDEXES = [
+    # Children and sibling positions: parent_id = ? ORDER BY rank, id, and
+    # the (rank, id) < (...) counts. Also serves the parent foreign key.
+    ('idx_blocks_parent_rank', ['parent_id', 'rank', 'id'], 'parent_id IS NOT NULL'),
+    # Roots of a workspace, which used to be an anti-join on the links.
+    ('idx_blocks_live_roots', ['workspace_id', 'created_at', 'id'], 'parent_id IS NULL AND deleted_at IS NULL'),
+]
+
+# Kept for readers of the old table until it is dropped for good. Writes
+# through it would reach blocks, and a DELETE would remove the block, so
+# it refuses them.
+CREATE_VIEW = """
+    CREATE VIEW block_content_association AS
+    SELECT parent_id AS parent_block_id, id AS child_block_id, rank
+    FROM blocks
+    WHERE parent_id IS NOT NULL
+"""
+
+CREATE_GUARD = """
+    CREATE FUNCTION block_content_association_read_only() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        RAISE EXCEPTION 'block_content_association is read-only; set blocks.parent_id and blocks.rank instead';
+    END
+    $$;
+    CREATE TRIGGER block_content_association_read_only
+    INSTEAD OF INSERT OR UPDATE OR DELETE ON block_content_association
+    FOR EACH ROW EXECUTE FUNCTION block_content_association_read_only();
+"""
+
+
+# One short transaction per batch, walking the links in child id order,
+# so the backfill never holds row locks on much of blocks at once.
+def _backfill() -> None:
+    connection = op.get_bind()
+    after = '00000000-0000-0000-0000-000000000000'
+    while after is not None:
+        after = connection.execute(
+            sa.text(
+                """
+                WITH batch AS (
+                    SELECT parent_block_id, child_block_id, rank
+                    FROM block_content_association
+                    WHERE child_block_id > CAST(:after AS uuid)
+                    ORDER BY child_block_id
+                    LIMIT :batch_size
+                ),
+                updated AS (
+                    UPDATE blocks b
+                    SET parent_id = batch.parent_block_id, rank = batch.rank
+                    FROM batch
+                    WHERE b.id = batch.child_block_id
+                )
+                SELECT child_block_id FROM batch
+                ORDER BY child_block_id DESC
+                LIMIT 1
+                """
+            ),
+            {"after": str(after), "batch_size": BATCH_SIZE}
+        ).scalar()
+
+
+def upgrade() -> None:
+    op.add_column('blocks', sa.Column('parent_id', UUID(as_uuid=True), nullable=True))
+    op.add_column('blocks', sa.Column('rank', sa.String(collation='C'), nullable=True))
+
+    with op.get_context().autocommit_block():
+        _backfill()
+        for name, columns, where in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            op.create_index(
+                name, 'blocks', columns,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where)
+            )
+
+    # Links written while the batches ran are caught up with writers
+    # locked out, then the table makes way for the view.
+    op.execute("LOCK TABLE block_content_association IN EXCLUSIVE MODE")
+    op.execute(
+        """
+        UPDATE blocks b
+        SET parent_id = bca.parent_block_id, rank = bca.rank
+        FROM block_content_association bca
+        WHERE b.id = bca.child_block_id
+        AND (b.parent_id IS DISTINCT FROM bca.parent_block_id OR b.rank IS DISTINCT FROM bca.rank)
+        """
+    )
+    op.drop_table('block_content_association')
+    op.execute(CREATE_VIEW)
+    op.execute(CREATE_GUARD)
+
+    # Validated separately, which only blocks schema changes.
+    op.create_foreign_key(
+        'blocks_parent_id_fkey', 'blocks', 'blocks', ['parent_id'], ['id'],
+        postgresql_not_valid=True
+    )
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE blocks VALIDATE CONSTRAINT blocks_parent_id_fkey")
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW block_content_association")
+    op.execute("DROP FUNCTION block_content_association_read_only()")
+
+    op.create_table(
+        'block_content_association',
+        sa.Column('parent_block_id', UUID(as_uuid=True), sa.ForeignKey('blocks.id'), primary_key=True),
+        sa.Column('child_block_id', UUID(as_uuid=True), sa.ForeignKey('blocks.id'), primary_key=True),
+        sa.Column('rank', sa.String(collation='C'), nullable=False)
+    )
+    op.execute(
+        """
+        INSERT INTO block_content_association (parent_block_id, child_block_id, rank)
+        SELECT parent_id, id, rank FROM blocks
+        WHERE parent_id IS NOT NULL
+        """
+    )
+    op.create_index('idx_block_content_child', 'block_content_association', ['child_block_id'])
+    op.create_index(
+        'idx_block_content_parent_rank_child', 'block_content_association',
+        ['parent_block_id', 'rank', 'child_block_id']
+    )
+
+    op.drop_constraint('blocks_parent_id_fkey', 'blocks', type_='foreignkey')
+    for name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name='blocks')
+    op.drop_column('blocks', 'rank')
+    op.drop_column('blocks', 'parent_id')
@@ -0,0 +1,21 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e7b2d4a19c05'
+down_revision: Union[str, None] = 'c3f1a9d27b6e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'workspaces',
+        sa.Column('tree_version', sa.BigInteger, nullable=False, server_default='0')
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('workspaces', 'tree_version')
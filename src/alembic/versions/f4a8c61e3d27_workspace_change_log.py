@@ -0,0 +1,38 @@
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+
+
+revision: str = 'f4a8c61e3d27'
+down_revision: Union[str, None] = 'e7b2d4a19c05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'workspace_changes',
+        sa.Column('workspace_id', UUID(as_uuid=True), sa.ForeignKey('workspaces.id'), nullable=False),
+        sa.Column('version', sa.BigInteger, nullable=False),
+        sa.Column('seq', sa.Integer, nullable=False),
+        sa.Column('op', sa.String(16), nullable=False),
+        sa.Column('data', JSONB, nullable=False),
+        sa.Column('created_at', sa.DateTime, nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint('workspace_id', 'version', 'seq')
+    )
+    op.create_index('idx_workspace_changes_created_at', 'workspace_changes', ['created_at'])
+
+    # Changes up to this version are no longer in the log.
+    op.add_column(
+        'workspaces',
+        sa.Column('changes_floor', sa.BigInteger, nullable=False, server_default='0')
+    )
+    op.execute("UPDATE workspaces SET changes_floor = tree_version")
+
+
+def downgrade() -> None:
+    op.drop_column('workspaces', 'changes_floor')
+    op.drop_index('idx_workspace_changes_created_at', table_name='workspace_changes')
+    op.drop_table('workspace_changes')
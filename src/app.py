@@ -2,9 +2,19 @@ from litestar import Litestar
 from litestar.di import Provide
 from litestar.config.cors import CORSConfig
 from litestar.middleware.logging import LoggingMiddlewareConfig
+from litestar.plugins.prometheus import PrometheusController
+from psycopg_pool import PoolTimeout, TooManyRequests
 
 from dependencies import get_services
 from dependencies import get_repositories
+from dependencies import get_unit_of_work
+from dependencies import invalidation_listener, start_invalidation_listener
+from dependencies import change_log_compaction, workspace_reaper
+
+from utils.admission import AdmissionControlMiddleware, pool_exhausted_handler
+from utils.config import config
+from utils.metrics import prometheus_config
+from utils.psycopg import async_db_manager
 
 from controllers.migration_controller import MigrationController
 from controllers.block_controller import BlockController
@@ -21,13 +31,29 @@ app = Litestar(
         MigrationController,
         BlockController,
         WorkspaceController,
-        S3Controller
+        S3Controller,
+        PrometheusController
     ],
     dependencies={
         "services": Provide(get_services, sync_to_thread=False),
+        "unit_of_work": Provide(get_unit_of_work),
         "repositories": Provide(get_repositories, sync_to_thread=False)
     },
-    middleware=[logging_middleware_config.middleware],
+    on_startup=[
+        async_db_manager.open_pool, start_invalidation_listener, change_log_compaction.start, workspace_reaper.start
+    ],
+    on_shutdown=[
+        workspace_reaper.stop, change_log_compaction.stop, invalidation_listener.stop, async_db_manager.close_pool
+    ],
+    middleware=[
+        prometheus_config.middleware,
+        AdmissionControlMiddleware(max_inflight=config.server_max_inflight_requests),
+        logging_middleware_config.middleware
+    ],
+    exception_handlers={
+        PoolTimeout: pool_exhausted_handler,
+        TooManyRequests: pool_exhausted_handler
+    },
     cors_config=cors_config, 
     debug=True
 )
@@ -1,13 +1,38 @@
 import uuid
-from typing import Any, Dict, List
+from collections import deque
+from functools import partial
+from typing import Any, Dict, List, Optional
 
-from litestar import Controller, get, post, put, delete, patch
+from litestar import Controller, MediaType, get, post, put, delete, patch
 from litestar.exceptions import NotFoundException, HTTPException
-from litestar.status_codes import HTTP_200_OK, HTTP_201_CREATED, HTTP_404_NOT_FOUND
+from litestar.params import Parameter
+from litestar.response import Response, Stream
+from litestar.status_codes import (
+    HTTP_200_OK, HTTP_201_CREATED, HTTP_304_NOT_MODIFIED, HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
+)
+from pydantic import ValidationError
 
 import models.block as block_models
 from repositories.base import Repositories
+from repositories.block_repository import VersionConflictError
+from repositories.async_unit_of_work import AsyncUnitOfWork
 from services.base import Services
+from utils.block_json import (
+    JSON, MEDIA_TYPES, MSGPACK, encode_block, encode_block_page, encode_block_tree, encode_blocks, encode_tree
+)
+from utils.compression import compressed
+from utils.etag import etag_matches, make_etag
+from utils.ndjson import NDJSON_MEDIA_TYPE, ndjson_chunks
+from utils.pagination import decode_child_cursor, decode_cursor, encode_cursor
+
+
+# Rejects a ?format= value the handler cannot produce; JSON is the default.
+def _check_format(output_format: Optional[str], *supported: str) -> None:
+    if output_format and output_format not in supported:
+        raise HTTPException(
+            status_code=HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported format {output_format}"
+        )
 
 
 class BlockController(Controller):
@@ -17,247 +42,314 @@ class BlockController(Controller):
     @post("/", status_code=HTTP_201_CREATED)
     async def append_block_child(
         self, data: block_models.BlockAppendChild, repositories: Repositories,
-    ) -> block_models.BlockResponse:
-        block = repositories.block.append_block_child(
+    ) -> Response[block_models.BlockResponse]:
+        block = await repositories.block.append_block_child(
             block_type=data.type,
             properties=data.properties,
             workspace_id=data.workspace_id,
             parent_id=data.parent_id
         )
-        return block_models.BlockResponse.parse_obj(block)
+        if not block:
+            raise NotFoundException(f"Workspace with ID {data.workspace_id} not found")
+        return Response(encode_block(block), media_type=MediaType.JSON)
     
     @get("/{block_id:uuid}", status_code=HTTP_200_OK)
     async def get_block(
         self, block_id: uuid.UUID, repositories: Repositories
-    ) -> block_models.BlockResponse:
-        block = repositories.block.get_block(block_id)
+    ) -> Response[block_models.BlockResponse]:
+        block = await repositories.block.get_block(block_id)
         if not block:
             raise NotFoundException(f"Block with ID {block_id} not found")
-        return block_models.BlockResponse.parse_obj(block)
+        return Response(encode_block(block), media_type=MediaType.JSON)
     
-    @get("/")
-    async def get_all_blocks(self, repositories: Repositories) -> List[Dict[str, Any]]:
-        return repositories.block.get_all()
+    @get("/", middleware=compressed)
+    async def get_all_blocks(
+        self,
+        repositories: Repositories,
+        limit: int = Parameter(default=100, ge=1, le=1000),
+        after: Optional[str] = None,
+        workspace_id: Optional[uuid.UUID] = None,
+        block_type: Optional[block_models.BlockTypeEnum] = Parameter(query="type", default=None),
+        output_format: Optional[str] = Parameter(query="format", default=None)
+    ) -> Response[block_models.BlockPage]:
+        _check_format(output_format, "ndjson", MSGPACK)
+        try:
+            cursor = decode_cursor(after) if after else None
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+
+        if output_format == "ndjson":
+            rows = repositories.block.iter_all(
+                after=cursor,
+                workspace_id=workspace_id,
+                block_type=block_type
+            )
+            return Stream(ndjson_chunks(rows), media_type=NDJSON_MEDIA_TYPE)
+
+        blocks = await repositories.block.get_all(
+            limit=limit,
+            after=cursor,
+            workspace_id=workspace_id,
+            block_type=block_type
+        )
+        next_after = None
+        if len(blocks) == limit:
+            next_after = encode_cursor(blocks[-1]["created_at"], blocks[-1]["id"])
+
+        output_format = output_format or JSON
+        return Response(encode_block_page(blocks, next_after, output_format), media_type=MEDIA_TYPES[output_format])
     
-    @get("/{block_id:uuid}/content", status_code=HTTP_200_OK)
+    @get("/{block_id:uuid}/content", status_code=HTTP_200_OK, middleware=compressed)
     async def get_block_with_content(
-        self, block_id: uuid.UUID, repositories: Repositories
-    ) -> block_models.BlockContentResponse:
-        block_with_content = repositories.block.get_block_with_content(block_id)
+        self,
+        block_id: uuid.UUID,
+        repositories: Repositories,
+        depth: int = Parameter(default=1, ge=1),
+        max_children: Optional[int] = Parameter(default=None, ge=1),
+        after: Optional[str] = None,
+        output_format: Optional[str] = Parameter(query="format", default=None),
+        if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None)
+    ) -> Response[block_models.BlockContentResponse]:
+        _check_format(output_format, MSGPACK)
+        try:
+            cursor = decode_child_cursor(after) if after else None
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+
+        # The content can only change along with its workspace's tree.
+        version = await repositories.block.get_block_tree_version(block_id)
+        if version is None:
+            raise NotFoundException(f"Block with ID {block_id} not found")
+        etag = make_etag("content", block_id, version, depth, max_children, after, output_format)
+        if etag_matches(if_none_match, etag):
+            return Response(None, status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        block_with_content = await repositories.block.get_block_with_content(
+            block_id,
+            depth=depth,
+            max_children=max_children,
+            after=cursor
+        )
         if not block_with_content:
             raise NotFoundException(f"Block with ID {block_id} not found")
-        return block_models.BlockContentResponse.parse_obj(block_with_content)
+        output_format = output_format or JSON
+        return Response(
+            encode_block_tree(block_with_content, output_format),
+            media_type=MEDIA_TYPES[output_format],
+            headers={"ETag": etag}
+        )
     
-    @get("/{block_id:uuid}/children", status_code=HTTP_200_OK)
+    @get("/{block_id:uuid}/children", status_code=HTTP_200_OK, middleware=compressed)
     async def get_block_children(
+        self,
+        block_id: uuid.UUID,
+        repositories: Repositories,
+        output_format: Optional[str] = Parameter(query="format", default=None)
+    ) -> Response[List[block_models.BlockResponse]]:
+        _check_format(output_format, MSGPACK)
+        children = await repositories.block.get_block_children(block_id)
+        output_format = output_format or JSON
+        return Response(encode_blocks(children, output_format), media_type=MEDIA_TYPES[output_format])
+    
+    @get("/{block_id:uuid}/ancestors", status_code=HTTP_200_OK)
+    async def get_block_ancestors(
         self, block_id: uuid.UUID, repositories: Repositories
-    ) -> List[block_models.BlockResponse]:
-        children = repositories.block.get_block_children(block_id)
-        return [block_models.BlockResponse.parse_obj(child) for child in children]
+    ) -> Response[List[block_models.BlockResponse]]:
+        ancestors = await repositories.block.get_block_ancestors(block_id)
+        if ancestors is None:
+            raise NotFoundException(f"Block with ID {block_id} not found")
+        return Response(encode_blocks(ancestors), media_type=MediaType.JSON)
     
     @put("/{block_id:uuid}", status_code=HTTP_200_OK)
     async def update_block(
         self, block_id: uuid.UUID, data: block_models.BlockUpdate, repositories: Repositories
-    ) -> block_models.BlockResponse:
-        block = repositories.block.update_block(
-            block_id=block_id,
-            properties=data.properties,
-            block_type=data.type
-        )
+    ) -> Response[block_models.BlockResponse]:
+        try:
+            block = await repositories.block.update_block(
+                block_id=block_id,
+                properties=data.properties,
+                block_type=data.type,
+                patches=[patch.dict() for patch in data.patches or []],
+                expected_version=data.expected_version
+            )
+        except VersionConflictError as e:
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail=str(e))
         if not block:
             raise NotFoundException(f"Block with ID {block_id} not found")
-        return block_models.BlockResponse.parse_obj(block)
+        return Response(encode_block(block), media_type=MediaType.JSON)
     
     @patch("/{block_id:uuid}/move", status_code=HTTP_200_OK)
     async def move_block(
         self, block_id: uuid.UUID, data: block_models.BlockMove, repositories: Repositories
-    ) -> block_models.BlockResponse:
-        block = repositories.block.move_block(
-            block_id=block_id,
-            new_parent_id=data.parent_id,
-            new_position=data.position
-        )
+    ) -> Response[block_models.BlockResponse]:
+        try:
+            block = await repositories.block.move_block(
+                block_id=block_id,
+                new_parent_id=data.parent_id,
+                new_position=data.position
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
         if not block:
             raise NotFoundException(f"Block with ID {block_id} not found")
-        return block_models.BlockResponse.parse_obj(block)
+        return Response(encode_block(block), media_type=MediaType.JSON)
     
     @delete("/{block_id:uuid}", status_code=HTTP_200_OK)
     async def delete_block(
         self, block_id: uuid.UUID,  repositories: Repositories
     ) -> Dict[str, Any]:
-        deleted = repositories.block.delete_block(block_id)
+        deleted = await repositories.block.delete_block(block_id)
         if not deleted:
             raise NotFoundException(f"Block with ID {block_id} not found")
         return {"success": True, "message": f"Block {block_id} deleted"}
 
-    @get("/{workspace_id:uuid}/tree", status_code=HTTP_200_OK)
-    async def get_blocks_tree(self, workspace_id: uuid.UUID, repositories: Repositories) -> List[Dict[str, Any]]:
-        workspace = repositories.workspace.get_by_id(workspace_id)
-        if not workspace:
+    @get("/{workspace_id:uuid}/tree", status_code=HTTP_200_OK, middleware=compressed)
+    async def get_blocks_tree(
+        self,
+        workspace_id: uuid.UUID,
+        repositories: Repositories,
+        depth: Optional[int] = Parameter(default=None, ge=1),
+        max_children: Optional[int] = Parameter(default=None, ge=1),
+        output_format: Optional[str] = Parameter(query="format", default=None),
+        if_none_match: Optional[str] = Parameter(header="If-None-Match", default=None)
+    ) -> Response[List[Dict[str, Any]]]:
+        _check_format(output_format, "ndjson", MSGPACK)
+
+        version = await repositories.block.get_tree_version(workspace_id)
+        if version is None:
             raise HTTPException(
                 status_code=HTTP_404_NOT_FOUND,
                 detail=f"Workspace with ID {workspace_id} not found"
             )
-        
-        tree = repositories.block.get_blocks_tree(workspace_id)
-        return tree
+        etag = make_etag("tree", workspace_id, version, depth, max_children, output_format)
+        if etag_matches(if_none_match, etag):
+            return Response(None, status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
 
-    @post("/batch", status_code=HTTP_200_OK)
-    async def batch_operations(
-        self, data: block_models.BatchOperationRequest, repositories: Repositories, services: Services
-    ) -> block_models.BatchOperationResponse:
-        operation_handlers = {
-            block_models.BatchOperationType.CREATE: self._handle_create_operation,
-            block_models.BatchOperationType.UPDATE: self._handle_update_operation,
-            block_models.BatchOperationType.MOVE: self._handle_move_operation,
-            block_models.BatchOperationType.DELETE: self._handle_delete_operation,
-        }
-        
-        results = []
-        for operation in data.operations:
-            handler = operation_handlers.get(operation.type)
-            result = await handler(operation, repositories, services)
-            results.append(result)
-        
-        return block_models.BatchOperationResponse(results=results)
-    
-    async def _handle_create_operation(
-        self, operation: block_models.BatchOperationType, repositories: Repositories, services: Services
-    ) -> block_models.BatchOperationResult:
-        result = block_models.BatchOperationResult(
-            success=False,
-            operation_type=operation.type,
-            block_id=operation.block_id
-        )
-        
-        try:
-            if not operation.data or not isinstance(operation.data, block_models.BlockCreate):
-                result.error = "Missing or invalid data for CREATE operation"
-                return result
-            
-            if operation.data.type in [block_models.BlockTypeEnum.IMAGE, block_models.BlockTypeEnum.FILE]:
-                file_path = services.s3.handle_block_file(operation.data.properties.get('file_path'), operation.block_id)
-                if file_path:
-                    operation.data.properties["file_path"] = file_path
-                
-            block = repositories.block.create_block(
-                block_id=operation.block_id,
-                block_type=operation.data.type,
-                properties=operation.data.properties,
-                workspace_id=operation.data.workspace_id,
-                parent_id=operation.data.parent_id,
-                position=operation.data.position
+        if output_format == "ndjson":
+            rows = repositories.block.iter_blocks_tree(workspace_id)
+            return Stream(ndjson_chunks(rows), media_type=NDJSON_MEDIA_TYPE, headers={"ETag": etag})
+
+        media_type = MEDIA_TYPES[output_format or JSON]
+        if depth or max_children:
+            tree = await repositories.block.get_blocks_tree(
+                workspace_id,
+                depth=depth,
+                max_children=max_children
             )
-            result.success = True
-            result.block_id = block["id"]
-            result.result = block_models.BlockResponse.parse_obj(block)
-        except Exception as e:
-            result.error = str(e)
-            
-        return result
-    
-    async def _handle_update_operation(
-        self, operation: block_models.BatchOperationType, repositories: Repositories
-    ) -> block_models.BatchOperationResult:
-        result = block_models.BatchOperationResult(
-            success=False,
-            operation_type=operation.type,
-            block_id=operation.block_id
-        )
-        
-        try:
-            if not operation.block_id:
-                result.error = "Missing block_id for UPDATE operation"
-                return result
-                
-            if not operation.data or not isinstance(operation.data, block_models.BlockUpdate):
-                result.error = "Missing or invalid data for UPDATE operation"
-                return result
-                
-            block = repositories.block.update_block(
-                block_id=operation.block_id,
-                properties=operation.data.properties,
-                block_type=operation.data.type
+            return Response(encode_tree(tree, output_format or JSON), media_type=media_type, headers={"ETag": etag})
+
+        # A rebuilt snapshot may be newer than the version checked above.
+        tree_body = await repositories.block.get_blocks_tree_body(workspace_id, version, output_format or JSON)
+        if tree_body is None:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail=f"Workspace with ID {workspace_id} not found"
             )
-            
-            if not block:
-                result.error = f"Block with ID {operation.block_id} not found"
-                return result
-                
-            result.success = True
-            result.result = block_models.BlockResponse.parse_obj(block)
-        except Exception as e:
-            result.error = str(e)
-            
-        return result
-    
-    async def _handle_move_operation(
-        self, operation: block_models.BatchOperationType, repositories: Repositories
-    ) -> block_models.BatchOperationResult:
-        result = block_models.BatchOperationResult(
-            success=False,
-            operation_type=operation.type,
-            block_id=operation.block_id
+        version, body = tree_body
+        return Response(
+            body,
+            media_type=media_type,
+            headers={"ETag": make_etag("tree", workspace_id, version, depth, max_children, output_format)}
         )
-        
+
+    @post("/import", status_code=HTTP_201_CREATED)
+    async def import_blocks(
+        self, data: block_models.BlockImportRequest, repositories: Repositories
+    ) -> block_models.BlockImportResponse:
+        workspace = await repositories.workspace.get_by_id(data.workspace_id)
+        if not workspace:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail=f"Workspace with ID {data.workspace_id} not found"
+            )
+
+        rows = []
+        root_ids = []
+        # Nested content is flattened iteratively; its list order is the position.
+        pending = deque((node, data.parent_id, index) for index, node in enumerate(data.blocks))
+        while pending:
+            node, parent_id, index = pending.popleft()
+            block_id = node.id or uuid.uuid4()
+            parent_id = node.parent_id or parent_id
+            position = node.position if node.position is not None else index
+            if parent_id == data.parent_id:
+                root_ids.append(block_id)
+            rows.append((block_id, parent_id, position, node.type.value, node.properties))
+            pending.extend((child, block_id, i) for i, child in enumerate(node.content))
+
         try:
-            if not operation.block_id:
-                result.error = "Missing block_id for MOVE operation"
-                return result
-                
-            if not operation.data or not isinstance(operation.data, block_models.BlockMove):
-                result.error = "Missing or invalid data for MOVE operation"
-                return result
-                
-            block = repositories.block.move_block(
-                block_id=operation.block_id,
-                new_parent_id=operation.data.parent_id,
-                new_position=operation.data.position
+            imported = await repositories.block.import_blocks(data.workspace_id, rows)
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
+
+        return block_models.BlockImportResponse(imported=imported, root_ids=root_ids)
+
+    @post("/batch", status_code=HTTP_200_OK)
+    async def batch_operations(
+        self,
+        data: block_models.BatchOperationRequest,
+        repositories: Repositories,
+        services: Services,
+        unit_of_work: AsyncUnitOfWork
+    ) -> block_models.BatchOperationResponse:
+        data_models = {
+            block_models.BatchOperationType.CREATE: block_models.BlockCreate,
+            block_models.BatchOperationType.UPDATE: block_models.BlockUpdate,
+            block_models.BatchOperationType.MOVE: block_models.BlockMove,
+        }
+
+        results = [
+            block_models.BatchOperationResult(
+                success=False,
+                operation_type=operation.type,
+                block_id=operation.block_id
             )
-            
-            if not block:
-                result.error = f"Block with ID {operation.block_id} not found"
-                return result
-                
-            result.success = True
-            result.result = block_models.BlockResponse.parse_obj(block)
-        except Exception as e:
-            result.error = str(e)
-            
-        return result
-    
-    async def _handle_delete_operation(
-        self, operation: block_models.BatchOperationType, repositories: Repositories, services: Services
-    ) -> block_models.BatchOperationResult:
-        result = block_models.BatchOperationResult(
-            success=False,
-            operation_type=operation.type,
-            block_id=operation.block_id
-        )
-        
+            for operation in data.operations
+        ]
+
+        indexes = []
+        operations = []
+        for index, operation in enumerate(data.operations):
+            op_data: Dict[str, Any] = {}
+            if operation.type in data_models:
+                try:
+                    op_data = data_models[operation.type].parse_obj(operation.data or {}).dict()
+                except ValidationError as e:
+                    error = f"Missing or invalid data for {operation.type.value.upper()} operation: {e}"
+                    if data.atomic:
+                        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=error)
+                    results[index].error = error
+                    continue
+
+            if operation.type == block_models.BatchOperationType.CREATE:
+                if op_data["type"] in [block_models.BlockTypeEnum.IMAGE, block_models.BlockTypeEnum.FILE]:
+                    file_path = services.s3.handle_block_file(op_data["properties"].get('file_path'), operation.block_id)
+                    if file_path:
+                        op_data["properties"]["file_path"] = file_path
+
+            indexes.append(index)
+            operations.append((operation.type.value, operation.block_id, op_data))
+
         try:
-            if not operation.block_id:
-                result.error = "Missing block_id for DELETE operation"
-                return result
-            
-            block = repositories.block.get_block(operation.block_id)
-            if not block:
-                result.error = f"Block with ID {operation.block_id} not found"
-                return result
+            applied = await repositories.block.apply_batch(operations, atomic=data.atomic)
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=str(e))
 
-            if block["type"] in [block_models.BlockTypeEnum.IMAGE.value, block_models.BlockTypeEnum.FILE.value]:
-                if "file_path" in block["properties"]:
-                    services.s3.soft_delete(block["properties"]["file_path"])
-            
-            deleted = repositories.block.delete_block(operation.block_id)
-            
-            if deleted:
-                result.success = True
-                result.result = {"message": f"Block {operation.block_id} deleted"}
+        for index, outcome in zip(indexes, applied):
+            result = results[index]
+            block = outcome["block"]
+            if outcome["error"]:
+                result.error = outcome["error"]
+                continue
+
+            result.success = True
+            if result.operation_type == block_models.BatchOperationType.DELETE:
+                # Files are only moved aside once the deletion has committed.
+                if block["type"] in [block_models.BlockTypeEnum.IMAGE.value, block_models.BlockTypeEnum.FILE.value]:
+                    if "file_path" in block["properties"]:
+                        unit_of_work.on_commit(partial(services.s3.soft_delete, block["properties"]["file_path"]))
+                result.result = {"message": f"Block {result.block_id} deleted"}
             else:
-                result.error = f"Failed to delete block {operation.block_id}"
-                
-        except Exception as e:
-            result.error = str(e)
-            
-        return result
+                result.result = block_models.BlockResponse.parse_obj(block)
+
+        return block_models.BatchOperationResponse(results=results)
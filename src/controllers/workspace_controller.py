@@ -1,13 +1,19 @@
+import asyncio
 import uuid
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from litestar import get, post, put, delete
-from litestar.status_codes import HTTP_200_OK, HTTP_201_CREATED, HTTP_404_NOT_FOUND
-from litestar.exceptions import HTTPException
+from litestar import WebSocket, get, post, put, delete, websocket
+from litestar.params import Parameter
+from litestar.status_codes import HTTP_200_OK, HTTP_201_CREATED, HTTP_404_NOT_FOUND, WS_1008_POLICY_VIOLATION
+from litestar.exceptions import HTTPException, WebSocketDisconnect
 from litestar.controller import Controller
 
 from models.workspace import WorkspaceCreate, WorkspaceUpdate
 from repositories.base import Repositories
+from services.base import Services
+from services.change_push_service import DISCONNECTED
+
+from utils.metrics import PUSH_DISCONNECTS
 
 
 class WorkspaceController(Controller):
@@ -16,11 +22,11 @@ class WorkspaceController(Controller):
 
     @get("/")
     async def get_all_workspaces(self, repositories: Repositories) -> List[Dict[str, Any]]:
-        return repositories.workspace.get_all()
+        return await repositories.workspace.get_all()
 
     @get("/{workspace_id:uuid}", status_code=HTTP_200_OK)
     async def get_workspace(self, workspace_id: uuid.UUID, repositories: Repositories) -> Dict[str, Any]:
-        workspace = repositories.workspace.get_by_id(workspace_id)
+        workspace = await repositories.workspace.get_by_id(workspace_id)
         if not workspace:
             raise HTTPException(
                 status_code=HTTP_404_NOT_FOUND,
@@ -28,9 +34,68 @@ class WorkspaceController(Controller):
             )
         return workspace
 
+    @get("/{workspace_id:uuid}/changes", status_code=HTTP_200_OK)
+    async def get_workspace_changes(
+        self,
+        workspace_id: uuid.UUID,
+        repositories: Repositories,
+        since: int = Parameter(ge=0),
+        limit: int = Parameter(default=500, ge=1, le=5000)
+    ) -> Dict[str, Any]:
+        changes = await repositories.workspace.get_changes(workspace_id, since=since, limit=limit)
+        if changes is None:
+            raise HTTPException(
+                status_code=HTTP_404_NOT_FOUND,
+                detail=f"Workspace with ID {workspace_id} not found"
+            )
+        return changes
+
+    # Pushes the same pages as the changes endpoint as they are committed,
+    # starting after `since` if given. Messages from the client are ignored.
+    @websocket("/{workspace_id:uuid}/changes/live")
+    async def stream_workspace_changes(
+        self,
+        socket: WebSocket,
+        workspace_id: uuid.UUID,
+        services: Services,
+        since: Optional[int] = Parameter(default=None, ge=0)
+    ) -> None:
+        subscription = await services.push.subscribe(workspace_id, since)
+        if subscription is None:
+            await socket.close(code=WS_1008_POLICY_VIOLATION, reason=f"Workspace with ID {workspace_id} not found")
+            return
+
+        async def watch_disconnect() -> None:
+            try:
+                while True:
+                    await socket.receive_data(mode="text")
+            except WebSocketDisconnect:
+                subscription.close(DISCONNECTED)
+
+        await socket.accept()
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            while True:
+                message = await subscription.queue.get()
+                if message == DISCONNECTED:
+                    return
+                if isinstance(message, int):
+                    await socket.close(code=message)
+                    return
+                try:
+                    await asyncio.wait_for(socket.send_text(message), timeout=services.push.send_timeout)
+                except asyncio.TimeoutError:
+                    PUSH_DISCONNECTS.labels(reason="timeout").inc()
+                    return
+        except WebSocketDisconnect:
+            pass
+        finally:
+            watcher.cancel()
+            services.push.unsubscribe(subscription)
+
     @post("/", status_code=HTTP_201_CREATED)
     async def create_workspace(self, data: WorkspaceCreate, repositories: Repositories) -> Dict[str, Any]:
-        return repositories.workspace.create(
+        return await repositories.workspace.create(
             name=data.name, 
             description=data.description
         )
@@ -39,7 +104,7 @@ class WorkspaceController(Controller):
     async def update_workspace(
         self, workspace_id: uuid.UUID, data: WorkspaceUpdate, repositories: Repositories
     ) -> Dict[str, Any]:
-        updated_workspace = repositories.workspace.update(
+        updated_workspace = await repositories.workspace.update(
             workspace_id=workspace_id,
             name=data.name,
             description=data.description
@@ -54,7 +119,7 @@ class WorkspaceController(Controller):
 
     @delete("/{workspace_id:uuid}", status_code=HTTP_200_OK)
     async def delete_workspace(self, workspace_id: uuid.UUID, repositories: Repositories) -> None:
-        success = repositories.workspace.delete(workspace_id)
+        success = await repositories.workspace.delete(workspace_id)
         if not success:
             raise HTTPException(
                 status_code=HTTP_404_NOT_FOUND,
@@ -1,28 +1,89 @@
+from typing import AsyncGenerator
+
 from services.base import Services
+from services.change_log_service import ChangeLogCompactionService
+from services.change_push_service import ChangePushService
 from services.migration_service import PostgresMigrationService
 from services.minio_service import MinioService
+from services.workspace_reaper_service import WorkspaceReaperService
 
+from repositories.async_block_repository import AsyncBlockRepository
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
 from repositories.base import Repositories
-from repositories.block_repository import BlockRepository
-from repositories.workspace_repository import WorkspaceRepository
 
-from utils.psycopg2 import db_manager
+from utils.cache import Cache, LRUCache
+from utils.config import config
+from utils.invalidation import InvalidationListener
+from utils.psycopg import async_db_manager
+from utils.tree_snapshot import TreeSnapshotCache
+
 
+pool = async_db_manager.get_pool()
 
 services = Services(
     migration=PostgresMigrationService(),
-    s3=MinioService()
+    s3=MinioService(),
+    push=ChangePushService(
+        pool,
+        window=config.push_window,
+        max_pending=config.push_max_pending,
+        send_timeout=config.push_send_timeout,
+        prepare=config.postgres_db_prepared_statements
+    )
 )
 
 def get_services() -> Services:
     return services
 
-pool = db_manager.get_pool()
+block_cache = (
+    LRUCache("block", max_size=config.block_cache_size, ttl=config.block_cache_ttl)
+    if config.block_cache_size > 0 else Cache()
+)
+tree_snapshots = TreeSnapshotCache(max_nodes=config.tree_snapshot_max_nodes)
+invalidation_listener = InvalidationListener(
+    pool.conninfo,
+    [block_cache],
+    tree_snapshots,
+    batch_delay=config.cache_invalidation_batch_delay,
+    on_tree_versions=services.push.notify
+)
+
+async def start_invalidation_listener() -> None:
+    if config.cache_invalidation_notify:
+        await invalidation_listener.start()
+
+change_log_compaction = ChangeLogCompactionService(
+    pool,
+    retention=config.change_log_retention,
+    interval=config.change_log_compact_interval
+)
 
-repositories = Repositories(
-    block=BlockRepository(pool),
-    workspace=WorkspaceRepository(pool)
+workspace_reaper = WorkspaceReaperService(
+    pool,
+    batch_size=config.reaper_batch_size,
+    batch_delay=config.reaper_batch_delay,
+    interval=config.reaper_interval
 )
 
-def get_repositories() -> Repositories:
-    return repositories
+# Committed when the handler returns, rolled back if it raises.
+async def get_unit_of_work() -> AsyncGenerator[AsyncUnitOfWork, None]:
+    unit_of_work = AsyncUnitOfWork(
+        pool,
+        prepare=config.postgres_db_prepared_statements,
+        notify=config.cache_invalidation_notify
+    )
+    try:
+        yield unit_of_work
+        await unit_of_work.commit()
+    except Exception:
+        await unit_of_work.rollback()
+        raise
+    finally:
+        await unit_of_work.close()
+
+def get_repositories(unit_of_work: AsyncUnitOfWork) -> Repositories:
+    return Repositories(
+        block=AsyncBlockRepository(unit_of_work, block_cache, tree_snapshots),
+        workspace=AsyncWorkspaceRepository(unit_of_work, block_cache, tree_snapshots)
+    )
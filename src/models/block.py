@@ -1,10 +1,10 @@
 import uuid
 from enum import Enum
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, ConfigDict, UUID4
-from sqlalchemy import Column, ForeignKey, String, Table, Integer, DateTime
-from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -12,14 +12,8 @@ from sqlalchemy.sql import func
 
 Base = declarative_base()
 
-block_content_association = Table(
-    'block_content_association',
-    Base.metadata,
-    Column('parent_block_id', UUID(as_uuid=True), ForeignKey('blocks.id'), primary_key=True),
-    Column('child_block_id', UUID(as_uuid=True), ForeignKey('blocks.id'), primary_key=True),
-    Column('position', Integer, nullable=False, default=0)
-)
-
+# Parent and sibling key live on the block itself; block_content_association
+# survives only as a read-only view over these columns.
 class Block(Base):
     __tablename__ = 'blocks'
 
@@ -27,26 +21,16 @@ class Block(Base):
     type = Column(String(50), nullable=False)
     properties = Column(JSONB, default={})
     workspace_id = Column(UUID(as_uuid=True), ForeignKey('workspaces.id'), nullable=False)
+    parent_id = Column(UUID(as_uuid=True), ForeignKey('blocks.id'), nullable=True)
+    rank = Column(String(collation='C'), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     deleted_at = Column(DateTime, nullable=True)
+    path = Column(ARRAY(UUID(as_uuid=True)), nullable=False)
+    version = Column(Integer, nullable=False, server_default='1')
 
     parent = relationship("Block", remote_side=[id], back_populates="children")
     children = relationship("Block", back_populates="parent")
-    content_blocks = relationship(
-        "Block",
-        secondary="block_content_association",
-        primaryjoin="Block.id == block_content_association.c.parent_block_id",
-        secondaryjoin="Block.id == block_content_association.c.child_block_id",
-        back_populates="container_blocks"
-    )
-    container_blocks = relationship(
-        "Block",
-        secondary="block_content_association",
-        primaryjoin="Block.id == block_content_association.c.child_block_id",
-        secondaryjoin="Block.id == block_content_association.c.parent_block_id",
-        back_populates="content_blocks"
-    )
 
 
 class BlockTypeEnum(str, Enum):
@@ -80,9 +64,22 @@ class BlockAppendChild(BaseModel):
     workspace_id: UUID4
 
 
+class PropertyPatchOp(str, Enum):
+    SET = "set"
+    REMOVE = "remove"
+
+
+class PropertyPatch(BaseModel):
+    op: PropertyPatchOp = PropertyPatchOp.SET
+    path: List[str] = Field(min_length=1)
+    value: Any = None
+
+
 class BlockUpdate(BaseModel):
     type: Optional[BlockTypeEnum] = None
     properties: Optional[Dict[str, Any]] = None
+    patches: Optional[List[PropertyPatch]] = None
+    expected_version: Optional[int] = None
 
 
 class BlockMove(BaseModel):
@@ -101,10 +98,42 @@ class BlockResponse(BaseModel):
     parent_id: Optional[UUID4] = None
     workspace_id: UUID4
     position: int
+    version: Optional[int] = None
+
+
+class BlockTreeNode(BlockResponse):
+    content: List["BlockTreeNode"] = Field(default_factory=list)
+    has_more: bool = False
+    next_cursor: Optional[str] = None
+
+
+class BlockContentResponse(BlockTreeNode):
+    pass
+
+
+class BlockPage(BaseModel):
+    items: List[BlockResponse]
+    next_after: Optional[str] = None
+
+
+class BlockImportNode(BaseModel):
+    id: Optional[UUID4] = None
+    type: BlockTypeEnum
+    properties: Dict[str, Any] = Field(default_factory=dict)
+    parent_id: Optional[UUID4] = None
+    position: Optional[int] = None
+    content: List["BlockImportNode"] = Field(default_factory=list)
+
+
+class BlockImportRequest(BaseModel):
+    workspace_id: UUID4
+    parent_id: Optional[UUID4] = None
+    blocks: List[BlockImportNode]
 
 
-class BlockContentResponse(BlockResponse):
-    content: List[BlockResponse] = Field(default_factory=list)
+class BlockImportResponse(BaseModel):
+    imported: int
+    root_ids: List[UUID4]
 
 
 class BatchOperationType(str, Enum):
@@ -117,11 +146,12 @@ class BatchOperationType(str, Enum):
 class BatchBlockOperation(BaseModel):
     type: BatchOperationType
     block_id: UUID4
-    data: Optional[Union[BlockCreate, BlockUpdate, dict]] = None
+    data: Optional[Dict[str, Any]] = None
 
 
 class BatchOperationRequest(BaseModel):
     operations: List[BatchBlockOperation]
+    atomic: bool = False
 
 
 class BatchOperationResult(BaseModel):
@@ -2,8 +2,8 @@ import uuid
 from typing import Optional
 
 from pydantic import BaseModel
-from sqlalchemy import Column, String, Text, DateTime
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Column, ForeignKey, Integer, String, Table, Text, DateTime
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -20,10 +20,30 @@ class Workspace(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     deleted_at = Column(DateTime, nullable=True)
+    # Bumped by every committed change to the workspace's block tree.
+    tree_version = Column(BigInteger, nullable=False, server_default='0')
+    # Versions up to this one have been compacted out of workspace_changes.
+    changes_floor = Column(BigInteger, nullable=False, server_default='0')
+    # Set once the blocks of a deleted workspace have all been purged.
+    reaped_at = Column(DateTime, nullable=True)
     
     blocks = relationship("Block", backref="workspace")
 
 
+# Per-workspace change log: the ops of the write that produced each
+# tree_version, in order.
+workspace_changes = Table(
+    'workspace_changes',
+    Base.metadata,
+    Column('workspace_id', UUID(as_uuid=True), ForeignKey('workspaces.id'), primary_key=True),
+    Column('version', BigInteger, primary_key=True),
+    Column('seq', Integer, primary_key=True),
+    Column('op', String(16), nullable=False),
+    Column('data', JSONB, nullable=False),
+    Column('created_at', DateTime, nullable=False, server_default=func.now(), index=True)
+)
+
+
 class WorkspaceBase(BaseModel):
     name: str
     description: Optional[str] = None
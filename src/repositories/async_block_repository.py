@@ -0,0 +1,1590 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import uuid
+from datetime import datetime
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.block_repository import BaseBlockRepository, VersionConflictError
+
+from utils.block_json import JSON
+from utils.cache import Cache
+from utils.invalidation import publish_changes
+from utils.ranking import MAX_RANK_LENGTH, REBALANCED_RANK_WIDTH, rank_between
+from utils.tree_snapshot import TreePatch, TreeSnapshot, TreeSnapshotCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# Block reads and writes on psycopg's async driver, built on the queries of
+# BaseBlockRepository. psycopg binds parameters server-side and has no
+# execute_values, so bulk statements take their rows as unnest()ed arrays
+# or go through a pipelined executemany.
+#
+# get_block, get_block_children and get_block_with_content read through
+# `cache`. Entries are tagged ("block", id) for each block they show,
+# ("children", id) for each child list they depend on, positions included,
+# and ("workspace", id); writes invalidate those tags when they commit.
+#
+# Writes also record how they change each workspace's tree, which bumps
+# its tree_version and goes to its change log before commit. Once
+# the transaction has committed the changes are replayed onto the cached
+# tree snapshots. Other processes learn of both through the unit of
+# work's notifications.
+class AsyncBlockRepository(BaseBlockRepository):
+    _json = Jsonb
+    _pending_rebalances: Set[uuid.UUID] = set()
+    _rebalance_tasks: Set[asyncio.Task] = set()
+
+    def __init__(
+        self,
+        unit_of_work: AsyncUnitOfWork,
+        cache: Optional[Cache] = None,
+        tree_snapshots: Optional[TreeSnapshotCache] = None
+    ):
+        self.uow = unit_of_work
+        self.pool = unit_of_work.pool
+        self.cache = cache if cache is not None else Cache()
+        self.tree_snapshots = tree_snapshots if tree_snapshots is not None else TreeSnapshotCache(0)
+        self._tree_patches: Dict[uuid.UUID, List[Tuple[TreePatch, Optional[Dict[str, Any]]]]] = {}
+
+    async def _read_through(
+        self,
+        key: Hashable,
+        load: Callable[[], Awaitable[Any]],
+        tags: Callable[[Any], Iterable[Hashable]]
+    ) -> Any:
+        if self.uow.invalidated:
+            return await load()
+
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+
+        generation = self.cache.generation
+        value = await load()
+        if value is not None:
+            self.cache.set(key, value, tags(value), generation)
+        return value
+
+    def _invalidate(self, tags: Iterable[Hashable]) -> None:
+        self.uow.invalidate(self.cache, tags)
+
+    def _patch_tree(self, workspace_id: uuid.UUID, patch: TreePatch, change: Optional[Dict[str, Any]]) -> None:
+        if not self._tree_patches:
+            self.uow.before_commit(self._publish_tree_patches)
+        self._tree_patches.setdefault(workspace_id, []).append((patch, change))
+
+    def _tree_insert(self, block: Dict[str, Any], parent_id: Optional[uuid.UUID], position: int) -> None:
+        self._patch_tree(
+            block["workspace_id"],
+            partial(TreeSnapshot.insert, block=block, parent_id=parent_id, position=position),
+            self._insert_change(block, parent_id, position)
+        )
+
+    def _tree_update(self, block: Dict[str, Any]) -> None:
+        self._patch_tree(
+            block["workspace_id"],
+            partial(TreeSnapshot.update, block=block),
+            self._update_change(block)
+        )
+
+    def _tree_move(self, workspace_id: uuid.UUID, block_id: uuid.UUID, parent_id: uuid.UUID, position: int) -> None:
+        self._patch_tree(
+            workspace_id,
+            partial(TreeSnapshot.move, block_id=block_id, parent_id=parent_id, position=position),
+            self._move_change(block_id, parent_id, position)
+        )
+
+    def _tree_delete(self, workspace_id: uuid.UUID, block_ids: List[uuid.UUID]) -> None:
+        self._patch_tree(
+            workspace_id,
+            partial(TreeSnapshot.delete, block_ids=block_ids),
+            self._delete_change(block_ids)
+        )
+
+    async def _publish_tree_patches(self) -> None:
+        patches, self._tree_patches = self._tree_patches, {}
+        async with self.uow.cursor() as cursor:
+            for workspace_id in sorted(patches):
+                await cursor.execute(
+                    self._publish_changes_sql,
+                    self._publish_changes_params(workspace_id, [change for _, change in patches[workspace_id]]),
+                    prepare=self.uow.prepare
+                )
+                row = await cursor.fetchone()
+                if row:
+                    self.uow.tree_changed(workspace_id, row["tree_version"])
+                    self.uow.on_commit(partial(
+                        self.tree_snapshots.apply,
+                        workspace_id,
+                        row["tree_version"],
+                        [patch for patch, _ in patches[workspace_id]]
+                    ))
+
+    @staticmethod
+    def _block_tags(block: Dict[str, Any]) -> List[Hashable]:
+        tags = [("block", block["id"]), ("workspace", block["workspace_id"])]
+        if block["parent_id"]:
+            tags.append(("children", block["parent_id"]))
+        return tags
+
+    @staticmethod
+    def _children_tags(block_id: uuid.UUID, children: List[Dict[str, Any]]) -> List[Hashable]:
+        tags: List[Hashable] = [("children", block_id)]
+        for child in children:
+            tags.extend((("block", child["id"]), ("workspace", child["workspace_id"])))
+        return tags
+
+    @staticmethod
+    def _content_tags(tree: Dict[str, Any]) -> List[Hashable]:
+        tags = AsyncBlockRepository._block_tags(tree)
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            tags.extend((("block", node["id"]), ("children", node["id"])))
+            pending.extend(node["content"])
+        return tags
+
+    async def create_block(
+        self,
+        block_id: uuid.UUID,
+        block_type: str,
+        properties: Dict[str, Any],
+        workspace_id: uuid.UUID,
+        parent_id: Optional[uuid.UUID] = None,
+        position: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        rank = None
+        async with self.uow.cursor() as cursor:
+            if parent_id:
+                rank, position = await self._rank_for_position(cursor, parent_id, block_id, position)
+
+            await cursor.execute(
+                self._insert_block_sql,
+                (
+                    block_id, block_type, Jsonb(properties), parent_id, rank,
+                    parent_id, block_id, workspace_id
+                ),
+                prepare=self.uow.prepare
+            )
+            block = await cursor.fetchone()
+            if not block:
+                return None
+
+            result = dict(block)
+            result['position'] = position
+
+            # The id is the caller's, so an empty child list may be cached for it.
+            self._invalidate([("children", block_id)] + ([("children", parent_id)] if parent_id else []))
+            self._tree_insert(result, parent_id, position)
+            self.uow.on_commit(partial(self._rebalance_if_needed, parent_id, rank))
+            return result
+
+    async def _rank_for_position(
+        self, cursor, parent_id: uuid.UUID, block_id: uuid.UUID, position: int
+    ) -> Tuple[str, int]:
+        # Blocks a concurrent rebalance of this parent until we commit.
+        await cursor.execute(
+            """
+            SELECT id FROM blocks
+            WHERE id = %s
+            FOR KEY SHARE
+            """,
+            (parent_id,),
+            prepare=self.uow.prepare
+        )
+
+        position = max(position, 0)
+        await cursor.execute(
+            """
+            SELECT rank FROM blocks
+            WHERE parent_id = %s AND id <> %s
+            ORDER BY rank, id
+            OFFSET %s LIMIT %s
+            """,
+            (parent_id, block_id, max(position - 1, 0), 1 if position == 0 else 2),
+            prepare=self.uow.prepare
+        )
+        neighbours = [row["rank"] for row in await cursor.fetchall()]
+
+        if position == 0:
+            before, after = None, (neighbours[0] if neighbours else None)
+        elif neighbours:
+            before, after = neighbours[0], (neighbours[1] if len(neighbours) > 1 else None)
+        else:
+            await cursor.execute(
+                """
+                SELECT COUNT(*) AS siblings, MAX(rank) AS rank
+                FROM blocks
+                WHERE parent_id = %s AND id <> %s
+                """,
+                (parent_id, block_id),
+                prepare=self.uow.prepare
+            )
+            tail = await cursor.fetchone()
+            before, after = tail["rank"], None
+            position = tail["siblings"]
+
+        if before is not None and before == after:
+            await self._rebalance_ranks(cursor, parent_id)
+            return await self._rank_for_position(cursor, parent_id, block_id, position)
+
+        return rank_between(before, after), position
+
+    async def _rebalance_ranks(self, cursor, parent_id: uuid.UUID) -> None:
+        await cursor.execute(
+            """
+            UPDATE blocks b
+            SET rank = ordered.rank
+            FROM (
+                SELECT id,
+                       rtrim(lpad(ROW_NUMBER() OVER (
+                           ORDER BY rank, id
+                       )::text, %s, '0'), '0') AS rank
+                FROM blocks
+                WHERE parent_id = %s
+            ) ordered
+            WHERE b.parent_id = %s
+            AND b.id = ordered.id
+            AND b.rank <> ordered.rank
+            """,
+            (REBALANCED_RANK_WIDTH, parent_id, parent_id)
+        )
+
+    async def rebalance_ranks(self, parent_id: uuid.UUID) -> None:
+        conn = await self.pool.getconn()
+        try:
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(
+                    """
+                    SELECT id FROM blocks
+                    WHERE id = %s
+                    FOR UPDATE
+                    """,
+                    (parent_id,)
+                )
+                await self._rebalance_ranks(cursor, parent_id)
+                # Positions stay put, but pagination cursors hold ranks, so
+                # responses that carry them change version too.
+                await cursor.execute(
+                    """
+                    UPDATE workspaces w
+                    SET tree_version = w.tree_version + 1
+                    FROM blocks b
+                    WHERE b.id = %s AND w.id = b.workspace_id
+                    RETURNING w.id, w.tree_version
+                    """,
+                    (parent_id,)
+                )
+                workspace = await cursor.fetchone()
+                if self.uow.notify:
+                    await publish_changes(
+                        cursor,
+                        {self.cache.name: [("children", parent_id)]},
+                        {workspace["id"]: workspace["tree_version"]} if workspace else {}
+                    )
+                await conn.commit()
+            self.cache.invalidate([("children", parent_id)])
+            if workspace:
+                self.tree_snapshots.apply(workspace["id"], workspace["tree_version"], [])
+        except Exception as e:
+            await conn.rollback()
+            raise e
+        finally:
+            await self.pool.putconn(conn)
+
+    # Called from on_commit, inside the event loop.
+    def _rebalance_if_needed(self, parent_id: Optional[uuid.UUID], rank: Optional[str]) -> None:
+        if not parent_id or not rank or len(rank) <= MAX_RANK_LENGTH:
+            return
+
+        if parent_id in self._pending_rebalances:
+            return
+        self._pending_rebalances.add(parent_id)
+
+        task = asyncio.get_running_loop().create_task(self._run_rebalance(parent_id))
+        self._rebalance_tasks.add(task)
+        task.add_done_callback(self._rebalance_tasks.discard)
+
+    # Nothing awaits the task, so a failure is logged here; the ranks are
+    # rebalanced on a later insert that finds them too long.
+    async def _run_rebalance(self, parent_id: uuid.UUID) -> None:
+        try:
+            await self.rebalance_ranks(parent_id)
+        except Exception:
+            logger.exception("Rebalancing the ranks under block %s failed", parent_id)
+        finally:
+            self._pending_rebalances.discard(parent_id)
+
+    async def append_block_child(
+        self,
+        block_type: str,
+        properties: Dict[str, Any],
+        workspace_id: uuid.UUID,
+        parent_id: Optional[uuid.UUID] = None
+    ) -> Optional[Dict[str, Any]]:
+        block_id = uuid.uuid4()
+        position = 0
+        rank = None
+
+        async with self.uow.cursor() as cursor:
+            if parent_id:
+                rank, position = await self._rank_for_position(cursor, parent_id, block_id, position)
+
+            await cursor.execute(
+                self._insert_block_sql,
+                (
+                    block_id, block_type, Jsonb(properties), parent_id, rank,
+                    parent_id, block_id, workspace_id
+                ),
+                prepare=self.uow.prepare
+            )
+            block = await cursor.fetchone()
+            if not block:
+                return None
+
+            result = dict(block)
+            result['position'] = position
+
+            if parent_id:
+                self._invalidate([("children", parent_id)])
+            self._tree_insert(result, parent_id, position)
+            self.uow.on_commit(partial(self._rebalance_if_needed, parent_id, rank))
+            return result
+
+    async def get_block(self, block_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        return await self._read_through(
+            ("block", block_id), partial(self._get_block, block_id), self._block_tags
+        )
+
+    async def _get_block(self, block_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT b.id, b.type, b.properties, b.workspace_id, b.version, b.parent_id,
+                       (
+                           SELECT COUNT(*) FROM blocks s
+                           WHERE s.parent_id = b.parent_id
+                           AND (s.rank, s.id) < (b.rank, b.id)
+                       ) AS position
+                FROM blocks b
+                WHERE b.id = %s AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                """,
+                (block_id,),
+                prepare=self.uow.prepare
+            )
+            block = await cursor.fetchone()
+            return dict(block) if block else None
+
+    async def get_all(
+        self,
+        limit: int = 100,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        workspace_id: Optional[uuid.UUID] = None,
+        block_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        conditions, params = self._list_filters(workspace_id, block_type)
+
+        if after:
+            conditions.append("(b.created_at, b.id) < (%s, %s)")
+            params.extend(after)
+
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                WITH page AS (
+                    SELECT b.id, b.type, b.properties, b.workspace_id, b.version, b.parent_id, b.created_at
+                    FROM blocks b
+                    WHERE {' AND '.join(conditions)}
+                    ORDER BY b.created_at DESC, b.id DESC
+                    LIMIT %s
+                ),
+                {self._positions_cte('page')}
+                SELECT page.id, page.type, page.properties, page.workspace_id, page.version, page.parent_id,
+                       COALESCE(positions.position, 0) as position,
+                       page.created_at
+                FROM page
+                LEFT JOIN positions ON positions.id = page.id
+                ORDER BY page.created_at DESC, page.id DESC
+                """,
+                params + [limit]
+            )
+            return await cursor.fetchall()
+
+    async def iter_all(
+        self,
+        after: Optional[Tuple[datetime, uuid.UUID]] = None,
+        workspace_id: Optional[uuid.UUID] = None,
+        block_type: Optional[str] = None,
+        batch_size: int = 2000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        conditions, params = self._list_filters(workspace_id)
+        outer_conditions = []
+
+        # Positions count every sibling, so the type and cursor filters
+        # apply only after the window has been computed.
+        if block_type:
+            outer_conditions.append("listed.type = %s")
+            params.append(block_type)
+
+        if after:
+            outer_conditions.append("(listed.created_at, listed.id) < (%s, %s)")
+            params.extend(after)
+
+        conn = await self.pool.getconn()
+        try:
+            async with conn.cursor(
+                name=f"iter_blocks_{uuid.uuid4().hex}", row_factory=dict_row
+            ) as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute(
+                    f"""
+                    SELECT id, type, properties, workspace_id, parent_id, position
+                    FROM (
+                        SELECT b.id, b.type, b.properties, b.workspace_id, b.parent_id,
+                               CASE WHEN b.parent_id IS NULL THEN 0
+                                    ELSE ROW_NUMBER() OVER (
+                                        PARTITION BY b.parent_id
+                                        ORDER BY b.rank, b.id
+                                    ) - 1
+                               END as position,
+                               b.created_at
+                        FROM blocks b
+                        WHERE {' AND '.join(conditions)}
+                    ) listed
+                    {'WHERE ' + ' AND '.join(outer_conditions) if outer_conditions else ''}
+                    ORDER BY listed.created_at DESC, listed.id DESC
+                    """,
+                    params
+                )
+                async for row in cursor:
+                    yield row
+        finally:
+            await conn.rollback()
+            await self.pool.putconn(conn)
+
+    async def get_block_with_content(
+        self,
+        block_id: uuid.UUID,
+        depth: int = 1,
+        max_children: Optional[int] = None,
+        after: Optional[Tuple[str, uuid.UUID, int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        return await self._read_through(
+            ("content", block_id, depth, max_children, after),
+            partial(self._get_block_with_content, block_id, depth, max_children, after),
+            self._content_tags
+        )
+
+    async def _get_block_with_content(
+        self,
+        block_id: uuid.UUID,
+        depth: int,
+        max_children: Optional[int],
+        after: Optional[Tuple[str, uuid.UUID, int]]
+    ) -> Optional[Dict[str, Any]]:
+        anchor = f"""
+            SELECT b.id, b.type, b.properties, b.workspace_id, b.version, b.parent_id,
+                   NULL::varchar COLLATE "C" as rank,
+                   (
+                       SELECT COUNT(*) FROM blocks s
+                       WHERE s.parent_id = b.parent_id
+                       AND (s.rank, s.id) < (b.rank, b.id)
+                   ) as position,
+                   false as overflow,
+                   0 as depth,
+                   b.created_at
+            FROM blocks b
+            WHERE b.id = %(block_id)s AND b.deleted_at IS NULL
+            AND {self._live_workspace('b')}
+        """
+        async with self.uow.cursor() as cursor:
+            tree = await self._fetch_limited_tree(
+                cursor, anchor, {"block_id": block_id}, depth, max_children, after
+            )
+            return tree[0] if tree else None
+
+    async def get_block_children(self, block_id: uuid.UUID) -> List[Dict[str, Any]]:
+        return await self._read_through(
+            ("children", block_id),
+            partial(self._get_block_children, block_id),
+            partial(self._children_tags, block_id)
+        )
+
+    async def _get_block_children(self, block_id: uuid.UUID) -> List[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT b.id, b.type, b.properties, b.workspace_id, b.version, b.parent_id,
+                       ROW_NUMBER() OVER (ORDER BY b.rank, b.id) - 1 AS position
+                FROM blocks b
+                WHERE b.parent_id = %s AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                ORDER BY b.rank, b.id
+                """,
+                (block_id,),
+                prepare=self.uow.prepare
+            )
+            children = await cursor.fetchall()
+            return [dict(child) for child in children]
+
+    async def update_block(
+        self,
+        block_id: uuid.UUID,
+        properties: Optional[Dict[str, Any]] = None,
+        block_type: Optional[str] = None,
+        patches: Optional[List[Dict[str, Any]]] = None,
+        expected_version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            block = await self._update_block(
+                cursor, block_id, properties, block_type, patches, expected_version
+            )
+            return block
+
+    async def _update_block(
+        self,
+        cursor,
+        block_id: uuid.UUID,
+        properties: Optional[Dict[str, Any]] = None,
+        block_type: Optional[str] = None,
+        patches: Optional[List[Dict[str, Any]]] = None,
+        expected_version: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        properties_sql, params = self._properties_patch_sql(properties, patches)
+        params.extend([block_type, datetime.now(), block_id])
+
+        version_filter = ""
+        if expected_version is not None:
+            version_filter = "AND b.version = %s"
+            params.append(expected_version)
+
+        # The new properties are computed from the locked row itself, so
+        # concurrent patches to different keys do not overwrite each other.
+        await cursor.execute(
+            f"""
+            WITH updated AS (
+                UPDATE blocks b
+                SET properties = {properties_sql},
+                    type = COALESCE(%s, b.type),
+                    updated_at = %s,
+                    version = b.version + 1
+                WHERE b.id = %s AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                {version_filter}
+                RETURNING b.*
+            )
+            SELECT u.*,
+                   (
+                       SELECT COUNT(*) FROM blocks s
+                       WHERE s.parent_id = u.parent_id
+                       AND (s.rank, s.id) < (u.rank, u.id)
+                   ) as position
+            FROM updated u
+            """,
+            params
+        )
+        block = await cursor.fetchone()
+        if block:
+            self._invalidate([("block", block_id)])
+            self._tree_update(dict(block))
+            return dict(block)
+
+        if expected_version is not None:
+            await cursor.execute(
+                f"""
+                SELECT version FROM blocks
+                WHERE id = %s AND deleted_at IS NULL
+                AND {self._live_workspace('blocks')}
+                """,
+                (block_id,)
+            )
+            current = await cursor.fetchone()
+            if current:
+                raise VersionConflictError(block_id, current["version"])
+
+        return None
+
+    async def delete_block(self, block_id: uuid.UUID) -> bool:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT id, workspace_id FROM blocks
+                WHERE id = %s AND deleted_at IS NULL
+                AND {self._live_workspace('blocks')}
+                FOR UPDATE
+                """,
+                (block_id,)
+            )
+            block = await cursor.fetchone()
+            if not block:
+                return False
+
+            await cursor.execute(
+                """
+                WITH removed AS (
+                    DELETE FROM blocks
+                    WHERE path @> ARRAY[%s::uuid]
+                    RETURNING id, parent_id
+                )
+                SELECT ARRAY(SELECT id FROM removed) AS removed,
+                       ARRAY(SELECT DISTINCT parent_id FROM removed WHERE parent_id IS NOT NULL) AS parents
+                """,
+                (block_id,)
+            )
+            self._invalidate_removed(await cursor.fetchone(), {block["workspace_id"]})
+
+            return True
+
+    def _invalidate_removed(self, deleted: Dict[str, List[uuid.UUID]], workspace_ids: Set[uuid.UUID]) -> None:
+        self._invalidate(
+            [tag for block_id in deleted["removed"] for tag in (("block", block_id), ("children", block_id))]
+            + [("children", parent_id) for parent_id in deleted["parents"]]
+        )
+        for workspace_id in workspace_ids:
+            self._tree_delete(workspace_id, deleted["removed"])
+
+    async def move_block(
+        self,
+        block_id: uuid.UUID,
+        new_parent_id: uuid.UUID,
+        new_position: int
+    ) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            # The parent's path is read again once its ancestors are
+            # locked, until every ancestor it names is.
+            locked: Set[uuid.UUID] = set()
+            while True:
+                await cursor.execute(
+                    f"""
+                    SELECT path, ARRAY(SELECT id FROM blocks WHERE path @> ARRAY[%s]::uuid[]) AS subtree
+                    FROM blocks
+                    WHERE id = %s AND deleted_at IS NULL
+                    AND {self._live_workspace('blocks')}
+                    """,
+                    (block_id, new_parent_id)
+                )
+                new_parent = await cursor.fetchone()
+                if not new_parent:
+                    return None
+
+                if block_id in new_parent['path']:
+                    raise ValueError(
+                        f"Cannot move block {block_id} into itself or one of its descendants"
+                    )
+
+                subtree = set(new_parent['subtree']) - locked
+                ancestors = set(new_parent['path']) - locked
+                if not subtree and not ancestors:
+                    break
+                for sql, ids in self._move_locks(subtree, ancestors):
+                    await cursor.execute(sql, (ids,))
+                locked |= subtree | ancestors
+
+            await cursor.execute(
+                f"""
+                SELECT b.id, b.parent_id FROM blocks b
+                WHERE b.id = %s AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                """,
+                (block_id,)
+            )
+            block = await cursor.fetchone()
+            if not block:
+                return None
+
+            rank, new_position = await self._rank_for_position(
+                cursor, new_parent_id, block_id, new_position
+            )
+
+            await cursor.execute(
+                """
+                UPDATE blocks d
+                SET path = np.path || d.path[cardinality(m.path):]
+                FROM blocks m, blocks np
+                WHERE m.id = %s AND np.id = %s
+                AND d.path @> ARRAY[m.id]
+                """,
+                (block_id, new_parent_id)
+            )
+
+            await cursor.execute(
+                """
+                UPDATE blocks
+                SET parent_id = %s, rank = %s, updated_at = %s, version = version + 1
+                WHERE id = %s
+                RETURNING *
+                """,
+                (new_parent_id, rank, datetime.now(), block_id)
+            )
+            updated_block = await cursor.fetchone()
+
+            result = dict(updated_block)
+            result['position'] = new_position
+
+            self._invalidate([("block", block_id), ("children", new_parent_id)] + (
+                [("children", block["parent_id"])] if block["parent_id"] else []
+            ))
+            self._tree_move(updated_block["workspace_id"], block_id, new_parent_id, new_position)
+            self.uow.on_commit(partial(self._rebalance_if_needed, new_parent_id, rank))
+            return result
+
+    # Applies a batch of (op_type, block_id, data) operations in one
+    # transaction. Consecutive operations of the same type run as bulk
+    # statements inside a savepoint; when a run fails, its operations are
+    # retried one by one to attribute the error. An atomic batch raises on
+    # the first failed operation, which rolls the whole request back.
+    # Returns one {"block", "error"} dict per operation, in order.
+    async def apply_batch(
+        self, operations: List[Tuple[str, uuid.UUID, Dict[str, Any]]], atomic: bool = False
+    ) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = [{"block": None, "error": None} for _ in operations]
+        rebalances: List[Tuple[uuid.UUID, str]] = []
+
+        async with self.uow.cursor() as cursor:
+            for run in self._batch_runs(operations):
+                pending = [run]
+                while pending:
+                    chunk = pending.pop(0)
+                    tree_patches = {workspace_id: len(patches) for workspace_id, patches in self._tree_patches.items()}
+                    await cursor.execute("SAVEPOINT batch_run")
+                    try:
+                        rebalances.extend(await self._apply_batch_run(cursor, operations, chunk, results))
+                        await cursor.execute("RELEASE SAVEPOINT batch_run")
+                    except Exception as e:
+                        await cursor.execute("ROLLBACK TO SAVEPOINT batch_run")
+                        # Tree changes from the rolled back run never happened.
+                        for workspace_id, patches in self._tree_patches.items():
+                            del patches[tree_patches.get(workspace_id, 0):]
+                        if len(chunk) > 1:
+                            pending = [[index] for index in chunk] + pending
+                            continue
+                        results[chunk[0]] = {"block": None, "error": str(e)}
+
+                    if atomic:
+                        failed = next((i for i in chunk if results[i]["error"]), None)
+                        if failed is not None:
+                            op_type, block_id, _ = operations[failed]
+                            raise ValueError(
+                                f"Batch rolled back: operation {failed} ({op_type} {block_id}) "
+                                f"failed: {results[failed]['error']}"
+                            )
+
+        for parent_id, rank in rebalances:
+            self.uow.on_commit(partial(self._rebalance_if_needed, parent_id, rank))
+        return results
+
+    async def _apply_batch_run(
+        self,
+        cursor,
+        operations: List[Tuple[str, uuid.UUID, Dict[str, Any]]],
+        run: List[int],
+        results: List[Dict[str, Any]]
+    ) -> List[Tuple[uuid.UUID, str]]:
+        handlers = {
+            "create": self._batch_create,
+            "update": self._batch_update,
+            "move": self._batch_move,
+            "delete": self._batch_delete,
+        }
+        op_type = operations[run[0]][0]
+        return await handlers[op_type](cursor, [(index, *operations[index][1:]) for index in run], results)
+
+    async def _load_siblings(self, cursor, parent_ids: Set[uuid.UUID]) -> Dict[uuid.UUID, List[Tuple[str, uuid.UUID]]]:
+        if not parent_ids:
+            return {}
+
+        # Same lock as _rank_for_position, taken in a stable order.
+        await cursor.execute(
+            """
+            SELECT id FROM blocks
+            WHERE id = ANY(%s)
+            ORDER BY id
+            FOR KEY SHARE
+            """,
+            (list(parent_ids),)
+        )
+        siblings: Dict[uuid.UUID, List[Tuple[str, uuid.UUID]]] = {parent_id: [] for parent_id in parent_ids}
+        await cursor.execute(
+            """
+            SELECT parent_id, id, rank
+            FROM blocks
+            WHERE parent_id = ANY(%s)
+            ORDER BY parent_id, rank, id
+            """,
+            (list(parent_ids),)
+        )
+        for row in await cursor.fetchall():
+            siblings[row["parent_id"]].append((row["rank"], row["id"]))
+
+        # Concurrent inserts can leave equal keys; no key fits between them.
+        tied = [
+            parent_id for parent_id, ranks in siblings.items()
+            if any(a[0] == b[0] for a, b in zip(ranks, ranks[1:]))
+        ]
+        if tied:
+            for parent_id in tied:
+                await self._rebalance_ranks(cursor, parent_id)
+            return await self._load_siblings(cursor, parent_ids)
+
+        return siblings
+
+    async def _batch_positions(self, cursor, block_ids: List[uuid.UUID]) -> Dict[uuid.UUID, Tuple[uuid.UUID, int]]:
+        await cursor.execute(
+            f"""
+            WITH batch AS (
+                SELECT id, parent_id FROM blocks
+                WHERE id = ANY(%s) AND parent_id IS NOT NULL
+            ),
+            {self._positions_cte('batch')}
+            SELECT batch.id, batch.parent_id, positions.position
+            FROM batch
+            JOIN positions ON positions.id = batch.id
+            """,
+            (block_ids,)
+        )
+        return {
+            row["id"]: (row["parent_id"], row["position"])
+            for row in await cursor.fetchall()
+        }
+
+    async def _batch_create(
+        self,
+        cursor,
+        ops: List[Tuple[int, uuid.UUID, Dict[str, Any]]],
+        results: List[Dict[str, Any]]
+    ) -> List[Tuple[uuid.UUID, str]]:
+        await cursor.execute(self._lock_live_workspaces_sql, (list({data["workspace_id"] for _, _, data in ops}),))
+        workspace_ids = {row["id"] for row in await cursor.fetchall()}
+
+        parent_ids = {data["parent_id"] for _, _, data in ops if data.get("parent_id")}
+        paths: Dict[uuid.UUID, List[uuid.UUID]] = {}
+        if parent_ids:
+            await cursor.execute(
+                f"""
+                SELECT id, path FROM blocks
+                WHERE id = ANY(%s) AND deleted_at IS NULL
+                AND {self._live_workspace('blocks')}
+                """,
+                (list(parent_ids),)
+            )
+            paths = {row["id"]: row["path"] for row in await cursor.fetchall()}
+        siblings = await self._load_siblings(cursor, set(paths))
+
+        block_rows = []
+        link_rows = []
+        placed: Dict[uuid.UUID, Tuple[Optional[uuid.UUID], int]] = {}
+        for index, block_id, data in ops:
+            if data["workspace_id"] not in workspace_ids:
+                results[index] = {"block": None, "error": f"Workspace with ID {data['workspace_id']} not found"}
+                continue
+
+            parent_id = data.get("parent_id")
+            position = 0
+            rank = None
+            if parent_id:
+                if parent_id not in paths:
+                    results[index] = {"block": None, "error": f"Parent block with ID {parent_id} not found"}
+                    continue
+                rank, position = self._insert_sibling(
+                    siblings.setdefault(parent_id, []), block_id, data.get("position", 0)
+                )
+                link_rows.append((parent_id, block_id, rank))
+
+            paths[block_id] = (paths[parent_id] if parent_id else []) + [block_id]
+            placed[block_id] = (parent_id, position)
+            block_rows.append((
+                block_id, data["type"], Jsonb(data.get("properties") or {}),
+                data["workspace_id"], parent_id, rank, paths[block_id]
+            ))
+
+        if not block_rows:
+            return []
+
+        await cursor.executemany(
+            """
+            INSERT INTO blocks (id, type, properties, workspace_id, parent_id, rank, path)
+            VALUES (%s, %s, %s, %s, %s, %s, %s::uuid[])
+            RETURNING *
+            """,
+            block_rows,
+            returning=True
+        )
+        created = []
+        async for _ in cursor.results():
+            created.extend(await cursor.fetchall())
+
+        blocks = {row["id"]: dict(row) for row in created}
+        self._invalidate(
+            [("children", block_id) for block_id in blocks]
+            + [("children", parent_id) for parent_id in {parent_id for parent_id, _, _ in link_rows}]
+        )
+        for index, block_id, _ in ops:
+            if block_id in blocks:
+                block = blocks[block_id]
+                block["parent_id"], block["position"] = placed[block_id]
+                results[index] = {"block": block, "error": None}
+                self._tree_insert(block, block["parent_id"], block["position"])
+
+        return [(parent_id, rank) for parent_id, _, rank in link_rows]
+
+    async def _batch_update(
+        self,
+        cursor,
+        ops: List[Tuple[int, uuid.UUID, Dict[str, Any]]],
+        results: List[Dict[str, Any]]
+    ) -> List[Tuple[uuid.UUID, str]]:
+        # Patch chains differ per block and cannot share one statement.
+        bulk = []
+        for index, block_id, data in ops:
+            if not data.get("patches"):
+                bulk.append((index, block_id, data))
+                continue
+            try:
+                block = await self._update_block(
+                    cursor, block_id, data.get("properties"), data.get("type"),
+                    data["patches"], data.get("expected_version")
+                )
+                error = None if block else f"Block with ID {block_id} not found"
+            except VersionConflictError as e:
+                block, error = None, str(e)
+            results[index] = {"block": block, "error": error}
+
+        if not bulk:
+            return []
+
+        values = [
+            (
+                block_id,
+                Jsonb(data["properties"]) if data.get("properties") else None,
+                data.get("type"),
+                datetime.now(),
+                data.get("expected_version")
+            )
+            for _, block_id, data in bulk
+        ]
+        await cursor.execute(
+            f"""
+            UPDATE blocks b
+            SET properties = CASE WHEN v.properties IS NULL THEN b.properties
+                                  ELSE COALESCE(b.properties, '{{}}'::jsonb) || v.properties
+                             END,
+                type = COALESCE(v.type, b.type),
+                updated_at = v.updated_at,
+                version = b.version + 1
+            FROM unnest(
+                %s::uuid[], %s::jsonb[], %s::varchar[], %s::timestamp[], %s::integer[]
+            ) AS v(id, properties, type, updated_at, expected_version)
+            WHERE b.id = v.id AND b.deleted_at IS NULL
+            AND {self._live_workspace('b')}
+            AND (v.expected_version IS NULL OR b.version = v.expected_version)
+            RETURNING b.*
+            """,
+            [list(column) for column in zip(*values)]
+        )
+
+        blocks = {row["id"]: dict(row) for row in await cursor.fetchall()}
+        self._invalidate([("block", block_id) for block_id in blocks])
+        positions = await self._batch_positions(cursor, list(blocks))
+
+        missing = [block_id for _, block_id, _ in bulk if block_id not in blocks]
+        versions: Dict[uuid.UUID, int] = {}
+        if missing:
+            await cursor.execute(
+                f"""
+                SELECT id, version FROM blocks
+                WHERE id = ANY(%s) AND deleted_at IS NULL
+                AND {self._live_workspace('blocks')}
+                """,
+                (missing,)
+            )
+            versions = {row["id"]: row["version"] for row in await cursor.fetchall()}
+
+        for index, block_id, _ in bulk:
+            if block_id in versions:
+                results[index] = {"block": None, "error": str(VersionConflictError(block_id, versions[block_id]))}
+                continue
+            if block_id not in blocks:
+                results[index] = {"block": None, "error": f"Block with ID {block_id} not found"}
+                continue
+            block = blocks[block_id]
+            block["parent_id"], block["position"] = positions.get(block_id, (None, 0))
+            results[index] = {"block": block, "error": None}
+            self._tree_update(block)
+
+        return []
+
+    async def _batch_move(
+        self,
+        cursor,
+        ops: List[Tuple[int, uuid.UUID, Dict[str, Any]]],
+        results: List[Dict[str, Any]]
+    ) -> List[Tuple[uuid.UUID, str]]:
+        # Locked as in move_block, then read again until every ancestor of
+        # the new parents is locked.
+        ids = {block_id for _, block_id, _ in ops} | {data.get("parent_id") for _, _, data in ops}
+        locked: Set[uuid.UUID] = set()
+        while True:
+            await cursor.execute(
+                f"""
+                SELECT b.id, b.path, b.parent_id
+                FROM blocks b
+                WHERE b.id = ANY(%s) AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                """,
+                ([i for i in ids if i],)
+            )
+            found = {row["id"]: row for row in await cursor.fetchall()}
+            await cursor.execute(
+                """
+                SELECT id FROM blocks
+                WHERE path && %s::uuid[]
+                """,
+                ([block_id for _, block_id, _ in ops if block_id in found],)
+            )
+
+            subtrees = {row["id"] for row in await cursor.fetchall()} - locked
+            ancestors = {
+                ancestor_id
+                for _, _, data in ops if data.get("parent_id") in found
+                for ancestor_id in found[data["parent_id"]]["path"]
+            } - locked - subtrees
+            if not subtrees and not ancestors:
+                break
+            for sql, lock_ids in self._move_locks(subtrees, ancestors):
+                await cursor.execute(sql, (lock_ids,))
+            locked |= subtrees | ancestors
+
+        moves = []
+        for index, block_id, data in ops:
+            parent_id = data.get("parent_id")
+            if block_id not in found:
+                results[index] = {"block": None, "error": f"Block with ID {block_id} not found"}
+            elif parent_id not in found:
+                results[index] = {"block": None, "error": f"Parent block with ID {parent_id} not found"}
+            elif block_id in found[parent_id]["path"]:
+                results[index] = {
+                    "block": None,
+                    "error": f"Cannot move block {block_id} into itself or one of its descendants"
+                }
+            else:
+                moves.append((index, block_id, parent_id, data.get("position", 0)))
+
+        if not moves:
+            return []
+
+        parent_ids = {parent_id for _, _, parent_id, _ in moves}
+        parent_ids |= {found[block_id]["parent_id"] for _, block_id, _, _ in moves} - {None}
+        siblings = await self._load_siblings(cursor, parent_ids)
+
+        link_rows = []
+        for _, block_id, parent_id, position in moves:
+            old_parent_id = found[block_id]["parent_id"]
+            if old_parent_id:
+                siblings[old_parent_id][:] = [s for s in siblings[old_parent_id] if s[1] != block_id]
+            rank, position = self._insert_sibling(siblings[parent_id], block_id, position)
+            link_rows.append((block_id, parent_id, rank, position))
+
+        moved_ids = [block_id for block_id, _, _, _ in link_rows]
+        links = [
+            moved_ids,
+            [parent_id for _, parent_id, _, _ in link_rows],
+            [rank for _, _, rank, _ in link_rows],
+        ]
+        await cursor.execute(
+            """
+            UPDATE blocks b
+            SET parent_id = v.parent_id, rank = v.rank
+            FROM unnest(%s::uuid[], %s::uuid[], %s::varchar[]) AS v(id, parent_id, rank)
+            WHERE b.id = v.id
+            """,
+            links
+        )
+
+        # Rebuild the paths of every moved subtree from the new parents. Blocks
+        # that are not reachable from an unaffected parent form a cycle. The
+        # update repeats the path filter, which every rebuilt row passes:
+        # the recursion is estimated far too large for an index plan without.
+        await cursor.execute(
+            """
+            SELECT COUNT(*) AS affected FROM blocks
+            WHERE path && %s::uuid[]
+            """,
+            (moved_ids,)
+        )
+        affected = (await cursor.fetchone())["affected"]
+        await cursor.execute(
+            """
+            WITH RECURSIVE affected AS (
+                SELECT id, parent_id FROM blocks
+                WHERE path && %(moved)s::uuid[]
+            ),
+            rebuilt AS (
+                SELECT a.id, p.path || a.id AS path
+                FROM affected a
+                JOIN blocks p ON p.id = a.parent_id
+                WHERE p.id NOT IN (SELECT id FROM affected)
+                UNION ALL
+                SELECT c.id, r.path || c.id
+                FROM rebuilt r
+                JOIN blocks c ON c.parent_id = r.id
+            )
+            UPDATE blocks b
+            SET path = rebuilt.path
+            FROM rebuilt
+            WHERE b.id = rebuilt.id
+            AND b.path && %(moved)s::uuid[]
+            """,
+            {"moved": moved_ids}
+        )
+        if cursor.rowcount != affected:
+            raise ValueError("Cannot move a block into itself or one of its descendants")
+
+        await cursor.execute(
+            """
+            UPDATE blocks
+            SET updated_at = %s, version = version + 1
+            WHERE id = ANY(%s)
+            RETURNING *
+            """,
+            (datetime.now(), moved_ids)
+        )
+        blocks = {row["id"]: dict(row) for row in await cursor.fetchall()}
+        self._invalidate(
+            [("block", block_id) for block_id in moved_ids]
+            + [("children", parent_id) for parent_id in parent_ids]
+        )
+
+        for (index, *_), (block_id, parent_id, _, position) in zip(moves, link_rows):
+            block = blocks[block_id]
+            block["parent_id"], block["position"] = parent_id, position
+            results[index] = {"block": block, "error": None}
+            self._tree_move(block["workspace_id"], block_id, parent_id, position)
+
+        return [(parent_id, rank) for _, parent_id, rank, _ in link_rows]
+
+    async def _batch_delete(
+        self,
+        cursor,
+        ops: List[Tuple[int, uuid.UUID, Dict[str, Any]]],
+        results: List[Dict[str, Any]]
+    ) -> List[Tuple[uuid.UUID, str]]:
+        await cursor.execute(
+            f"""
+            SELECT * FROM blocks
+            WHERE id = ANY(%s) AND deleted_at IS NULL
+            AND {self._live_workspace('blocks')}
+            ORDER BY id
+            FOR UPDATE
+            """,
+            ([block_id for _, block_id, _ in ops],)
+        )
+        blocks = {row["id"]: dict(row) for row in await cursor.fetchall()}
+
+        if blocks:
+            await cursor.execute(
+                """
+                WITH removed AS (
+                    DELETE FROM blocks
+                    WHERE path && %s::uuid[]
+                    RETURNING id, parent_id
+                )
+                SELECT ARRAY(SELECT id FROM removed) AS removed,
+                       ARRAY(SELECT DISTINCT parent_id FROM removed WHERE parent_id IS NOT NULL) AS parents
+                """,
+                (list(blocks),)
+            )
+            self._invalidate_removed(
+                await cursor.fetchone(), {block["workspace_id"] for block in blocks.values()}
+            )
+
+        for index, block_id, _ in ops:
+            if block_id in blocks:
+                results[index] = {"block": blocks[block_id], "error": None}
+            else:
+                results[index] = {"block": None, "error": f"Block with ID {block_id} not found"}
+
+        return []
+
+    # Bulk-loads (id, parent_id, position, type, properties) rows with COPY
+    # into a staging table, validates them set-wise and merges them in one
+    # transaction. Parents are either other imported rows or existing blocks
+    # of the workspace; children of existing blocks are appended after their
+    # current content. Returns the number of imported blocks.
+    async def import_blocks(
+        self,
+        workspace_id: uuid.UUID,
+        rows: Iterable[Tuple[uuid.UUID, Optional[uuid.UUID], int, str, Dict[str, Any]]]
+    ) -> int:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        parent_ids: Set[uuid.UUID] = set()
+        for block_id, parent_id, position, block_type, properties in rows:
+            writer.writerow((block_id, parent_id or "", position, block_type, json.dumps(properties)))
+            if parent_id:
+                parent_ids.add(parent_id)
+
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(self._lock_live_workspaces_sql, ([workspace_id],))
+            if not await cursor.fetchone():
+                raise ValueError(f"Workspace with ID {workspace_id} not found")
+
+            await cursor.execute(
+                """
+                CREATE TEMP TABLE import_blocks (
+                    id uuid NOT NULL,
+                    parent_id uuid,
+                    position bigint NOT NULL,
+                    type varchar(50) NOT NULL,
+                    properties jsonb NOT NULL
+                ) ON COMMIT DROP
+                """
+            )
+            async with cursor.copy(
+                """
+                COPY import_blocks (id, parent_id, position, type, properties)
+                FROM STDIN WITH (FORMAT csv)
+                """
+            ) as copy:
+                await copy.write(buffer.getvalue())
+            staged = cursor.rowcount
+            await cursor.execute("CREATE INDEX ON import_blocks (id)")
+            await cursor.execute("CREATE INDEX ON import_blocks (parent_id)")
+            await cursor.execute("ANALYZE import_blocks")
+
+            await self._validate_import(cursor, workspace_id)
+
+            await cursor.execute(
+                """
+                SELECT DISTINCT i.parent_id
+                FROM import_blocks i
+                JOIN blocks b ON b.id = i.parent_id
+                ORDER BY i.parent_id
+                """
+            )
+            existing_parents = [row["parent_id"] for row in await cursor.fetchall()]
+            if existing_parents:
+                await cursor.execute(
+                    """
+                    SELECT id FROM blocks
+                    WHERE id = ANY(%s)
+                    ORDER BY id
+                    FOR KEY SHARE
+                    """,
+                    (existing_parents,)
+                )
+
+            # Paths are built walking down from roots and children of
+            # existing blocks; rows never reached sit on a parent cycle.
+            # Sibling keys are evenly spaced in import order, prefixed with
+            # the current last key under existing parents so they sort
+            # after it.
+            await cursor.execute(
+                """
+                WITH RECURSIVE rebuilt AS (
+                    SELECT i.id, COALESCE(p.path, ARRAY[]::uuid[]) || i.id AS path
+                    FROM import_blocks i
+                    LEFT JOIN blocks p ON p.id = i.parent_id
+                    WHERE i.parent_id IS NULL OR p.id IS NOT NULL
+                    UNION ALL
+                    SELECT i.id, r.path || i.id
+                    FROM rebuilt r
+                    JOIN import_blocks i ON i.parent_id = r.id
+                )
+                INSERT INTO blocks (id, type, properties, workspace_id, parent_id, rank, path)
+                SELECT i.id, i.type, i.properties, %s, i.parent_id,
+                       CASE WHEN i.parent_id IS NOT NULL THEN
+                           COALESCE(last.rank, '') || rtrim(lpad(ROW_NUMBER() OVER (
+                               PARTITION BY i.parent_id
+                               ORDER BY i.position, i.id
+                           )::text, %s, '0'), '0')
+                       END,
+                       r.path
+                FROM import_blocks i
+                JOIN rebuilt r ON r.id = i.id
+                LEFT JOIN (
+                    SELECT parent_id, MAX(rank) AS rank
+                    FROM blocks
+                    WHERE parent_id = ANY(%s)
+                    GROUP BY parent_id
+                ) last ON last.parent_id = i.parent_id
+                """,
+                (workspace_id, REBALANCED_RANK_WIDTH, existing_parents)
+            )
+            imported = cursor.rowcount
+            if imported != staged:
+                await cursor.execute(
+                    """
+                    SELECT i.id FROM import_blocks i
+                    WHERE NOT EXISTS (SELECT 1 FROM blocks b WHERE b.id = i.id)
+                    LIMIT 1
+                    """
+                )
+                raise ValueError(f"Block {(await cursor.fetchone())['id']} is part of a parent cycle")
+
+            await cursor.execute(
+                """
+                SELECT parent_id, MAX(rank) AS rank
+                FROM blocks
+                WHERE parent_id = ANY(%s)
+                GROUP BY parent_id
+                """,
+                (existing_parents,)
+            )
+            appended = await cursor.fetchall()
+
+        self._invalidate([("children", parent_id) for parent_id in parent_ids])
+        self._patch_tree(workspace_id, TreeSnapshot.discard, None)
+        for row in appended:
+            self.uow.on_commit(partial(self._rebalance_if_needed, row["parent_id"], row["rank"]))
+        return imported
+
+    async def _validate_import(self, cursor, workspace_id: uuid.UUID) -> None:
+        for query, message in self._import_checks:
+            await cursor.execute(query, {"workspace_id": workspace_id})
+            row = await cursor.fetchone()
+            if row:
+                raise ValueError(message.format(row["id"]))
+
+    async def get_blocks_tree(
+        self,
+        workspace_id: uuid.UUID,
+        parent_id: Optional[uuid.UUID] = None,
+        depth: Optional[int] = None,
+        max_children: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        subtree_filter = ""
+        if parent_id:
+            subtree_filter = """
+                AND b.path @> ARRAY[%(parent_id)s::uuid]
+                AND b.id <> %(parent_id)s
+            """
+
+        async with self.uow.cursor() as cursor:
+            if depth or max_children:
+                anchor = f"""
+                    SELECT b.id, b.type, b.properties, b.workspace_id, b.version,
+                           NULL::uuid as parent_id,
+                           NULL::varchar COLLATE "C" as rank,
+                           0::bigint as position,
+                           false as overflow,
+                           0 as depth,
+                           b.created_at
+                    FROM blocks b
+                    WHERE b.workspace_id = %(workspace_id)s
+                    AND b.deleted_at IS NULL
+                    AND {self._live_workspace('b')}
+                    AND b.parent_id IS NULL
+                """
+                return await self._fetch_limited_tree(
+                    cursor, anchor, {"workspace_id": workspace_id},
+                    depth - 1 if depth else None, max_children
+                )
+
+            await cursor.execute(
+                f"""
+                SELECT b.id, b.type, b.properties, b.workspace_id, b.parent_id,
+                       0 as position
+                FROM blocks b
+                WHERE b.workspace_id = %(workspace_id)s
+                AND b.deleted_at IS NULL
+                AND {self._live_workspace('b')}
+                {subtree_filter}
+                ORDER BY cardinality(b.path), b.rank, CASE WHEN b.parent_id IS NULL THEN b.created_at END, b.id
+                """,
+                {"workspace_id": workspace_id, "parent_id": parent_id}
+            )
+            return self._build_tree(await cursor.fetchall(), parent_id)
+
+    # Versions for conditional requests: every committed change to a
+    # workspace's tree bumps its tree_version, so one primary key lookup
+    # tells whether a tree or block response can have changed.
+    async def get_tree_version(self, workspace_id: uuid.UUID) -> Optional[int]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT tree_version FROM workspaces
+                WHERE id = %s AND deleted_at IS NULL
+                """,
+                (workspace_id,),
+                prepare=self.uow.prepare
+            )
+            workspace = await cursor.fetchone()
+            return workspace["tree_version"] if workspace else None
+
+    async def get_block_tree_version(self, block_id: uuid.UUID) -> Optional[int]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT w.tree_version FROM blocks b
+                JOIN workspaces w ON w.id = b.workspace_id
+                WHERE b.id = %s AND b.deleted_at IS NULL
+                AND w.deleted_at IS NULL
+                """,
+                (block_id,),
+                prepare=self.uow.prepare
+            )
+            workspace = await cursor.fetchone()
+            return workspace["tree_version"] if workspace else None
+
+    # The full tree as JSON and the tree_version it reflects, served from
+    # the workspace's snapshot while that is still at `version`. None if
+    # the workspace is deleted or gone by the time the tree is read, so no
+    # snapshot of a deleted workspace is built or cached.
+    async def get_blocks_tree_body(
+        self, workspace_id: uuid.UUID, version: int, output_format: str = JSON
+    ) -> Optional[Tuple[int, bytes]]:
+        if not self.uow.invalidated:
+            body = self.tree_snapshots.body(workspace_id, version, output_format)
+            if body is not None:
+                return version, body
+
+        # The version is read in the same statement as the rows, so the
+        # snapshot is labelled with the version it actually reflects.
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT w.tree_version, t.*
+                FROM workspaces w
+                LEFT JOIN LATERAL (
+                    SELECT b.id, b.type, b.properties, b.workspace_id, b.parent_id,
+                           0 as position,
+                           b.created_at,
+                           cardinality(b.path) as depth,
+                           b.rank
+                    FROM blocks b
+                    WHERE b.workspace_id = w.id
+                    AND b.deleted_at IS NULL
+                ) t ON true
+                WHERE w.id = %s AND w.deleted_at IS NULL
+                ORDER BY t.depth, t.rank, CASE WHEN t.parent_id IS NULL THEN t.created_at END, t.id
+                """,
+                (workspace_id,)
+            )
+            rows = await cursor.fetchall()
+        if not rows:
+            return None
+
+        root_keys = {}
+        tree_rows = []
+        for row in rows:
+            if row["id"] is None:
+                continue
+            if row["parent_id"] is None:
+                root_keys[row["id"]] = (row["created_at"], row["id"])
+            tree_rows.append({
+                key: row[key]
+                for key in ("id", "type", "properties", "workspace_id", "parent_id", "position")
+            })
+
+        snapshot = TreeSnapshot(rows[0]["tree_version"], self._build_tree(tree_rows), root_keys)
+        if not self.uow.invalidated and not self._tree_patches:
+            self.tree_snapshots.put(workspace_id, snapshot)
+        return snapshot.version, snapshot.body(output_format)
+
+    async def _fetch_limited_tree(
+        self,
+        cursor,
+        anchor: str,
+        params: Dict[str, Any],
+        max_depth: Optional[int],
+        max_children: Optional[int],
+        after: Optional[Tuple[str, uuid.UUID, int]] = None
+    ) -> List[Dict[str, Any]]:
+        await cursor.execute(*self._limited_tree_query(anchor, params, max_depth, max_children, after))
+        return self._assemble_limited_tree(await cursor.fetchall())
+
+    async def iter_blocks_tree(
+        self, workspace_id: uuid.UUID, batch_size: int = 2000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Same visibility as get_blocks_tree: walking down from the roots
+        # drops deleted blocks together with everything below them. Each
+        # sort key element is "<sibling key>/<id>"; '/' sorts below every
+        # rank digit, so the array order is a depth-first pre-order.
+        conn = await self.pool.getconn()
+        try:
+            async with conn.cursor(
+                name=f"iter_tree_{uuid.uuid4().hex}", row_factory=dict_row
+            ) as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute(
+                    f"""
+                    WITH RECURSIVE tree AS (
+                        SELECT b.id, b.type, b.properties, b.workspace_id,
+                               NULL::uuid as parent_id,
+                               0::bigint as position,
+                               0 as depth,
+                               ARRAY[
+                                   (to_char(b.created_at, 'YYYYMMDDHH24MISSUS') || '/' || b.id::text) COLLATE "C"
+                               ] as sort_key
+                        FROM blocks b
+                        WHERE b.workspace_id = %(workspace_id)s
+                        AND b.deleted_at IS NULL
+                        AND {self._live_workspace('b')}
+                        AND b.parent_id IS NULL
+                        UNION ALL
+                        SELECT c.id, c.type, c.properties, c.workspace_id,
+                               t.id as parent_id,
+                               ROW_NUMBER() OVER (
+                                   PARTITION BY t.id
+                                   ORDER BY c.rank, c.id
+                               ) - 1 as position,
+                               t.depth + 1 as depth,
+                               t.sort_key || (c.rank || '/' || c.id::text)
+                        FROM tree t
+                        JOIN blocks c ON c.parent_id = t.id
+                        WHERE c.workspace_id = %(workspace_id)s
+                        AND c.deleted_at IS NULL
+                    )
+                    SELECT id, type, properties, workspace_id, parent_id, position, depth
+                    FROM tree
+                    ORDER BY sort_key
+                    """,
+                    {"workspace_id": workspace_id}
+                )
+                async for row in cursor:
+                    yield row
+        finally:
+            await conn.rollback()
+            await self.pool.putconn(conn)
+
+    async def get_block_ancestors(self, block_id: uuid.UUID) -> Optional[List[Dict[str, Any]]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT path FROM blocks
+                WHERE id = %s AND deleted_at IS NULL
+                AND {self._live_workspace('blocks')}
+                """,
+                (block_id,)
+            )
+            block = await cursor.fetchone()
+            if not block:
+                return None
+
+            await cursor.execute(
+                """
+                SELECT a.id, a.type, a.properties, a.workspace_id, a.parent_id,
+                       (
+                           SELECT COUNT(*) FROM blocks s
+                           WHERE s.parent_id = a.parent_id
+                           AND (s.rank, s.id) < (a.rank, a.id)
+                       ) as position
+                FROM unnest(%s::uuid[]) WITH ORDINALITY AS p(id, depth)
+                JOIN blocks a ON a.id = p.id
+                WHERE a.id <> %s AND a.deleted_at IS NULL
+                ORDER BY p.depth
+                """,
+                (block['path'], block_id)
+            )
+            return [dict(ancestor) for ancestor in await cursor.fetchall()]
@@ -0,0 +1,102 @@
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterable, List, Set
+
+from psycopg import AsyncCursor
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+
+from utils.cache import Cache
+from utils.invalidation import publish_changes
+from utils.metrics import DB_POOL_WAIT_SECONDS
+
+
+# One pooled connection and one transaction per request, shared by every
+# repository and checked out on first use.
+#
+# Repositories pass `prepare` to the executes of their hot queries. psycopg
+# keeps prepared statements per connection and prepares them again on a
+# fresh one, so they survive the pool replacing connections. Off unless
+# the caller passes postgres_db_prepared_statements, which is false
+# behind PgBouncer.
+#
+# With `notify`, the cache invalidations and tree versions of a transaction
+# are also published to the other processes as it commits.
+class AsyncUnitOfWork:
+    def __init__(self, pool: AsyncConnectionPool, prepare: bool = False, notify: bool = False):
+        self.pool = pool
+        self.prepare = prepare
+        self.notify = notify
+        self.invalidated = False
+        self._conn = None
+        self._before_commit: List[Callable[[], Awaitable[None]]] = []
+        self._on_commit: List[Callable[[], None]] = []
+        self._invalidations: Dict[str, Set[Hashable]] = {}
+        self._tree_versions: Dict[uuid.UUID, int] = {}
+
+    async def connection(self):
+        if self._conn is None:
+            started = time.perf_counter()
+            try:
+                self._conn = await self.pool.getconn()
+            finally:
+                DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+        return self._conn
+
+    @asynccontextmanager
+    async def cursor(self, row_factory=dict_row) -> AsyncIterator[AsyncCursor]:
+        connection = await self.connection()
+        async with connection.cursor(row_factory=row_factory) as cursor:
+            yield cursor
+
+    # Runs inside the transaction, right before it commits.
+    def before_commit(self, callback: Callable[[], Awaitable[None]]) -> None:
+        self._before_commit.append(callback)
+
+    # Runs after a successful commit; dropped on rollback.
+    def on_commit(self, callback: Callable[[], None]) -> None:
+        self._on_commit.append(callback)
+
+    # Cache entries are dropped once the writes behind them commit. Until
+    # then this transaction sees data other requests do not, so its reads
+    # bypass the caches.
+    def invalidate(self, cache: Cache, tags: Iterable[Hashable]) -> None:
+        tags = list(tags)
+        self.invalidated = True
+        self.on_commit(partial(cache.invalidate, tags))
+        self._invalidations.setdefault(cache.name, set()).update(tags)
+
+    def tree_changed(self, workspace_id: uuid.UUID, version: int) -> None:
+        self._tree_versions[workspace_id] = version
+
+    async def commit(self) -> None:
+        callbacks, self._before_commit = self._before_commit, []
+        for callback in callbacks:
+            await callback()
+
+        if self._conn is not None:
+            if self.notify and (self._invalidations or self._tree_versions):
+                async with self._conn.cursor() as cursor:
+                    await publish_changes(cursor, self._invalidations, self._tree_versions)
+            await self._conn.commit()
+        self._invalidations, self._tree_versions = {}, {}
+
+        callbacks, self._on_commit = self._on_commit, []
+        self.invalidated = False
+        for callback in callbacks:
+            callback()
+
+    async def rollback(self) -> None:
+        self._before_commit = []
+        self._on_commit = []
+        self._invalidations, self._tree_versions = {}, {}
+        self.invalidated = False
+        if self._conn is not None:
+            await self._conn.rollback()
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self.pool.putconn(self._conn)
+            self._conn = None
@@ -0,0 +1,294 @@
+import uuid
+from datetime import datetime
+from functools import partial
+from typing import List, Dict, Optional, Any
+
+from repositories.async_unit_of_work import AsyncUnitOfWork
+
+from utils.cache import Cache
+from utils.tree_snapshot import TreeSnapshotCache
+
+
+# Workspace reads and writes for the request handlers and services.
+# Deleting a workspace drops its blocks and tree from the caches. The
+# change log is written by AsyncBlockRepository and read from here.
+# Blocks of deleted workspaces are purged in the background through
+# reap_deleted.
+class AsyncWorkspaceRepository:
+    def __init__(
+        self,
+        unit_of_work: AsyncUnitOfWork,
+        block_cache: Optional[Cache] = None,
+        tree_snapshots: Optional[TreeSnapshotCache] = None
+    ):
+        self.uow = unit_of_work
+        self.block_cache = block_cache if block_cache is not None else Cache()
+        self.tree_snapshots = tree_snapshots if tree_snapshots is not None else TreeSnapshotCache(0)
+
+    async def get_all(self) -> List[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT id, name, description, created_at, updated_at
+                FROM workspaces
+                WHERE deleted_at IS NULL
+                ORDER BY created_at DESC
+            """
+            )
+            return await cursor.fetchall()
+
+    async def get_by_id(self, workspace_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT id, name, description, created_at, updated_at
+                FROM workspaces
+                WHERE id = %s AND deleted_at IS NULL
+            """,
+                (workspace_id,),
+            )
+            return await cursor.fetchone()
+
+    async def create(self, name: str, description: Optional[str] = None) -> Dict[str, Any]:
+        workspace_id = uuid.uuid4()
+        curr_time = datetime.now()
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT INTO workspaces (id, name, description, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING id, name, description, created_at, updated_at
+            """,
+                (workspace_id, name, description, curr_time, curr_time),
+            )
+            return await cursor.fetchone()
+
+    async def update(
+        self,
+        workspace_id: uuid.UUID,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        workspace = await self.get_by_id(workspace_id)
+        if not workspace:
+            return None
+
+        name = name if name is not None else workspace["name"]
+        description = (
+            description if description is not None else workspace["description"]
+        )
+
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                UPDATE workspaces
+                SET name = %s, description = %s, updated_at = NOW()
+                WHERE id = %s
+                RETURNING id, name, description, created_at, updated_at
+            """,
+                (name, description, workspace_id),
+            )
+            return await cursor.fetchone()
+
+    # Only the workspace row is tombstoned, so this is one row however big
+    # the workspace. Its blocks read as deleted from then on and are
+    # purged later by reap_deleted. The FOR UPDATE lock waits for inserts
+    # still holding the row, so none can land after the tombstone.
+    async def delete(self, workspace_id: uuid.UUID) -> bool:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                WITH locked AS (
+                    SELECT id FROM workspaces
+                    WHERE id = %s AND deleted_at IS NULL
+                    FOR UPDATE
+                )
+                UPDATE workspaces w
+                SET deleted_at = %s, tree_version = w.tree_version + 1
+                FROM locked
+                WHERE w.id = locked.id
+                RETURNING w.tree_version
+            """,
+                (workspace_id, datetime.now()),
+            )
+            workspace = await cursor.fetchone()
+            if not workspace:
+                return False
+
+            self.uow.invalidate(self.block_cache, [("workspace", workspace_id)])
+            self.uow.on_commit(partial(self.tree_snapshots.discard, workspace_id))
+            self.uow.tree_changed(workspace_id, workspace["tree_version"])
+            return True
+
+    # Ops committed after version `since`, whole versions at a time: the
+    # page ends with the version holding the `limit`th op. `version` is
+    # where the next poll resumes. A client behind the compacted part of
+    # the log, or ahead of the workspace, gets resync_required and has to
+    # reload the tree. A poll with nothing new reads only the workspace row.
+    async def get_changes(self, workspace_id: uuid.UUID, since: int, limit: int) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT tree_version, changes_floor FROM workspaces
+                WHERE id = %s AND deleted_at IS NULL
+                """,
+                (workspace_id,),
+                prepare=self.uow.prepare
+            )
+            workspace = await cursor.fetchone()
+            if not workspace:
+                return None
+
+            feed = {"version": workspace["tree_version"], "changes": [], "has_more": False, "resync_required": False}
+            if since < workspace["changes_floor"] or since > workspace["tree_version"]:
+                feed["resync_required"] = True
+                return feed
+            if since == workspace["tree_version"]:
+                return feed
+
+            await cursor.execute(
+                """
+                SELECT version, op, data FROM workspace_changes
+                WHERE workspace_id = %(workspace_id)s
+                AND version > %(since)s
+                AND version <= LEAST(%(until)s, (
+                    SELECT max(version) FROM (
+                        SELECT version FROM workspace_changes
+                        WHERE workspace_id = %(workspace_id)s AND version > %(since)s
+                        ORDER BY version, seq
+                        LIMIT %(limit)s
+                    ) page
+                ))
+                ORDER BY version, seq
+                """,
+                {"workspace_id": workspace_id, "since": since, "until": workspace["tree_version"], "limit": limit},
+                prepare=self.uow.prepare
+            )
+            rows = await cursor.fetchall()
+
+        feed["changes"] = [{"version": row["version"], "op": row["op"], **row["data"]} for row in rows]
+        if len(rows) >= limit and rows[-1]["version"] < workspace["tree_version"]:
+            feed["version"] = rows[-1]["version"]
+            feed["has_more"] = True
+        return feed
+
+    # Drops up to `batch_size` log entries older than `retention` seconds
+    # and raises the floor of their workspaces past them. Returns how many
+    # were dropped; callers repeat until that falls short of a batch.
+    # Returns 0 without touching anything while another process compacts.
+    async def compact_changes(self, retention: float, batch_size: int) -> int:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('workspace_changes')) AS locked")
+            if not (await cursor.fetchone())["locked"]:
+                return 0
+
+            await cursor.execute(
+                """
+                WITH expired AS (
+                    SELECT workspace_id, version, seq FROM workspace_changes
+                    WHERE created_at < now() - make_interval(secs => %s)
+                    ORDER BY created_at
+                    LIMIT %s
+                ),
+                removed AS (
+                    DELETE FROM workspace_changes c
+                    USING expired e
+                    WHERE c.workspace_id = e.workspace_id AND c.version = e.version AND c.seq = e.seq
+                    RETURNING c.workspace_id, c.version
+                ),
+                floors AS (
+                    UPDATE workspaces w
+                    SET changes_floor = r.version
+                    FROM (
+                        SELECT workspace_id, max(version) AS version
+                        FROM removed
+                        GROUP BY workspace_id
+                    ) r
+                    WHERE w.id = r.workspace_id AND w.changes_floor < r.version
+                )
+                SELECT count(*) AS removed FROM removed
+                """,
+                (retention, batch_size)
+            )
+            return (await cursor.fetchone())["removed"]
+
+    # Purges up to `batch_size` blocks of the deleted workspace waiting
+    # longest. Once none are left its change log goes too and reaped_at
+    # is set, which is all the progress there is to keep: a restarted
+    # reaper picks up wherever the last committed batch left off. Returns
+    # the workspace and how many blocks went, or None when nothing is
+    # waiting or another process holds the lock.
+    async def reap_deleted(self, batch_size: int) -> Optional[Dict[str, Any]]:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('workspace_reaper')) AS locked")
+            if not (await cursor.fetchone())["locked"]:
+                return None
+
+            await cursor.execute(
+                """
+                SELECT id FROM workspaces
+                WHERE deleted_at IS NOT NULL AND reaped_at IS NULL
+                ORDER BY deleted_at
+                LIMIT 1
+                """
+            )
+            workspace = await cursor.fetchone()
+            if not workspace:
+                return None
+
+            # Children left behind by a chunk are detached in the same
+            # statement; foreign keys are only checked at its end.
+            await cursor.execute(
+                """
+                WITH chunk AS (
+                    SELECT id FROM blocks
+                    WHERE workspace_id = %(workspace_id)s
+                    LIMIT %(batch_size)s
+                ),
+                detached AS (
+                    UPDATE blocks SET parent_id = NULL
+                    WHERE parent_id IN (SELECT id FROM chunk)
+                    AND id NOT IN (SELECT id FROM chunk)
+                ),
+                purged AS (
+                    DELETE FROM blocks
+                    WHERE id IN (SELECT id FROM chunk)
+                    RETURNING id
+                )
+                SELECT count(*) AS purged FROM purged
+                """,
+                {"workspace_id": workspace["id"], "batch_size": batch_size}
+            )
+            purged = (await cursor.fetchone())["purged"]
+
+            done = False
+            if purged < batch_size:
+                await cursor.execute(
+                    """
+                    DELETE FROM workspace_changes WHERE workspace_id = %s
+                    """,
+                    (workspace["id"],)
+                )
+                # A write that raced the tombstone may have added blocks.
+                await cursor.execute(
+                    """
+                    UPDATE workspaces SET reaped_at = now()
+                    WHERE id = %(workspace_id)s
+                    AND NOT EXISTS (SELECT 1 FROM blocks WHERE workspace_id = %(workspace_id)s)
+                    RETURNING id
+                    """,
+                    {"workspace_id": workspace["id"]}
+                )
+                done = await cursor.fetchone() is not None
+
+            return {"workspace_id": workspace["id"], "purged": purged, "done": done}
+
+    async def count_unreaped(self) -> int:
+        async with self.uow.cursor() as cursor:
+            await cursor.execute(
+                """
+                SELECT count(*) AS pending FROM workspaces
+                WHERE deleted_at IS NOT NULL AND reaped_at IS NULL
+                """
+            )
+            return (await cursor.fetchone())["pending"]
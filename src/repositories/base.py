@@ -1,12 +1,12 @@
-from repositories.block_repository import BlockRepository
-from repositories.workspace_repository import WorkspaceRepository
+from repositories.async_block_repository import AsyncBlockRepository
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
 
 
 class Repositories:
     def __init__(
         self, 
-        block: BlockRepository,
-        workspace: WorkspaceRepository
+        block: AsyncBlockRepository,
+        workspace: AsyncWorkspaceRepository
     ):
         self.block = block
         self.workspace = workspace
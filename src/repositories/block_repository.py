@@ -1,590 +1,394 @@
 import uuid
-from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
-
-from psycopg2.extras import RealDictCursor, Json, register_uuid
-from psycopg2.pool import ThreadedConnectionPool
-
-
-class BlockRepository:
-    def __init__(self, pool: ThreadedConnectionPool):
-        self.pool = pool
-        register_uuid()
-    
-    def _get_connection(self):
-        return self.pool.getconn()
-    
-    def _return_connection(self, conn):
-        self.pool.putconn(conn)
-    
-    def create_block(
-        self,
-        block_id: uuid.UUID,
-        block_type: str,
-        properties: Dict[str, Any], 
-        workspace_id: uuid.UUID,
-        parent_id: Optional[uuid.UUID] = None,
-        position: int = 0
-    ) -> Dict[str, Any]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                if parent_id:
-                    self._shift_positions(cursor, parent_id, position)
-                
-                cursor.execute(
-                    """
-                    INSERT INTO blocks (
-                        id, type, properties, workspace_id
-                    ) VALUES (%s, %s, %s, %s)
-                    RETURNING *
-                    """,
-                    (
-                        block_id, block_type, Json(properties), workspace_id
-                    )
-                )
-                block = cursor.fetchone()
-                
-                if parent_id:
-                    cursor.execute(
-                        """
-                        INSERT INTO block_content_association (
-                            parent_block_id, child_block_id, position
-                        ) VALUES (%s, %s, %s)
-                        """,
-                        (parent_id, block_id, position)
-                    )
-                
-                conn.commit()
-                
-                result = dict(block)
-                result['position'] = position
-                result['parent_id'] = parent_id
-                
-                return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            self._return_connection(conn)
-    
-    def _shift_positions(self, cursor, parent_id: uuid.UUID, from_position: int) -> None:
-        cursor.execute(
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from litestar.serialization import encode_json
+
+from utils.pagination import encode_child_cursor
+from utils.ranking import rank_between
+
+
+class VersionConflictError(Exception):
+    def __init__(self, block_id: uuid.UUID, current_version: int):
+        super().__init__(f"Block {block_id} is at version {current_version}")
+        self.block_id = block_id
+        self.current_version = current_version
+
+
+# Driver-independent parts of AsyncBlockRepository: query builders and
+# the assembly of fetched rows. Subclasses set the JSON adapter of their
+# driver.
+class BaseBlockRepository:
+    _json: Callable[[Any], Any]
+
+    _import_checks = [
+        (
             """
-            UPDATE block_content_association
-            SET position = position + 1
-            WHERE parent_block_id = %s AND position >= %s
+            SELECT id FROM import_blocks
+            GROUP BY id HAVING COUNT(*) > 1
+            LIMIT 1
             """,
-            (parent_id, from_position)
+            "Block {} appears more than once in the import"
+        ),
+        (
+            """
+            SELECT i.id FROM import_blocks i
+            JOIN blocks b ON b.id = i.id
+            LIMIT 1
+            """,
+            "Block {} already exists"
+        ),
+        (
+            """
+            SELECT i.parent_id AS id FROM import_blocks i
+            WHERE i.parent_id IS NOT NULL
+            AND NOT EXISTS (SELECT 1 FROM import_blocks p WHERE p.id = i.parent_id)
+            AND NOT EXISTS (
+                SELECT 1 FROM blocks b
+                WHERE b.id = i.parent_id
+                AND b.workspace_id = %(workspace_id)s
+                AND b.deleted_at IS NULL
+            )
+            LIMIT 1
+            """,
+            "Parent block with ID {} not found in the workspace"
+        ),
+        (
+            """
+            SELECT id FROM import_blocks
+            WHERE position < 0
+            LIMIT 1
+            """,
+            "Block {} has a negative position"
+        ),
+        (
+            """
+            SELECT MIN(id::text) AS id FROM import_blocks
+            GROUP BY parent_id, position HAVING COUNT(*) > 1
+            LIMIT 1
+            """,
+            "Block {} shares its position with a sibling"
+        ),
+    ]
+
+    # Blocks of a deleted workspace count as deleted until the reaper
+    # purges them; every block lookup checks the workspace as well.
+    @staticmethod
+    def _live_workspace(table: str) -> str:
+        return f"EXISTS (SELECT 1 FROM workspaces w WHERE w.id = {table}.workspace_id AND w.deleted_at IS NULL)"
+
+    # New blocks only go into a live workspace, whose row stays key-share
+    # locked until commit. Deleting a workspace locks it FOR UPDATE first,
+    # so it waits for those inserts, and inserts after it get no row back.
+    _insert_block_sql = """
+        INSERT INTO blocks (id, type, properties, workspace_id, parent_id, rank, path)
+        SELECT %s, %s, %s, w.id, %s, %s,
+               COALESCE((SELECT path FROM blocks WHERE id = %s), ARRAY[]::uuid[]) || %s::uuid
+        FROM workspaces w
+        WHERE w.id = %s AND w.deleted_at IS NULL
+        FOR KEY SHARE OF w
+        RETURNING *
+    """
+
+    _lock_live_workspaces_sql = """
+        SELECT id FROM workspaces
+        WHERE id = ANY(%s) AND deleted_at IS NULL
+        ORDER BY id
+        FOR KEY SHARE
+    """
+
+    # Writes record how they change each workspace's tree. Before the
+    # transaction commits, every touched workspace's tree_version is bumped
+    # (in id order, so concurrent writers cannot deadlock on it) and the
+    # changes go to its change log under the new version, as upsert, move
+    # and delete ops that clients can replay onto their copy. A change of
+    # None cannot be replayed: the log is cut at this version and clients
+    # behind it have to reload the tree. A deleted workspace is neither
+    # bumped nor logged to.
+    _publish_changes_sql = """
+        WITH bumped AS (
+            UPDATE workspaces
+            SET tree_version = tree_version + 1,
+                changes_floor = CASE WHEN %(replayable)s THEN changes_floor ELSE tree_version + 1 END
+            WHERE id = %(workspace_id)s AND deleted_at IS NULL
+            RETURNING id, tree_version
+        ),
+        logged AS (
+            INSERT INTO workspace_changes (workspace_id, version, seq, op, data)
+            SELECT b.id, b.tree_version, c.seq, c.data->>'op', c.data - 'op'
+            FROM bumped b, unnest(%(changes)s::jsonb[]) WITH ORDINALITY AS c(data, seq)
         )
+        SELECT tree_version FROM bumped
+    """
 
-    def append_block_child(
-        self,
-        block_type: str,
-        properties: Dict[str, Any], 
-        workspace_id: uuid.UUID,
-        parent_id: Optional[uuid.UUID] = None
+    def _publish_changes_params(
+        self, workspace_id: uuid.UUID, changes: List[Optional[Dict[str, Any]]]
     ) -> Dict[str, Any]:
-        conn = self._get_connection()
-        block_id = uuid.uuid4()
-        position = 0
+        replayable = None not in changes
+        return {
+            "workspace_id": workspace_id,
+            "replayable": replayable,
+            "changes": [self._json(change, dumps=encode_json) for change in changes] if replayable else [],
+        }
 
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                if parent_id:
-                    self._shift_positions(cursor, parent_id, position)
-                
-                cursor.execute(
-                    """
-                    INSERT INTO blocks (
-                        id, type, properties, workspace_id
-                    ) VALUES (%s, %s, %s, %s)
-                    RETURNING *
-                    """,
-                    (
-                        block_id, block_type, Json(properties), workspace_id
-                    )
-                )
-                block = cursor.fetchone()
-                
-                if parent_id:
-                    cursor.execute(
-                        """
-                        INSERT INTO block_content_association (
-                            parent_block_id, child_block_id, position
-                        ) VALUES (%s, %s, %s)
-                        """,
-                        (parent_id, block_id, position)
-                    )
-                
-                conn.commit()
-                
-                result = dict(block)
-                result['position'] = position
-                result['parent_id'] = parent_id
-                
-                return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            self._return_connection(conn)
-    
-    def get_block(self, block_id: uuid.UUID) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT id, type, properties, workspace_id FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (block_id,)
-                )
-                block = cursor.fetchone()
-                
-                if not block:
-                    return None
-                
-                position_info = self._get_block_position(block_id)
-                
-                result = dict(block)
-                if position_info:
-                    parent_id, position = position_info
-                    result['position'] = position
-                    result['parent_id'] = parent_id
-                else:
-                    result['position'] = 0
-                    result['parent_id'] = None
-                    
-                return result
-        finally:
-            self._return_connection(conn)
-
-    def get_all(self) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute("""
-                    SELECT b.id, b.type, b.properties, b.workspace_id,
-                           bca.parent_block_id as parent_id,
-                           COALESCE(bca.position, 0) as position
-                    FROM blocks b
-                    LEFT JOIN block_content_association bca ON b.id = bca.child_block_id
-                    WHERE b.deleted_at IS NULL
-                    ORDER BY b.created_at DESC
-                """)
-                return cursor.fetchall()
-        finally:
-            self._return_connection(conn)
-    
-    def get_block_with_content(self, block_id: uuid.UUID) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT id, type, properties, workspace_id FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (block_id,)
-                )
-                block = cursor.fetchone()
-                
-                if not block:
-                    return None
-                
-                position_info = self._get_block_position(block_id)
-                
-                result = dict(block)
-                if position_info:
-                    parent_id, position = position_info
-                    result['position'] = position
-                    result['parent_id'] = parent_id
-                else:
-                    result['position'] = 0
-                    result['parent_id'] = None
-                
-                cursor.execute(
-                    """
-                    SELECT b.id, b.type, b.properties, b.workspace_id,
-                           bca.parent_block_id as parent_id, 
-                           bca.position as position
-                    FROM blocks b
-                    JOIN block_content_association bca ON b.id = bca.child_block_id
-                    WHERE bca.parent_block_id = %s AND b.deleted_at IS NULL
-                    ORDER BY bca.position
-                    """,
-                    (block_id,)
-                )
-                content_blocks = cursor.fetchall()
-                
-                result['content'] = [dict(b) for b in content_blocks]
-                
-                return result
-        finally:
-            self._return_connection(conn)
-    
-    def get_block_children(self, block_id: uuid.UUID) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT b.id, b.type, b.properties, b.workspace_id,
-                           bca.parent_block_id as parent_id, 
-                           bca.position AS position 
-                    FROM blocks b
-                    JOIN block_content_association bca ON b.id = bca.child_block_id
-                    WHERE bca.parent_block_id = %s AND b.deleted_at IS NULL
-                    ORDER BY bca.position
-                    """,
-                    (block_id,)
-                )
-                children = cursor.fetchall()
-                return [dict(child) for child in children]
-        finally:
-            self._return_connection(conn)
-    
-    def _get_block_position(self, block_id: uuid.UUID) -> Optional[Tuple[uuid.UUID, int]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT parent_block_id, position FROM block_content_association
-                    WHERE child_block_id = %s
-                    """,
-                    (block_id,)
-                )
-                result = cursor.fetchone()
-                return result if result else None
-        finally:
-            self._return_connection(conn)
-    
-    def update_block(
-        self, 
-        block_id: uuid.UUID, 
-        properties: Optional[Dict[str, Any]] = None,
-        block_type: Optional[str] = None
-    ) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT * FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (block_id,)
-                )
-                block = cursor.fetchone()
-                
-                if not block:
-                    return None
-                
-                update_parts = []
-                update_values = []
-                
-                if properties:
-                    current_props = block['properties'] or {}
-                    current_props.update(properties)
-                    update_parts.append("properties = %s")
-                    update_values.append(Json(current_props))
-                
-                if block_type:
-                    update_parts.append("type = %s")
-                    update_values.append(block_type)
-                
-                update_parts.append("updated_at = %s")
-                update_values.append(datetime.now())
-                
-                if update_parts:
-                    update_query = f"""
-                        UPDATE blocks SET {', '.join(update_parts)}
-                        WHERE id = %s
-                        RETURNING *
-                    """
-                    update_values.append(block_id)
-                    
-                    cursor.execute(update_query, update_values)
-                    updated_block = cursor.fetchone()
-                    conn.commit()
-                    
-                    result = dict(updated_block)
-                    position_info = self._get_block_position(block_id)
-                    
-                    if position_info:
-                        parent_id, position = position_info
-                        result['position'] = position
-                        result['parent_id'] = parent_id
-                    else:
-                        result['position'] = 0
-                        result['parent_id'] = None
-                        
-                    return result
-                
-                result = dict(block)
-                position_info = self._get_block_position(block_id)
-                
-                if position_info:
-                    parent_id, position = position_info
-                    result['position'] = position
-                    result['parent_id'] = parent_id
-                else:
-                    result['position'] = 0
-                    result['parent_id'] = None
-                    
-                return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            self._return_connection(conn)
-    
-    def delete_block(self, block_id: uuid.UUID) -> bool:
-        conn = self._get_connection()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    """
-                    SELECT id FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (block_id,)
-                )
-                if not cursor.fetchone():
-                    return False
-                
-                position_info = self._get_block_position(block_id)
-                
-                self._delete_children_recursively(cursor, block_id)
-                
-                cursor.execute(
-                    """
-                    DELETE FROM block_content_association
-                    WHERE child_block_id = %s
-                    """,
-                    (block_id,)
-                )
-                
-                cursor.execute(
-                    """
-                    DELETE FROM blocks 
-                    WHERE id = %s
-                    """,
-                    (block_id,)
-                )
-                
-                if position_info:
-                    parent_id, position = position_info
-                    cursor.execute(
-                        """
-                        UPDATE block_content_association
-                        SET position = position - 1
-                        WHERE parent_block_id = %s AND position > %s
-                        """,
-                        (parent_id, position)
-                    )
-                conn.commit()
-                return True
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            self._return_connection(conn)
-
-    def _delete_children_recursively(self, cursor, parent_id: uuid.UUID) -> None:
-        cursor.execute(
-            """
-            SELECT child_block_id FROM block_content_association
-            WHERE parent_block_id = %s
-            """,
-            (parent_id,)
-        )
-        children = [row[0] for row in cursor.fetchall()]
-        
-        for child_id in children:
-            self._delete_children_recursively(cursor, child_id)
-            
-            cursor.execute(
-                """
-                DELETE FROM block_content_association
-                WHERE parent_block_id = %s OR child_block_id = %s
-                """,
-                (child_id, child_id)
-            )
-            
-            cursor.execute(
-                """
-                DELETE FROM blocks 
-                WHERE id = %s
-                """,
-                (child_id,)
+    @staticmethod
+    def _insert_change(block: Dict[str, Any], parent_id: Optional[uuid.UUID], position: int) -> Dict[str, Any]:
+        return {
+            "op": "upsert",
+            "id": block["id"],
+            "type": block["type"],
+            "properties": block["properties"],
+            "parent_id": parent_id,
+            "position": position,
+            "created_at": block["created_at"],
+        }
+
+    @staticmethod
+    def _update_change(block: Dict[str, Any]) -> Dict[str, Any]:
+        return {"op": "upsert", "id": block["id"], "type": block["type"], "properties": block["properties"]}
+
+    @staticmethod
+    def _move_change(block_id: uuid.UUID, parent_id: uuid.UUID, position: int) -> Dict[str, Any]:
+        return {"op": "move", "id": block_id, "parent_id": parent_id, "position": position}
+
+    @staticmethod
+    def _delete_change(block_ids: List[uuid.UUID]) -> Dict[str, Any]:
+        return {"op": "delete", "ids": block_ids}
+
+    # Sibling positions of the rows of `source`, a CTE with id and
+    # parent_id: one window over the children of their parents, so rows
+    # sharing a parent do not each count the siblings before them.
+    @staticmethod
+    def _positions_cte(source: str) -> str:
+        return f"""
+            positions AS (
+                SELECT s.id, ROW_NUMBER() OVER (PARTITION BY s.parent_id ORDER BY s.rank, s.id) - 1 AS position
+                FROM blocks s
+                WHERE s.parent_id IN (SELECT parent_id FROM {source})
             )
-    
-    def move_block(
-        self, 
-        block_id: uuid.UUID, 
-        new_parent_id: uuid.UUID,
-        new_position: int
-    ) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
-                    """
-                    SELECT * FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (block_id,)
-                )
-                block = cursor.fetchone()
-                if not block:
-                    return None
-                
-                cursor.execute(
-                    """
-                    SELECT id FROM blocks 
-                    WHERE id = %s AND deleted_at IS NULL
-                    """,
-                    (new_parent_id,)
-                )
-                if not cursor.fetchone():
-                    return None
-                
-                position_info = self._get_block_position(block_id)
-                
-                if position_info:
-                    old_parent_id, old_position = position_info
-                    cursor.execute(
-                        """
-                        DELETE FROM block_content_association
-                        WHERE parent_block_id = %s AND child_block_id = %s
-                        """,
-                        (old_parent_id, block_id)
-                    )
-                    
-                    cursor.execute(
-                        """
-                        UPDATE block_content_association
-                        SET position = position - 1
-                        WHERE parent_block_id = %s AND position > %s
-                        """,
-                        (old_parent_id, old_position)
-                    )
-                
-                self._shift_positions(cursor, new_parent_id, new_position)
-                
-                cursor.execute(
-                    """
-                    UPDATE blocks
-                    SET updated_at = %s
-                    WHERE id = %s
-                    RETURNING *
-                    """,
-                    (datetime.now(), block_id)
-                )
-                updated_block = cursor.fetchone()
-
-                cursor.execute(
-                    """
-                    INSERT INTO block_content_association (
-                        parent_block_id, child_block_id, position
-                    ) VALUES (%s, %s, %s)
-                    """,
-                    (new_parent_id, block_id, new_position)
-                )
-                
-                conn.commit()
-                
-                result = dict(updated_block)
-                result['position'] = new_position
-                result['parent_id'] = new_parent_id
-                return result
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            self._return_connection(conn)
-
-    def get_blocks_tree(
+        """
+
+    def _list_filters(
         self,
-        workspace_id: uuid.UUID,
-        parent_id: Optional[uuid.UUID] = None
+        workspace_id: Optional[uuid.UUID] = None,
+        block_type: Optional[str] = None
+    ) -> Tuple[List[str], List[Any]]:
+        conditions = ["b.deleted_at IS NULL", self._live_workspace("b")]
+        params: List[Any] = []
+
+        if workspace_id:
+            conditions.append("b.workspace_id = %s")
+            params.append(workspace_id)
+
+        if block_type:
+            conditions.append("b.type = %s")
+            params.append(block_type)
+
+        return conditions, params
+
+    # Builds the new properties value as a chain of LATERAL steps over the
+    # row's current value: a shallow merge, then each patch in order.
+    # Setting a nested path creates missing intermediate objects.
+    def _properties_patch_sql(
+        self,
+        properties: Optional[Dict[str, Any]],
+        patches: Optional[List[Dict[str, Any]]]
+    ) -> Tuple[str, List[Any]]:
+        steps: List[str] = []
+        params: List[Any] = []
+
+        if properties:
+            steps.append("{v} || %s::jsonb")
+            params.append(self._json(properties))
+
+        for patch in patches or []:
+            path = list(patch["path"])
+            if patch.get("op", "set") == "remove":
+                steps.append("{v} #- %s::text[]")
+                params.append(path)
+                continue
+
+            expression = "{v}"
+            for depth in range(1, len(path)):
+                expression = f"jsonb_set({expression}, %s::text[], COALESCE({{v}} #> %s::text[], '{{{{}}}}'::jsonb))"
+                params.extend([path[:depth], path[:depth]])
+            steps.append(f"jsonb_set({expression}, %s::text[], %s::jsonb)")
+            params.extend([path, self._json(patch.get("value"))])
+
+        if not steps:
+            return "b.properties", params
+
+        lateral = "".join(
+            f" CROSS JOIN LATERAL (SELECT {step.format(v=f'p{i}.v')} AS v) p{i + 1}"
+            for i, step in enumerate(steps)
+        )
+        return f"(SELECT p{len(steps)}.v FROM (SELECT COALESCE(b.properties, '{{}}'::jsonb) AS v) p0{lateral})", params
+
+    def _batch_runs(self, operations: List[Tuple[str, uuid.UUID, Dict[str, Any]]]) -> List[List[int]]:
+        # A run never touches the same block twice, since bulk statements
+        # cannot order changes to one row.
+        runs: List[List[int]] = []
+        seen: Set[uuid.UUID] = set()
+        for index, (op_type, block_id, _) in enumerate(operations):
+            if not runs or operations[runs[-1][0]][0] != op_type or block_id in seen:
+                runs.append([])
+                seen = set()
+            runs[-1].append(index)
+            seen.add(block_id)
+        return runs
+
+    # Moves lock the moved subtrees, whose paths they rewrite, FOR UPDATE
+    # and the ancestors of the new parents FOR SHARE, so that none of them
+    # can move until commit and the cycle check against those paths holds.
+    # The rows are locked in id order, one statement per run of the same
+    # mode, so that opposite moves queue behind each other instead of
+    # deadlocking.
+    @staticmethod
+    def _move_locks(subtrees: Set[uuid.UUID], ancestors: Set[uuid.UUID]) -> List[Tuple[str, List[uuid.UUID]]]:
+        locks: List[Tuple[str, List[uuid.UUID]]] = []
+        for block_id in sorted(subtrees | ancestors):
+            mode = "UPDATE" if block_id in subtrees else "SHARE"
+            if not locks or locks[-1][0] != mode:
+                locks.append((mode, []))
+            locks[-1][1].append(block_id)
+        return [
+            (f"SELECT 1 FROM blocks WHERE id = ANY(%s) ORDER BY id FOR {mode}", ids)
+            for mode, ids in locks
+        ]
+
+    def _insert_sibling(
+        self, siblings: List[Tuple[str, uuid.UUID]], block_id: uuid.UUID, position: int
+    ) -> Tuple[str, int]:
+        siblings[:] = [sibling for sibling in siblings if sibling[1] != block_id]
+        position = min(max(position, 0), len(siblings))
+        before = siblings[position - 1][0] if position > 0 else None
+        after = siblings[position][0] if position < len(siblings) else None
+        rank = rank_between(before, after)
+        siblings.insert(position, (rank, block_id))
+        return rank, position
+
+    def _build_tree(
+        self, rows: List[Dict[str, Any]], parent_id: Optional[uuid.UUID] = None
     ) -> List[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        nodes: Dict[uuid.UUID, Dict[str, Any]] = {}
+        tree: List[Dict[str, Any]] = []
+
+        for row in rows:
+            node = dict(row)
+            node["content"] = []
+
+            if node["parent_id"] == parent_id:
                 if parent_id:
-                    cursor.execute(
-                        """
-                        SELECT b.id, b.type, b.properties, b.workspace_id,
-                               bca.parent_block_id as parent_id,
-                               bca.position
-                        FROM blocks b
-                        JOIN block_content_association bca ON b.id = bca.child_block_id
-                        WHERE b.workspace_id = %s AND bca.parent_block_id = %s 
-                        AND b.deleted_at IS NULL
-                        ORDER BY bca.position
-                        """,
-                        (workspace_id, parent_id)
-                    )
-                else:
-                    cursor.execute(
-                        """
-                        SELECT b.id, b.type, b.properties, b.workspace_id, 
-                               NULL as parent_id, 0 as position 
-                        FROM blocks b
-                        LEFT JOIN block_content_association bca ON b.id = bca.child_block_id
-                        WHERE b.workspace_id = %s 
-                        AND bca.child_block_id IS NULL 
-                        AND b.deleted_at IS NULL
-                        """,
-                        (workspace_id,)
-                    )
-                
-                blocks = [dict(block) for block in cursor.fetchall()]
-                
-                for block in blocks:
-                    block["content"] = self._get_children_recursive(
-                        workspace_id=workspace_id, 
-                        parent_id=block["id"],
-                        conn=conn
-                    )
-                        
-                return blocks
-        finally:
-            self._return_connection(conn)
-    
-    def _get_children_recursive(
+                    node["position"] = len(tree)
+                tree.append(node)
+            elif node["parent_id"] in nodes:
+                siblings = nodes[node["parent_id"]]["content"]
+                node["position"] = len(siblings)
+                siblings.append(node)
+            else:
+                continue
+
+            nodes[node["id"]] = node
+
+        return tree
+
+    # Walks down from the anchor rows (depth 0) at most max_depth levels,
+    # reading at most max_children children per node plus one extra row that
+    # only marks the node as having more. Nodes on the last level report
+    # has_more when they have any children at all.
+    def _limited_tree_query(
         self,
-        workspace_id: uuid.UUID,
-        parent_id: uuid.UUID,
-        conn
-    ) -> List[Dict[str, Any]]:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
-                """
-                SELECT b.id, b.type, b.properties, b.workspace_id,
-                       bca.parent_block_id as parent_id,
-                       bca.position
-                FROM blocks b
-                JOIN block_content_association bca ON b.id = bca.child_block_id
-                WHERE b.workspace_id = %s AND bca.parent_block_id = %s 
-                AND b.deleted_at IS NULL
-                ORDER BY bca.position
-                """,
-                (workspace_id, parent_id)
+        anchor: str,
+        params: Dict[str, Any],
+        max_depth: Optional[int],
+        max_children: Optional[int],
+        after: Optional[Tuple[str, uuid.UUID, int]] = None
+    ) -> Tuple[str, Dict[str, Any]]:
+        after_filter = ""
+        offset = 0
+        if after:
+            after_filter = """
+                AND (t.depth > 0 OR (b.rank, b.id) > (%(after_rank)s, %(after_id)s))
+            """
+            params = {**params, "after_rank": after[0], "after_id": after[1]}
+            offset = after[2]
+
+        query = f"""
+            WITH RECURSIVE tree AS (
+                {anchor}
+                UNION ALL
+                SELECT c.id, c.type, c.properties, c.workspace_id, c.version,
+                       t.id as parent_id,
+                       c.rank,
+                       c.rn - 1 + CASE WHEN t.depth = 0 THEN %(offset)s ELSE 0 END as position,
+                       COALESCE(c.rn > %(max_children)s, false) as overflow,
+                       t.depth + 1 as depth,
+                       c.created_at
+                FROM tree t
+                CROSS JOIN LATERAL (
+                    SELECT b.id, b.type, b.properties, b.workspace_id, b.version, b.created_at, b.rank,
+                           ROW_NUMBER() OVER (ORDER BY b.rank, b.id) as rn
+                    FROM blocks b
+                    WHERE b.parent_id = t.id
+                    AND b.workspace_id = t.workspace_id
+                    AND b.deleted_at IS NULL
+                    {after_filter}
+                    ORDER BY b.rank, b.id
+                    LIMIT %(limit)s
+                ) c
+                WHERE NOT t.overflow
+                AND (%(max_depth)s::integer IS NULL OR t.depth < %(max_depth)s)
             )
-            
-            children = [dict(block) for block in cursor.fetchall()]
-            
-            for child in children:
-                child["content"] = self._get_children_recursive(
-                    workspace_id=workspace_id,
-                    parent_id=child["id"],
-                    conn=conn
+            SELECT tree.*,
+                   (
+                       NOT tree.overflow
+                       AND tree.depth >= %(max_depth)s
+                       AND EXISTS (
+                           SELECT 1 FROM blocks b
+                           WHERE b.parent_id = tree.id
+                           AND b.workspace_id = tree.workspace_id
+                           AND b.deleted_at IS NULL
+                       )
+                   ) IS TRUE as has_children
+            FROM tree
+            ORDER BY tree.depth, tree.rank, tree.created_at, tree.id
+            """
+        return query, {
+            **params,
+            "offset": offset,
+            "max_children": max_children,
+            "limit": max_children + 1 if max_children else None,
+            "max_depth": max_depth,
+        }
+
+    def _assemble_limited_tree(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nodes: Dict[uuid.UUID, Dict[str, Any]] = {}
+        ranks: Dict[uuid.UUID, str] = {}
+        tree: List[Dict[str, Any]] = []
+
+        for row in rows:
+            node = dict(row)
+            ranks[node["id"]] = node.pop("rank")
+            overflow = node.pop("overflow")
+            depth = node.pop("depth")
+            del node["created_at"]
+
+            if overflow:
+                parent = nodes[node["parent_id"]]
+                last = parent["content"][-1]
+                parent["has_more"] = True
+                parent["next_cursor"] = encode_child_cursor(
+                    ranks[last["id"]], last["id"], last["position"] + 1
                 )
-                
-            return children
+                continue
+
+            node["content"] = []
+            node["has_more"] = node.pop("has_children")
+            node["next_cursor"] = None
+
+            if depth == 0:
+                tree.append(node)
+            else:
+                nodes[node["parent_id"]]["content"].append(node)
+            nodes[node["id"]] = node
+
+        return tree
@@ -1,3 +1,4 @@
+from services.change_push_service import ChangePushService
 from services.migration_service import PostgresMigrationService
 from services.minio_service import MinioService
 
@@ -6,7 +7,9 @@ class Services:
     def __init__(
         self, 
         migration: PostgresMigrationService,
-        s3: MinioService
+        s3: MinioService,
+        push: ChangePushService
     ):
         self.migration = migration
         self.s3 = s3
+        self.push = push
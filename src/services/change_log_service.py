@@ -0,0 +1,59 @@
+import asyncio
+import logging
+from typing import Optional
+
+from psycopg_pool import AsyncConnectionPool
+
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
+
+
+logger = logging.getLogger(__name__)
+
+
+# Trims the workspace change logs to the retention window every
+# `interval` seconds, in batches that each commit on their own, so an
+# interrupted run simply resumes on the next one.
+class ChangeLogCompactionService:
+    def __init__(self, pool: AsyncConnectionPool, retention: float, interval: float, batch_size: int = 10000):
+        self.pool = pool
+        self.retention = retention
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.retention > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.compact() >= self.batch_size:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change log compaction failed")
+            await asyncio.sleep(self.interval)
+
+    async def compact(self) -> int:
+        unit_of_work = AsyncUnitOfWork(self.pool)
+        try:
+            removed = await AsyncWorkspaceRepository(unit_of_work).compact_changes(self.retention, self.batch_size)
+            await unit_of_work.commit()
+            return removed
+        except Exception:
+            await unit_of_work.rollback()
+            raise
+        finally:
+            await unit_of_work.close()
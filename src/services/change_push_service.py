@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import uuid
+from typing import Dict, Optional, Set, Union
+
+from litestar.serialization import encode_json
+from litestar.status_codes import WS_1000_NORMAL_CLOSURE, WS_1008_POLICY_VIOLATION
+from psycopg_pool import AsyncConnectionPool
+
+from repositories.async_block_repository import AsyncBlockRepository
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
+
+from utils.metrics import PUSH_DISCONNECTS, PUSH_MESSAGES, PUSH_SUBSCRIBERS
+
+
+logger = logging.getLogger(__name__)
+
+# Close code for a client that has already gone away.
+DISCONNECTED = 0
+
+
+# One connected client. Its queue holds encoded messages, then a close
+# code once it has to go; `version` is the last change it has been sent.
+class Subscription:
+    def __init__(self, workspace_id: uuid.UUID, version: int, max_pending: int):
+        self.workspace_id = workspace_id
+        self.version = version
+        self.queue: asyncio.Queue[Union[str, int]] = asyncio.Queue(maxsize=max_pending + 1)
+        self.max_pending = max_pending
+        self.ready = False
+        self.closed = False
+
+    def push(self, message: str) -> bool:
+        if self.queue.qsize() >= self.max_pending:
+            return False
+        self.queue.put_nowait(message)
+        return True
+
+    def close(self, code: int) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(code)
+
+
+class Topic:
+    def __init__(self, version: int):
+        self.version = version
+        self.subscriptions: Set[Subscription] = set()
+        self.pending = False
+        self.task: Optional[asyncio.Task] = None
+
+
+# Pushes workspace change feed pages to websocket subscribers. Commits are
+# learned of from the invalidation listener; each workspace with
+# subscribers then reads its change log once per `window` seconds and
+# sends the same encoded page to every subscriber, so the cost per commit
+# does not grow with the number of clients. A subscriber with more than
+# `max_pending` unsent messages, or that takes longer than `send_timeout`
+# to accept one, is disconnected rather than buffered.
+class ChangePushService:
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        window: float = 0.05,
+        max_pending: int = 100,
+        send_timeout: float = 10.0,
+        page_size: int = 1000,
+        prepare: bool = False
+    ):
+        self.pool = pool
+        self.window = window
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self.page_size = page_size
+        self.prepare = prepare
+        self._topics: Dict[uuid.UUID, Topic] = {}
+        PUSH_SUBSCRIBERS.set_function(lambda: sum(len(topic.subscriptions) for topic in self._topics.values()))
+
+    # Registers a subscriber and queues what it missed since `since`, or
+    # nothing when it starts from the current version. None if the
+    # workspace does not exist.
+    async def subscribe(self, workspace_id: uuid.UUID, since: Optional[int]) -> Optional[Subscription]:
+        topic = self._topics.get(workspace_id)
+        if topic is None:
+            feed = await self._read(workspace_id, None)
+            if feed is None:
+                return None
+            if workspace_id not in self._topics:
+                self._topics[workspace_id] = Topic(feed["version"])
+                # Commits announced while the version was being read.
+                self._schedule(workspace_id, self._topics[workspace_id])
+            topic = self._topics[workspace_id]
+
+        subscription = Subscription(workspace_id, topic.version if since is None else since, self.max_pending)
+        topic.subscriptions.add(subscription)
+        try:
+            # Pages pushed to the topic meanwhile skip this subscriber, so
+            # catch up until it is level with the topic before joining.
+            more = since is not None
+            while more or subscription.version < topic.version:
+                feed = await self._read(workspace_id, subscription.version)
+                if feed is None:
+                    subscription.close(WS_1000_NORMAL_CLOSURE)
+                    break
+                if (feed["changes"] or feed["resync_required"]) and not subscription.push(encode_json(feed).decode()):
+                    PUSH_DISCONNECTS.labels(reason="slow").inc()
+                    subscription.close(WS_1008_POLICY_VIOLATION)
+                    break
+                subscription.version = feed["version"]
+                more = feed["has_more"]
+        except BaseException:
+            self.unsubscribe(subscription)
+            raise
+        subscription.ready = True
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        topic = self._topics.get(subscription.workspace_id)
+        if topic is None:
+            return
+        topic.subscriptions.discard(subscription)
+        if not topic.subscriptions:
+            del self._topics[subscription.workspace_id]
+            if topic.task is not None:
+                topic.task.cancel()
+
+    # Listener callback; None means any workspace may have changed.
+    def notify(self, tree_versions: Optional[Dict[uuid.UUID, int]]) -> None:
+        for workspace_id, topic in self._topics.items():
+            if tree_versions is None or tree_versions.get(workspace_id, -1) > topic.version:
+                self._schedule(workspace_id, topic)
+
+    def _schedule(self, workspace_id: uuid.UUID, topic: Topic) -> None:
+        topic.pending = True
+        if topic.task is None:
+            topic.task = asyncio.get_running_loop().create_task(self._flush(workspace_id, topic))
+
+    async def _flush(self, workspace_id: uuid.UUID, topic: Topic) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            while topic.pending:
+                topic.pending = False
+                feed = await self._read(workspace_id, topic.version)
+                if feed is None:
+                    for subscription in topic.subscriptions:
+                        subscription.close(WS_1000_NORMAL_CLOSURE)
+                    return
+                if feed["has_more"]:
+                    topic.pending = True
+                self._publish(topic, feed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Pushing changes for workspace %s failed", workspace_id)
+        finally:
+            topic.task = None
+
+    def _publish(self, topic: Topic, feed: dict) -> None:
+        start, topic.version = topic.version, feed["version"]
+        if not feed["changes"] and not feed["resync_required"]:
+            return
+
+        message = encode_json(feed).decode()
+        for subscription in topic.subscriptions:
+            if not subscription.ready or subscription.closed or subscription.version >= feed["version"]:
+                continue
+            if subscription.version > start and not feed["resync_required"]:
+                # Caught up past the start of this page while joining.
+                pushed = subscription.push(encode_json({
+                    **feed,
+                    "changes": [change for change in feed["changes"] if change["version"] > subscription.version]
+                }).decode())
+            else:
+                pushed = subscription.push(message)
+
+            if pushed:
+                subscription.version = feed["version"]
+                PUSH_MESSAGES.inc()
+            else:
+                PUSH_DISCONNECTS.labels(reason="slow").inc()
+                subscription.close(WS_1008_POLICY_VIOLATION)
+
+    async def _read(self, workspace_id: uuid.UUID, since: Optional[int]) -> Optional[dict]:
+        unit_of_work = AsyncUnitOfWork(self.pool, prepare=self.prepare)
+        try:
+            if since is None:
+                version = await AsyncBlockRepository(unit_of_work).get_tree_version(workspace_id)
+                feed = None if version is None else {"version": version}
+            else:
+                feed = await AsyncWorkspaceRepository(unit_of_work).get_changes(
+                    workspace_id, since=since, limit=self.page_size
+                )
+            await unit_of_work.commit()
+            return feed
+        finally:
+            await unit_of_work.close()
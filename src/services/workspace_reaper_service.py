@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from psycopg_pool import AsyncConnectionPool
+
+from repositories.async_unit_of_work import AsyncUnitOfWork
+from repositories.async_workspace_repository import AsyncWorkspaceRepository
+
+from utils.metrics import REAPER_PENDING_WORKSPACES, REAPER_PURGED_BLOCKS
+
+
+logger = logging.getLogger(__name__)
+
+
+# Purges the blocks of deleted workspaces, one batch per transaction with
+# `batch_delay` seconds between batches so the purge never holds locks or
+# floods the WAL for long. Looks for waiting workspaces every `interval`
+# seconds; progress lives in the database, so a restart simply resumes.
+class WorkspaceReaperService:
+    def __init__(
+        self,
+        pool: AsyncConnectionPool,
+        batch_size: int = 1000,
+        batch_delay: float = 0.1,
+        interval: float = 30.0
+    ):
+        self.pool = pool
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.batch_size > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reap_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Reaping deleted workspaces failed")
+            await asyncio.sleep(self.interval)
+
+    async def reap_all(self) -> None:
+        REAPER_PENDING_WORKSPACES.set(await self._run_in_transaction(lambda workspaces: workspaces.count_unreaped()))
+        while True:
+            reaped = await self.reap()
+            if reaped is None:
+                break
+            if reaped["done"]:
+                logger.info("Purged the blocks of deleted workspace %s", reaped["workspace_id"])
+                REAPER_PENDING_WORKSPACES.dec()
+            await asyncio.sleep(self.batch_delay)
+
+    async def reap(self) -> Optional[Dict[str, Any]]:
+        reaped = await self._run_in_transaction(lambda workspaces: workspaces.reap_deleted(self.batch_size))
+        if reaped is not None:
+            REAPER_PURGED_BLOCKS.inc(reaped["purged"])
+        return reaped
+
+    async def _run_in_transaction(self, work):
+        unit_of_work = AsyncUnitOfWork(self.pool)
+        try:
+            result = await work(AsyncWorkspaceRepository(unit_of_work))
+            await unit_of_work.commit()
+            return result
+        except Exception:
+            await unit_of_work.rollback()
+            raise
+        finally:
+            await unit_of_work.close()
@@ -0,0 +1,68 @@
+from typing import Union
+
+from litestar import Request, Response
+from litestar.enums import ScopeType
+from litestar.middleware import ASGIMiddleware
+from litestar.serialization import encode_json
+from litestar.status_codes import HTTP_503_SERVICE_UNAVAILABLE
+from litestar.types import ASGIApp, Receive, Scope, Send
+from psycopg_pool import PoolTimeout, TooManyRequests
+
+from utils.metrics import INFLIGHT_REQUESTS, REJECTED_REQUESTS
+
+
+RETRY_AFTER_SECONDS = 1
+
+
+# Caps the number of requests handled at once. Requests over the limit are
+# refused before they reach a handler, so an overloaded server sheds load
+# instead of queueing every request on the connection pool.
+class AdmissionControlMiddleware(ASGIMiddleware):
+    scopes = (ScopeType.HTTP,)
+    exclude_path_pattern = ("^/metrics",)
+
+    def __init__(self, max_inflight: int):
+        self.max_inflight = max_inflight
+        self.inflight = 0
+
+    async def handle(self, scope: Scope, receive: Receive, send: Send, next_app: ASGIApp) -> None:
+        if self.inflight >= self.max_inflight:
+            REJECTED_REQUESTS.labels(reason="inflight_limit").inc()
+            await send_overloaded(send, "Too many requests in flight")
+            return
+
+        self.inflight += 1
+        INFLIGHT_REQUESTS.inc()
+        try:
+            await next_app(scope, receive, send)
+        finally:
+            self.inflight -= 1
+            INFLIGHT_REQUESTS.dec()
+
+
+async def send_overloaded(send: Send, detail: str) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": HTTP_503_SERVICE_UNAVAILABLE,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+        ],
+    })
+    await send({
+        "type": "http.response.body",
+        "body": encode_json({"status_code": HTTP_503_SERVICE_UNAVAILABLE, "detail": detail}),
+    })
+
+
+# A request that waited the whole pool timeout, or found the wait queue
+# full, fails fast with 503 rather than as an internal error.
+def pool_exhausted_handler(request: Request, exc: Union[PoolTimeout, TooManyRequests]) -> Response:
+    REJECTED_REQUESTS.labels(
+        reason="pool_queue_full" if isinstance(exc, TooManyRequests) else "pool_timeout"
+    ).inc()
+    return Response(
+        {"status_code": HTTP_503_SERVICE_UNAVAILABLE, "detail": "No database connection available"},
+        status_code=HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+    )
@@ -0,0 +1,97 @@
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+import msgspec
+from litestar import MediaType
+
+
+# Response encoding for block rows straight from the repositories. The
+# structs mirror models.block's response models field for field, in the
+# same order, and encode with msgspec as Litestar does, so the JSON bytes
+# are identical to returning the pydantic models. Rows come from our own
+# queries, so they are not validated again on the way out.
+#
+# The same structures can be sent as MessagePack (`?format=msgpack`),
+# with UUIDs as 16 raw bytes instead of 36 character strings.
+class BlockJSON(msgspec.Struct):
+    id: uuid.UUID
+    type: str
+    properties: Dict[str, Any]
+    parent_id: Optional[uuid.UUID]
+    workspace_id: uuid.UUID
+    position: int
+    version: Optional[int]
+
+
+class BlockTreeNodeJSON(BlockJSON):
+    content: List["BlockTreeNodeJSON"]
+    has_more: bool
+    next_cursor: Optional[str]
+
+
+class BlockPageJSON(msgspec.Struct):
+    items: List[BlockJSON]
+    next_after: Optional[str]
+
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+MEDIA_TYPES = {JSON: MediaType.JSON, MSGPACK: MSGPACK_MEDIA_TYPE}
+
+_encoders = {
+    JSON: msgspec.json.Encoder(),
+    MSGPACK: msgspec.msgpack.Encoder(uuid_format="bytes"),
+}
+
+
+def _block(row: Dict[str, Any]) -> BlockJSON:
+    return BlockJSON(
+        row["id"],
+        row["type"],
+        row["properties"],
+        row.get("parent_id"),
+        row["workspace_id"],
+        row["position"],
+        row.get("version")
+    )
+
+
+def _tree_node(node: Dict[str, Any]) -> BlockTreeNodeJSON:
+    return BlockTreeNodeJSON(
+        node["id"],
+        node["type"],
+        node["properties"],
+        node.get("parent_id"),
+        node["workspace_id"],
+        node["position"],
+        node.get("version"),
+        [_tree_node(child) for child in node.get("content", ())],
+        node.get("has_more", False),
+        node.get("next_cursor")
+    )
+
+
+def encode_block(row: Dict[str, Any], output_format: str = JSON) -> bytes:
+    return _encoders[output_format].encode(_block(row))
+
+
+def encode_blocks(rows: Iterable[Dict[str, Any]], output_format: str = JSON) -> bytes:
+    return _encoders[output_format].encode([_block(row) for row in rows])
+
+
+def encode_block_page(
+    rows: Iterable[Dict[str, Any]], next_after: Optional[str], output_format: str = JSON
+) -> bytes:
+    return _encoders[output_format].encode(BlockPageJSON([_block(row) for row in rows], next_after))
+
+
+def encode_block_tree(node: Dict[str, Any], output_format: str = JSON) -> bytes:
+    return _encoders[output_format].encode(_tree_node(node))
+
+
+# Trees already in response shape, such as workspace tree snapshots.
+def encode_tree(roots: List[Dict[str, Any]], output_format: str = JSON) -> bytes:
+    return _encoders[output_format].encode(roots)
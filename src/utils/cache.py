@@ -0,0 +1,96 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from utils.metrics import CACHE_ENTRIES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+
+# Read-through cache interface used by the repositories. This base class
+# caches nothing, so it doubles as the disabled cache; other backends
+# override all four methods.
+#
+# Entries carry tags, and invalidate() drops every entry holding one of
+# the given tags. `generation` changes on every invalidation: a reader
+# takes it before loading and passes it to set(), which discards the value
+# if an invalidation ran in between, since the load may predate that write.
+class Cache:
+    name = "none"
+    generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        return None
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable], generation: int) -> None:
+        pass
+
+    def invalidate(self, tags: Iterable[Hashable]) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+# In-process LRU with a size bound and a per-entry TTL. Cached values are
+# shared between callers and must not be mutated.
+class LRUCache(Cache):
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: OrderedDict[Hashable, Tuple[float, Any, Tuple[Hashable, ...]]] = OrderedDict()
+        self._tags: Dict[Hashable, Set[Hashable]] = {}
+        CACHE_ENTRIES.labels(cache=name).set_function(lambda: len(self._entries))
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            CACHE_EVICTIONS.labels(cache=self.name, reason="expired").inc()
+            entry = None
+
+        if entry is None:
+            CACHE_MISSES.labels(cache=self.name).inc()
+            return None
+
+        self._entries.move_to_end(key)
+        CACHE_HITS.labels(cache=self.name).inc()
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable], generation: int) -> None:
+        if generation != self.generation:
+            return
+
+        self._remove(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            CACHE_EVICTIONS.labels(cache=self.name, reason="size").inc()
+
+    def invalidate(self, tags: Iterable[Hashable]) -> None:
+        self.generation += 1
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                if self._remove(key):
+                    CACHE_EVICTIONS.labels(cache=self.name, reason="invalidated").inc()
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
@@ -0,0 +1,115 @@
+from io import BytesIO
+from typing import Callable, Dict, List, Optional
+
+import zstandard
+from litestar.config.compression import CompressionConfig
+from litestar.datastructures import Headers, MutableScopeHeaders
+from litestar.enums import CompressionEncoding
+from litestar.middleware import DefineMiddleware
+from litestar.middleware.compression import CompressionMiddleware
+from litestar.middleware.compression.facade import CompressionFacade
+from litestar.types import Message, Receive, Scope, Send
+
+from utils.config import config
+
+
+ZSTD = "zstd"
+
+# Server preference between encodings the client weighs equally.
+ENCODINGS = (ZSTD, CompressionEncoding.GZIP.value)
+
+
+# Streaming zstd for Litestar's compression middleware. Every write ends
+# a zstd block, so each chunk of a streamed response can be decoded as
+# soon as it arrives.
+class ZstdCompression(CompressionFacade):
+    encoding = ZSTD
+
+    def __init__(self, buffer: BytesIO, compression_encoding: str, config: CompressionConfig):
+        self.buffer = buffer
+        self.compression_encoding = compression_encoding
+        self.compressor = zstandard.ZstdCompressor(level=config.backend_config).compressobj()
+        self.closed = False
+
+    def write(self, body: bytes) -> None:
+        self.buffer.write(self.compressor.compress(body))
+        self.buffer.write(self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK))
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.buffer.write(self.compressor.flush())
+
+
+# The best encoding in an Accept-Encoding header by its q-values, or None
+# for an identity response.
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, *params = item.split(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+# A compressed body is a different representation than the identity one
+# but keeps the handler's ETag, so the ETag is sent as weak; conditional
+# requests still match it, since If-None-Match compares weakly.
+def _weaken_etag(send: Send) -> Send:
+    async def send_wrapper(message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableScopeHeaders(message)
+            etag = headers.get("etag")
+            if etag and "content-encoding" in headers and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+        await send(message)
+
+    return send_wrapper
+
+
+# Litestar's middleware picks its backend by substring match; this one
+# honours q-values, including q=0 refusals, and chooses between zstd and
+# gzip per request. Bodies under the minimum size go out uncompressed,
+# streamed ones are compressed chunk by chunk.
+class NegotiatedCompressionMiddleware(CompressionMiddleware):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = negotiate_encoding(Headers.from_scope(scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await self.app(
+            scope,
+            receive,
+            self.create_compression_send_wrapper(send=_weaken_etag(send), compression_encoding=encoding, scope=scope)
+        )
+
+
+compression_config = CompressionConfig(
+    backend=ZSTD,
+    minimum_size=config.response_compression_min_size,
+    gzip_compress_level=config.response_compression_gzip_level,
+    compression_facade=ZstdCompression,
+    backend_config=config.response_compression_zstd_level
+)
+
+# For the handlers whose responses are worth compressing.
+compressed: List[Callable] = [
+    DefineMiddleware(NegotiatedCompressionMiddleware, config=compression_config)
+] if config.response_compression else []
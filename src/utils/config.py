@@ -10,6 +10,57 @@ class AppConfig:
     postgres_db_password=environ.var()
     postgres_db_min_connections=environ.var()
     postgres_db_max_connections=environ.var()
+    # Seconds a request waits for a free connection before failing with 503.
+    postgres_db_pool_timeout=environ.var(5.0, converter=float)
+    # Requests allowed to queue for a connection; 0 means no bound.
+    postgres_db_pool_max_waiting=environ.var(0, converter=int)
+    # Connections are replaced after this many seconds, or when idle this long.
+    postgres_db_pool_max_lifetime=environ.var(1800.0, converter=float)
+    postgres_db_pool_max_idle=environ.var(300.0, converter=float)
+    # Server-side prepared statements; turn off behind PgBouncer in
+    # transaction mode, where a statement may land on another backend.
+    postgres_db_prepared_statements=environ.bool_var(True)
+
+    # Blocks, children and content responses kept in memory per process;
+    # 0 disables the cache. Entries expire after the TTL in seconds.
+    block_cache_size=environ.var(10000, converter=int)
+    block_cache_ttl=environ.var(60.0, converter=float)
+    # Blocks held across all cached workspace tree snapshots; 0 disables them.
+    tree_snapshot_max_nodes=environ.var(500000, converter=int)
+    # Writes tell the other processes what to invalidate through NOTIFY;
+    # turn off for a single-process deployment. Notifications arriving
+    # within the delay in seconds are applied together.
+    cache_invalidation_notify=environ.bool_var(True)
+    cache_invalidation_batch_delay=environ.var(0.05, converter=float)
+
+    # Seconds workspace change log entries are kept for polling clients;
+    # 0 keeps them forever. Expired entries are removed every interval.
+    change_log_retention=environ.var(604800.0, converter=float)
+    change_log_compact_interval=environ.var(300.0, converter=float)
+    # Websocket change pushes ride on the invalidation notifications and
+    # are coalesced per workspace over the window in seconds. Subscribers
+    # with more pages than this unsent, or that take longer than the
+    # timeout in seconds to accept one, are disconnected.
+    push_window=environ.var(0.05, converter=float)
+    push_max_pending=environ.var(100, converter=int)
+    push_send_timeout=environ.var(10.0, converter=float)
+    # Blocks of deleted workspaces are purged in batches of this size,
+    # pausing the delay in seconds between batches; waiting workspaces
+    # are looked for every interval.
+    reaper_batch_size=environ.var(1000, converter=int)
+    reaper_batch_delay=environ.var(0.1, converter=float)
+    reaper_interval=environ.var(30.0, converter=float)
+
+    # Tree, content and listing responses of at least this many bytes are
+    # compressed with zstd or gzip, whichever the client prefers, at these
+    # levels (zstd 1-22, gzip 1-9).
+    response_compression=environ.bool_var(True)
+    response_compression_min_size=environ.var(1024, converter=int)
+    response_compression_zstd_level=environ.var(3, converter=int)
+    response_compression_gzip_level=environ.var(6, converter=int)
+
+    # Requests handled at once; the rest get an immediate 503.
+    server_max_inflight_requests=environ.var(100, converter=int)
 
     minio_root_user=environ.var()
     minio_root_password=environ.var()
@@ -0,0 +1,22 @@
+import hashlib
+from typing import Any, Optional
+
+
+# Strong ETag for one representation of a versioned resource: the parts
+# name the resource, its version and every query parameter that changes
+# the body.
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+# If-None-Match uses the weak comparison, so W/ prefixes are ignored.
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+
+from psycopg import AsyncConnection, AsyncCursor, Notify
+
+from utils.cache import Cache
+from utils.metrics import CACHE_FLUSHES, CACHE_NOTIFICATIONS
+from utils.tree_snapshot import TreeSnapshotCache
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "coursembed_invalidations"
+# NOTIFY rejects payloads of 8000 bytes or more.
+MAX_PAYLOAD = 7900
+
+# Tells this process's own notifications apart from other processes'.
+ORIGIN = uuid.uuid4().hex
+
+
+# Cache changes made by one transaction, sent to every other process with
+# pg_notify from inside it, so they are delivered if and only if it
+# commits. The payload names the invalidated tags per cache and the new
+# tree_version of each touched workspace. Tags are (kind, uuid) pairs;
+# when they do not fit in one notification the receivers are told to
+# flush everything instead, keeping the versions if those still fit.
+async def publish_changes(
+    cursor: AsyncCursor,
+    tags: Dict[str, Iterable[Hashable]],
+    tree_versions: Dict[uuid.UUID, int]
+) -> None:
+    versions = {str(workspace_id): version for workspace_id, version in tree_versions.items()}
+    payload = json.dumps({
+        "o": ORIGIN,
+        "t": {name: [f"{kind}:{value}" for kind, value in cache_tags] for name, cache_tags in tags.items()},
+        "v": versions,
+    }, separators=(",", ":"))
+    if len(payload) > MAX_PAYLOAD:
+        payload = json.dumps({"o": ORIGIN, "flush": True, "v": versions}, separators=(",", ":"))
+    if len(payload) > MAX_PAYLOAD:
+        payload = json.dumps({"o": ORIGIN, "flush": True}, separators=(",", ":"))
+
+    await cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+
+
+# Applies other processes' changes to this process's caches, from a
+# dedicated LISTEN connection. Notifications arriving within `batch_delay`
+# of each other are merged and applied as one invalidation per cache.
+# Whatever was committed while the connection was down is unknown, so
+# every (re)connect starts with a full flush.
+#
+# `on_tree_versions` hears of every committed tree_version, this
+# process's included, or None when some may have been missed.
+class InvalidationListener:
+    def __init__(
+        self,
+        conninfo: str,
+        caches: Iterable[Cache],
+        tree_snapshots: TreeSnapshotCache,
+        batch_delay: float = 0.05,
+        batch_size: int = 1000,
+        retry_delay: float = 1.0,
+        on_tree_versions: Optional[Callable[[Optional[Dict[uuid.UUID, int]]], None]] = None
+    ):
+        self.conninfo = conninfo
+        self.caches = {cache.name: cache for cache in caches}
+        self.tree_snapshots = tree_snapshots
+        self.on_tree_versions = on_tree_versions
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with await AsyncConnection.connect(self.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    self.flush("connect")
+                    while True:
+                        batch = [notify async for notify in conn.notifies(stop_after=1)]
+                        if self.batch_delay > 0:
+                            batch.extend([
+                                notify async for notify in conn.notifies(
+                                    timeout=self.batch_delay, stop_after=self.batch_size
+                                )
+                            ])
+                        self.apply(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Cache invalidation listener lost its connection")
+                await asyncio.sleep(self.retry_delay)
+
+    def apply(self, batch: List[Notify]) -> None:
+        tags: Dict[str, set] = {}
+        tree_versions: Dict[uuid.UUID, int] = {}
+        remote_versions: Dict[uuid.UUID, int] = {}
+        flush = versions_missed = False
+        for notify in batch:
+            change = json.loads(notify.payload)
+            remote = change["o"] != ORIGIN
+            if remote:
+                CACHE_NOTIFICATIONS.inc()
+            if "v" not in change:
+                versions_missed = True
+            for workspace_id, version in change.get("v", {}).items():
+                workspace_id = uuid.UUID(workspace_id)
+                tree_versions[workspace_id] = max(version, tree_versions.get(workspace_id, version))
+                if remote:
+                    remote_versions[workspace_id] = tree_versions[workspace_id]
+            if not remote:
+                continue
+            if change.get("flush"):
+                flush = True
+                continue
+
+            for name, cache_tags in change["t"].items():
+                for tag in cache_tags:
+                    kind, _, value = tag.partition(":")
+                    tags.setdefault(name, set()).add((kind, uuid.UUID(value)))
+
+        if flush:
+            self.flush("overflow", notify_versions=False)
+        else:
+            for name, cache_tags in tags.items():
+                cache = self.caches.get(name)
+                if cache is not None:
+                    cache.invalidate(cache_tags)
+            for workspace_id, version in remote_versions.items():
+                self.tree_snapshots.discard_older(workspace_id, version)
+
+        if self.on_tree_versions is not None:
+            self.on_tree_versions(None if versions_missed else tree_versions)
+
+    def flush(self, reason: str, notify_versions: bool = True) -> None:
+        CACHE_FLUSHES.labels(reason=reason).inc()
+        for cache in self.caches.values():
+            cache.clear()
+        self.tree_snapshots.clear()
+        if notify_versions and self.on_tree_versions is not None:
+            self.on_tree_versions(None)
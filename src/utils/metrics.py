@@ -0,0 +1,101 @@
+from litestar.plugins.prometheus import PrometheusConfig
+from prometheus_client import Counter, Gauge, Histogram
+from psycopg_pool import AsyncConnectionPool
+
+
+prometheus_config = PrometheusConfig(
+    app_name="coursembed",
+    prefix="coursembed",
+    group_path=True,
+    exclude="/metrics"
+)
+
+INFLIGHT_REQUESTS = Gauge(
+    "coursembed_inflight_requests",
+    "Requests currently admitted"
+)
+REJECTED_REQUESTS = Counter(
+    "coursembed_rejected_requests_total",
+    "Requests answered with 503 before reaching a handler or the database",
+    ["reason"]
+)
+
+DB_POOL_IN_USE = Gauge(
+    "coursembed_db_pool_connections_in_use",
+    "Connections checked out of the pool"
+)
+DB_POOL_IDLE = Gauge(
+    "coursembed_db_pool_connections_idle",
+    "Open connections waiting in the pool"
+)
+DB_POOL_WAITERS = Gauge(
+    "coursembed_db_pool_waiters",
+    "Callers queued for a connection"
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "coursembed_db_pool_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+CACHE_HITS = Counter(
+    "coursembed_cache_hits_total",
+    "Reads served from a cache",
+    ["cache"]
+)
+CACHE_MISSES = Counter(
+    "coursembed_cache_misses_total",
+    "Reads that fell through a cache to the database",
+    ["cache"]
+)
+CACHE_EVICTIONS = Counter(
+    "coursembed_cache_evictions_total",
+    "Entries dropped from a cache",
+    ["cache", "reason"]
+)
+CACHE_ENTRIES = Gauge(
+    "coursembed_cache_entries",
+    "Entries currently held in a cache",
+    ["cache"]
+)
+CACHE_NOTIFICATIONS = Counter(
+    "coursembed_cache_notifications_total",
+    "Invalidation notifications received from other processes"
+)
+PUSH_SUBSCRIBERS = Gauge(
+    "coursembed_push_subscribers",
+    "Websocket clients subscribed to workspace changes"
+)
+PUSH_MESSAGES = Counter(
+    "coursembed_push_messages_total",
+    "Change pages queued for websocket subscribers"
+)
+PUSH_DISCONNECTS = Counter(
+    "coursembed_push_disconnects_total",
+    "Websocket subscribers dropped by the server",
+    ["reason"]
+)
+CACHE_FLUSHES = Counter(
+    "coursembed_cache_flushes_total",
+    "Times every cache was emptied on a listener (re)connect or an oversized change",
+    ["reason"]
+)
+REAPER_PENDING_WORKSPACES = Gauge(
+    "coursembed_reaper_pending_workspaces",
+    "Deleted workspaces whose blocks have not all been purged yet"
+)
+REAPER_PURGED_BLOCKS = Counter(
+    "coursembed_reaper_purged_blocks_total",
+    "Blocks of deleted workspaces purged by the reaper"
+)
+
+
+# The gauges read the pool's own counters at scrape time.
+def track_pool(pool: AsyncConnectionPool) -> None:
+    def in_use() -> int:
+        stats = pool.get_stats()
+        return stats["pool_size"] - stats["pool_available"]
+
+    DB_POOL_IN_USE.set_function(in_use)
+    DB_POOL_IDLE.set_function(lambda: pool.get_stats()["pool_available"])
+    DB_POOL_WAITERS.set_function(lambda: pool.get_stats()["requests_waiting"])
@@ -0,0 +1,21 @@
+from typing import Any, AsyncIterable, AsyncIterator, Dict
+
+from litestar.serialization import encode_json
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def ndjson_chunks(rows: AsyncIterable[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    chunk = bytearray()
+    async for row in rows:
+        chunk += encode_json(row)
+        chunk += b"\n"
+        if len(chunk) >= CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+
+    if chunk:
+        yield bytes(chunk)
@@ -0,0 +1,34 @@
+import base64
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(created_at: datetime, block_id: uuid.UUID) -> str:
+    raw = f"{created_at.isoformat()}|{block_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, block_id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(block_id)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+# Continuation point inside one parent's children: the sibling key of the
+# last child delivered and the position the next one will have.
+def encode_child_cursor(rank: str, block_id: uuid.UUID, position: int) -> str:
+    raw = f"{rank}|{block_id}|{position}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_child_cursor(cursor: str) -> Tuple[str, uuid.UUID, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, block_id, position = raw.split("|")
+        return rank, uuid.UUID(block_id), int(position)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
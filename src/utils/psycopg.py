@@ -0,0 +1,61 @@
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from utils.config import config
+from utils.metrics import track_pool
+
+
+# psycopg's default: other queries are prepared after this many runs on a
+# connection.
+PREPARE_THRESHOLD = 5
+
+# One connection pool per process for the request handlers. The pool
+# is created closed and opened from the application's startup hook, since
+# it needs a running event loop.
+class AsyncDatabaseConnectionManager:
+    _instance = None
+    _pool = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AsyncDatabaseConnectionManager, cls).__new__(cls)
+            cls._instance._initialize_pool()
+        return cls._instance
+
+    def _initialize_pool(self) -> None:
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(
+                make_conninfo(
+                    host=config.postgres_db_host,
+                    port=config.postgres_db_port,
+                    dbname=config.postgres_db_name,
+                    user=config.postgres_db_username,
+                    password=config.postgres_db_password
+                ),
+                min_size=int(config.postgres_db_min_connections),
+                max_size=int(config.postgres_db_max_connections),
+                # Callers queue for a free connection instead of failing;
+                # dead connections are replaced on checkout.
+                timeout=config.postgres_db_pool_timeout,
+                max_waiting=config.postgres_db_pool_max_waiting,
+                max_lifetime=config.postgres_db_pool_max_lifetime,
+                max_idle=config.postgres_db_pool_max_idle,
+                check=AsyncConnectionPool.check_connection,
+                # With prepared statements off, psycopg must not prepare
+                # repeated queries on its own either.
+                kwargs={"prepare_threshold": PREPARE_THRESHOLD if config.postgres_db_prepared_statements else None},
+                open=False
+            )
+            track_pool(self._pool)
+
+    def get_pool(self) -> AsyncConnectionPool:
+        return self._pool
+
+    async def open_pool(self) -> None:
+        await self._pool.open()
+
+    async def close_pool(self) -> None:
+        await self._pool.close()
+
+
+async_db_manager = AsyncDatabaseConnectionManager()
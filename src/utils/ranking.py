@@ -0,0 +1,38 @@
+from typing import Optional
+
+
+RANK_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Width of the evenly spaced keys written by the migration and by rebalancing.
+REBALANCED_RANK_WIDTH = 10
+
+# Keys longer than this get their siblings rebalanced in the background.
+MAX_RANK_LENGTH = 32
+
+
+# Keys compare byte-wise (COLLATE "C" in Postgres); None is an open end of the list.
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"Rank {before!r} is not lower than {after!r}")
+
+    return _midpoint(before or "", after)
+
+
+def _midpoint(lower: str, upper: Optional[str]) -> str:
+    if upper is not None:
+        common = 0
+        while (lower[common] if common < len(lower) else RANK_DIGITS[0]) == upper[common]:
+            common += 1
+        if common > 0:
+            return upper[:common] + _midpoint(lower[common:], upper[common:])
+
+    lower_digit = RANK_DIGITS.index(lower[0]) if lower else 0
+    upper_digit = RANK_DIGITS.index(upper[0]) if upper is not None else len(RANK_DIGITS)
+
+    if upper_digit - lower_digit > 1:
+        return RANK_DIGITS[(lower_digit + upper_digit + 1) // 2]
+
+    if upper is not None and len(upper) > 1:
+        return upper[0]
+
+    return RANK_DIGITS[lower_digit] + _midpoint(lower[1:], None)
@@ -0,0 +1,203 @@
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.block_json import JSON, encode_tree
+from utils.metrics import CACHE_ENTRIES, CACHE_EVICTIONS, CACHE_HITS, CACHE_MISSES
+
+
+# The full block tree of one workspace as of `version` (the workspace's
+# tree_version), in the shape BaseBlockRepository._build_tree returns.
+# Writes are replayed onto it by the patch methods below, which return
+# False when the change cannot be reproduced exactly; the snapshot is then
+# dropped and rebuilt on the next read.
+class TreeSnapshot:
+    def __init__(
+        self,
+        version: int,
+        roots: List[Dict[str, Any]],
+        root_keys: Dict[uuid.UUID, Tuple[datetime, uuid.UUID]]
+    ):
+        self.version = version
+        self.roots = roots
+        self.nodes: Dict[uuid.UUID, Dict[str, Any]] = {}
+        # Roots are ordered by creation time, which the nodes do not carry.
+        self._root_keys = root_keys
+        # Encoded roots per output format.
+        self._bodies: Dict[str, bytes] = {}
+
+        pending = list(roots)
+        while pending:
+            node = pending.pop()
+            self.nodes[node["id"]] = node
+            pending.extend(node["content"])
+
+    def body(self, output_format: str = JSON) -> bytes:
+        body = self._bodies.get(output_format)
+        if body is None:
+            body = self._bodies[output_format] = encode_tree(self.roots, output_format)
+        return body
+
+    def insert(self, block: Dict[str, Any], parent_id: Optional[uuid.UUID], position: int) -> bool:
+        if block["id"] in self.nodes:
+            return False
+
+        node = {
+            "id": block["id"],
+            "type": block["type"],
+            "properties": block["properties"],
+            "workspace_id": block["workspace_id"],
+            "parent_id": parent_id,
+            "position": 0,
+            "content": [],
+        }
+        if not self._attach(node, parent_id, position, block["created_at"]):
+            return False
+        self.nodes[node["id"]] = node
+        return True
+
+    def update(self, block: Dict[str, Any]) -> bool:
+        node = self.nodes.get(block["id"])
+        if node:
+            node["type"] = block["type"]
+            node["properties"] = block["properties"]
+            self._bodies.clear()
+        return True
+
+    def move(self, block_id: uuid.UUID, parent_id: uuid.UUID, position: int) -> bool:
+        node = self.nodes.get(block_id)
+        if not node or parent_id not in self.nodes:
+            return False
+
+        created_at = self._detach(node)
+        return self._attach(node, parent_id, position, created_at)
+
+    def delete(self, block_ids: List[uuid.UUID]) -> bool:
+        removed = set(block_ids)
+        for block_id in block_ids:
+            node = self.nodes.get(block_id)
+            if node and node["parent_id"] not in removed:
+                self._detach(node)
+        for block_id in block_ids:
+            self.nodes.pop(block_id, None)
+        self._bodies.clear()
+        return True
+
+    # For writes that are cheaper to reload than to replay.
+    def discard(self) -> bool:
+        return False
+
+    def _attach(
+        self, node: Dict[str, Any], parent_id: Optional[uuid.UUID], position: int, created_at: Optional[datetime]
+    ) -> bool:
+        node["parent_id"] = parent_id
+        self._bodies.clear()
+
+        if parent_id is None:
+            if created_at is None:
+                return False
+            key = (created_at, node["id"])
+            index = sum(1 for root in self.roots if self._root_keys[root["id"]] < key)
+            self.roots.insert(index, node)
+            self._root_keys[node["id"]] = key
+            node["position"] = 0
+            return True
+
+        parent = self.nodes.get(parent_id)
+        if not parent:
+            return False
+        siblings = parent["content"]
+        siblings.insert(min(position, len(siblings)), node)
+        self._renumber(siblings)
+        return True
+
+    def _detach(self, node: Dict[str, Any]) -> Optional[datetime]:
+        self._bodies.clear()
+        if node["parent_id"] is None:
+            self.roots.remove(node)
+            return self._root_keys.pop(node["id"])[0]
+
+        siblings = self.nodes[node["parent_id"]]["content"]
+        siblings.remove(node)
+        self._renumber(siblings)
+        return None
+
+    @staticmethod
+    def _renumber(siblings: List[Dict[str, Any]]) -> None:
+        for position, sibling in enumerate(siblings):
+            sibling["position"] = position
+
+
+TreePatch = Callable[[TreeSnapshot], bool]
+
+
+# Tree snapshots of the most recently read workspaces, bounded by their
+# total node count. Patches from a committed write apply only to the
+# snapshot one version behind it; a snapshot that missed a write (made by
+# another process, or committed out of order) is dropped instead.
+class TreeSnapshotCache:
+    def __init__(self, max_nodes: int):
+        self.max_nodes = max_nodes
+        self._snapshots: OrderedDict[uuid.UUID, TreeSnapshot] = OrderedDict()
+        self._sizes: Dict[uuid.UUID, int] = {}
+        self._nodes = 0
+        CACHE_ENTRIES.labels(cache="tree").set_function(lambda: len(self._snapshots))
+
+    def body(self, workspace_id: uuid.UUID, version: int, output_format: str = JSON) -> Optional[bytes]:
+        snapshot = self._snapshots.get(workspace_id)
+        if snapshot is None or snapshot.version != version:
+            CACHE_MISSES.labels(cache="tree").inc()
+            return None
+
+        self._snapshots.move_to_end(workspace_id)
+        CACHE_HITS.labels(cache="tree").inc()
+        return snapshot.body(output_format)
+
+    def put(self, workspace_id: uuid.UUID, snapshot: TreeSnapshot) -> None:
+        current = self._snapshots.get(workspace_id)
+        if current is not None and current.version >= snapshot.version:
+            return
+        if len(snapshot.nodes) > self.max_nodes or self.max_nodes <= 0:
+            return
+
+        self._store(workspace_id, snapshot)
+        while self._nodes > self.max_nodes:
+            self.discard(next(iter(self._snapshots)), reason="size")
+
+    def apply(self, workspace_id: uuid.UUID, version: int, patches: List[TreePatch]) -> None:
+        snapshot = self._snapshots.get(workspace_id)
+        if snapshot is None:
+            return
+
+        if snapshot.version != version - 1 or not all(patch(snapshot) for patch in patches):
+            self.discard(workspace_id, reason="stale")
+            return
+
+        snapshot.version = version
+        self._store(workspace_id, snapshot)
+        while self._nodes > self.max_nodes:
+            self.discard(next(iter(self._snapshots)), reason="size")
+
+    def discard(self, workspace_id: uuid.UUID, reason: str = "invalidated") -> None:
+        if self._snapshots.pop(workspace_id, None) is not None:
+            self._nodes -= self._sizes.pop(workspace_id)
+            CACHE_EVICTIONS.labels(cache="tree", reason=reason).inc()
+
+    # For writes committed elsewhere, which cannot be replayed here.
+    def discard_older(self, workspace_id: uuid.UUID, version: int) -> None:
+        snapshot = self._snapshots.get(workspace_id)
+        if snapshot is not None and snapshot.version < version:
+            self.discard(workspace_id, reason="stale")
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+        self._sizes.clear()
+        self._nodes = 0
+
+    def _store(self, workspace_id: uuid.UUID, snapshot: TreeSnapshot) -> None:
+        self._nodes -= self._sizes.get(workspace_id, 0)
+        self._snapshots[workspace_id] = snapshot
+        self._snapshots.move_to_end(workspace_id)
+        self._sizes[workspace_id] = len(snapshot.nodes)
+        self._nodes += len(snapshot.nodes)
@@ -0,0 +1,26 @@
+# Runs the plan regression check of benchmarks/query_plans.py at a smaller
+# size. Needs the server settings and a migrated database; skipped
+# when either is missing.
+import asyncio
+
+import environ
+import psycopg
+import pytest
+
+try:
+    import query_plans
+except environ.MissingEnvValueError as e:
+    pytest.skip(f"server settings missing: {e}", allow_module_level=True)
+
+
+@pytest.fixture(scope="module")
+def database():
+    try:
+        psycopg.connect(query_plans.conninfo(), connect_timeout=3).close()
+    except psycopg.OperationalError as e:
+        pytest.skip(f"no database reachable: {e}")
+
+
+def test_hot_queries_use_their_indexes(database):
+    failures = asyncio.run(query_plans.run(workspaces=500, blocks=100, fanout=4, verbose=True))
+    assert not failures